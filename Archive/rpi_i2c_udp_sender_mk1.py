@@ -2,8 +2,18 @@
 # SPDX-License-Identifier: MIT
 
 import time
+import os
+import gc
+import errno
+import sys
 import board
 import socket
+import ctypes
+import struct
+import argparse
+import queue
+import threading
+import numpy as np
 import adafruit_tca9548a
 import adafruit_tlv493d
 
@@ -14,6 +24,123 @@ NUM_SENSORS = 2           # Number of TLV493D sensors connected to the TCA9548A
                           # (Ensure they are on channels 0, 1, ..., NUM_SENSORS-1)
 SEND_FREQUENCY_HZ = 0     # Desired send frequency in Hz. 0 for max speed.
                           # If > 0, a delay will be introduced.
+SEND_BATCH = 64           # Max packets flushed per sendmmsg() syscall (Linux only).
+                          # The sender thread sends whatever is ready, so paced packets aren't held back.
+FRAME_POOL = 256          # Preallocated packet buffers shared by the polling loop and the sender thread
+PRODUCER_CPU = 2          # CPU core for sensor polling (main thread). The Pi has 4 cores (0-3).
+SENDER_CPU = 3            # CPU core for the UDP sender thread
+SCHED_FIFO_PRIORITY = 50  # Real-time priority for the polling loop when running as root (1-99)
+MAX_PAYLOAD = 1024        # Size of each preallocated payload slot in bytes
+SOCKET_SNDBUF = 12 * 1024 * 1024  # Requested SO_SNDBUF. The kernel caps this at net.core.wmem_max,
+                                  # so raise it first: sudo sysctl -w net.core.wmem_max=12582912
+SOCKET_TOS = 0xB8         # IP_TOS: DSCP EF (expedited forwarding)
+SOCKET_PRIORITY = 6       # SO_PRIORITY (Linux): highest priority without CAP_NET_ADMIN
+PATH_MTU_FALLBACK = 1500  # Assumed path MTU when the kernel can't report it (IP_MTU, Linux only)
+IPV4_UDP_OVERHEAD = 28    # 20-byte IPv4 header + 8-byte UDP header
+I2C_BUS = 1               # /dev/i2c-N used by the raw ioctl read path (board.I2C() is bus 1 on the Pi)
+USE_I2C_FASTPATH = True   # Read sensors with raw I2C_RDWR ioctls; falls back to the Blinka driver path
+USE_UDP_GSO = True        # Let the kernel split large sends into datagrams (UDP_SEGMENT, Linux >= 4.18)
+TLV_FAST_MODE = True      # Run the TLV493Ds in fast mode (continuous ~3.3 kHz conversions)
+SKIP_STALE_FRAMES = True  # Don't send a packet when no sensor's frame counter has advanced
+GC_COLLECT_EVERY = 10000  # Loop cycles between manual gc.collect() calls (automatic GC is off in the loop)
+
+parser = argparse.ArgumentParser(description="Stream TLV493D readings from a TCA9548A over UDP.")
+parser.add_argument("--text", action="store_true",
+                    help="Send the legacy newline-separated text format instead of binary packets (debugging).")
+args = parser.parse_args()
+
+# --- Cached TCA9548A Channel Select ---
+# The stock TCA9548A_Channel writes the channel mask on every try_lock() and 0x00 on every
+# unlock(). Sensors are read in a fixed order, so CachedTCA remembers the selected channel
+# and only writes the mux control register when it changes. Any bus error invalidates the
+# cache so the next transaction reselects. (Same helper as TestScripts/tca_utils.py.)
+# NOTE: a channel stays enabled after unlock(): only safe while every device is behind the mux.
+
+class CachedTCAChannel(adafruit_tca9548a.TCA9548A_Channel):
+    def __init__(self, tca, channel):
+        super().__init__(tca, channel)
+        self.channel = channel
+
+    def try_lock(self):
+        while not self.tca.i2c.try_lock():
+            time.sleep(0)
+        if self.tca._last_ch != self.channel:
+            try:
+                self.tca.i2c.writeto(self.tca.address, self.channel_switch)
+            except OSError:
+                self.tca._last_ch = None
+                self.tca.i2c.unlock()
+                raise
+            self.tca._last_ch = self.channel
+        return True
+
+    def unlock(self):
+        return self.tca.i2c.unlock()
+
+    def readfrom_into(self, address, buffer, **kwargs):
+        try:
+            return super().readfrom_into(address, buffer, **kwargs)
+        except OSError:
+            self.tca._last_ch = None
+            raise
+
+    def writeto(self, address, buffer, **kwargs):
+        try:
+            return super().writeto(address, buffer, **kwargs)
+        except OSError:
+            self.tca._last_ch = None
+            raise
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, **kwargs):
+        try:
+            return super().writeto_then_readfrom(address, buffer_out, buffer_in, **kwargs)
+        except OSError:
+            self.tca._last_ch = None
+            raise
+
+class CachedTCA(adafruit_tca9548a.TCA9548A):
+    def __init__(self, i2c, address=0x70):
+        super().__init__(i2c, address)
+        self._last_ch = None
+
+    def __getitem__(self, key):
+        if not 0 <= key <= 7:
+            raise IndexError("Channel must be an integer in the range: 0-7.")
+        if self.channels[key] is None:
+            self.channels[key] = CachedTCAChannel(self, key)
+        return self.channels[key]
+
+# --- Absolute-deadline pacing ---
+# Sleeping for "period - time spent" accumulates error every cycle. Instead the loop keeps an
+# absolute deadline on CLOCK_MONOTONIC (the clock behind time.monotonic_ns() on Linux) and
+# sleeps until it with clock_nanosleep(TIMER_ABSTIME), falling back to time.sleep elsewhere.
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+EINTR = 4
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_clock_nanosleep = None
+if sys.platform.startswith("linux"):
+    try:
+        _clock_nanosleep = ctypes.CDLL("libc.so.6", use_errno=True).clock_nanosleep
+        _clock_nanosleep.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+        _clock_nanosleep.restype = ctypes.c_int
+    except (OSError, AttributeError) as e:
+        print(f"clock_nanosleep unavailable ({e}), falling back to time.sleep().")
+_deadline_ts = _Timespec()
+
+def sleep_until_ns(deadline_ns):
+    """Sleep until the given time.monotonic_ns() timestamp."""
+    if _clock_nanosleep is not None:
+        _deadline_ts.tv_sec, _deadline_ts.tv_nsec = divmod(deadline_ns, 1_000_000_000)
+        while _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, _deadline_ts, None) == EINTR:
+            pass # Interrupted by a signal: the deadline is absolute, so just retry
+        return
+    remaining_ns = deadline_ns - time.monotonic_ns()
+    if remaining_ns > 0:
+        time.sleep(remaining_ns / 1e9)
 
 # --- Initialize I2C and Multiplexer ---
 try:
@@ -26,7 +153,7 @@ except RuntimeError as e:
     exit(1)
 
 try:
-    tca = adafruit_tca9548a.TCA9548A(i2c)
+    tca = CachedTCA(i2c)
 except ValueError as e:
     print(f"Error initializing TCA9548A multiplexer: {e}")
     print(f"Is the multiplexer connected and address correct (default 0x70)?")
@@ -34,6 +161,207 @@ except ValueError as e:
     exit(1)
 
 
+# --- Batched UDP sender (sendmmsg) ---
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+class BatchSender:
+    """Queue UDP payloads and flush them with one sendmmsg(2) call on Linux.
+    Falls back to one send() per payload on other platforms.
+    The socket must already be connect()ed: messages carry no destination address."""
+
+    def __init__(self, sock, batch=SEND_BATCH, slot_size=MAX_PAYLOAD):
+        self.sock = sock
+        self.batch = batch
+        self.count = 0
+        self.slots = [bytearray(slot_size) for _ in range(batch)]
+        self.lengths = [0] * batch
+        self.libc = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.libc = ctypes.CDLL("libc.so.6", use_errno=True)
+                self.libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+                self.libc.sendmmsg.restype = ctypes.c_int
+            except (OSError, AttributeError) as e:
+                print(f"sendmmsg unavailable ({e}), falling back to sendto().")
+                self.libc = None
+        if self.libc is None:
+            return
+
+        self.iovecs = (_IOVec * batch)()
+        self.msgs = (_MMsgHdr * batch)()
+        # Keep the ctypes views alive: they pin the slots so they can't be resized/moved
+        self.views = [(ctypes.c_char * slot_size).from_buffer(slot) for slot in self.slots]
+        for i, view in enumerate(self.views):
+            self.iovecs[i].iov_base = ctypes.addressof(view)
+            hdr = self.msgs[i].msg_hdr # msg_name stays NULL: the connected socket supplies the peer
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.fd = sock.fileno()
+
+    def queue(self, *payloads):
+        """Copy the payloads back to back into the next free slot (one datagram); flush when the ring is full."""
+        i = self.count
+        slot = self.slots[i]
+        n = 0
+        for payload in payloads:
+            m = len(payload)
+            slot[n:n + m] = payload
+            n += m
+        self.lengths[i] = n
+        self.count += 1
+        if self.count >= self.batch:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """Send all queued payloads. Returns the number of datagrams sent."""
+        n = self.count
+        if n == 0:
+            return 0
+        self.count = 0
+        if self.libc is None or n == 1:
+            for i in range(n):
+                self.sock.send(memoryview(self.slots[i])[:self.lengths[i]])
+            return n
+        for i in range(n):
+            self.iovecs[i].iov_len = self.lengths[i]
+        sent = self.libc.sendmmsg(self.fd, self.msgs, n, 0)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+# --- TLV493D raw readout ---
+TLV_READ_LEN = 7          # Bx, By, Bz high bytes, temp/frame/channel, Bx/By low, flags/Bz low, temp low
+TLV_UT_PER_LSB = 98.0     # 0.098 mT per LSB, same scaling as adafruit_tlv493d.magnetic (uT)
+
+def decode_tlv493d(raw, out):
+    """Decode N back-to-back 7-byte TLV493D register dumps into out[N, 3] (uT).
+    All sensors and axes are extracted in one set of NumPy ops."""
+    regs = np.frombuffer(raw, dtype=np.uint8).reshape(-1, TLV_READ_LEN).astype(np.int32)
+    counts = np.empty((regs.shape[0], 3), dtype=np.int32)
+    counts[:, 0] = (regs[:, 0] << 4) | (regs[:, 4] >> 4)
+    counts[:, 1] = (regs[:, 1] << 4) | (regs[:, 4] & 0x0F)
+    counts[:, 2] = (regs[:, 2] << 4) | (regs[:, 5] & 0x0F)
+    counts ^= 0x800   # Sign-extend the 12-bit two's complement values
+    counts -= 0x800
+    np.multiply(counts, TLV_UT_PER_LSB, out=out, casting="unsafe")
+
+def tlv493d_frame_counter(raw, index):
+    """Frame counter bits (register 3, bits 3:2) of sensor `index`; they advance on every new conversion."""
+    return (raw[index * TLV_READ_LEN + 3] >> 2) & 0x03
+
+def set_tlv493d_fast_mode(device):
+    """Put a TLV493D into fast mode (FAST=1, LOW=0, no interrupt) on its I2CDevice.
+    The driver leaves it in master-controlled mode. Factory bits from read registers 7-9 are
+    written back as the datasheet requires, with the parity bit recomputed."""
+    regs = bytearray(10)
+    cfg = bytearray(4)                    # Write register 0 is reserved: 0x00
+    with device as dev:
+        dev.readinto(regs)
+        cfg[1] = (regs[7] & 0x18) | 0x02  # MOD1: factory bits 4:3, FAST=1, LOW=0, INT=0, address bits 0
+        cfg[2] = regs[8]                  # Reserved: factory value
+        cfg[3] = regs[9] & 0x1F | 0x20    # MOD2: factory bits 4:0, parity test on, temperature on
+        if sum(bin(b).count("1") for b in cfg) % 2 == 0:
+            cfg[1] |= 0x80                # Odd parity over all 32 written bits
+        dev.write(cfg)
+
+# --- Raw I2C_RDWR read path (Linux i2c-dev) ---
+# Each Blinka read goes through busio -> I2CDevice -> TCA channel lock -> i2c-dev in Python. This path
+# issues the ioctls directly from preallocated ctypes structs.
+# Pipelining: the TCA9548A latches a new channel mask only at the next STOP, so one combined
+# I2C_RDWR transfer can carry [write mask of the NEXT sensor's channel, repeated start, read 7 bytes
+# from the CURRENT sensor] - the read still sees the current channel, and the transfer's STOP switches
+# the mux for the next read. Reads in order cost one ioctl and one START/STOP per sensor instead of two
+# (the select only needs a separate priming ioctl after an error or an out-of-order read). The write
+# is placed first because the Pi's bcm2835 I2C controller only accepts a read as the last message.
+# Timing at 400 kHz: select ~25 us + read ~180 us on the wire, well inside the ~300 us fast-mode
+# conversion cycle, so every sensor normally shows a new frame each loop.
+# io_uring doesn't help here: it has no generic ioctl op and i2c-dev doesn't implement uring_cmd,
+# and a READV on the i2c-dev fd can't select the mux. The UDP side is already one sendmmsg per batch.
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+
+class _I2CMsg(ctypes.Structure):
+    _fields_ = [("addr", ctypes.c_uint16), ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16), ("buf", ctypes.c_void_p)]
+
+class _I2CRdwrData(ctypes.Structure):
+    _fields_ = [("msgs", ctypes.POINTER(_I2CMsg)), ("nmsgs", ctypes.c_uint32)]
+
+class TLVFastReader:
+    """Read TLV493D register windows behind the TCA9548A with raw I2C_RDWR ioctls.
+    slots[i] (writable buffers of TLV_READ_LEN bytes) receive the sensor on mux channel channels[i]."""
+
+    def __init__(self, bus, mux_address, sensor_addresses, channels, slots):
+        self.libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        self.libc.ioctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_void_p]
+        self.libc.ioctl.restype = ctypes.c_int
+        self.fd = os.open(f"/dev/i2c-{bus}", os.O_RDWR)
+        self.channels = list(channels)
+        self.current = None # Mux channel last selected by this reader
+        n = len(self.channels)
+        self.masks = (ctypes.c_ubyte * n)(*[1 << ch for ch in self.channels])
+        self.select_msgs = (_I2CMsg * n)()
+        self.read_msgs = (_I2CMsg * n)()
+        self.select_data = (_I2CRdwrData * n)()
+        self.read_data = (_I2CRdwrData * n)()
+        self.pipe_msgs = (_I2CMsg * (2 * n))()
+        self.pipe_data = (_I2CRdwrData * n)()
+        self.next_channels = [self.channels[(i + 1) % n] for i in range(n)]
+        self.pipelined = len(set(self.channels)) > 1 # A single channel never needs reselecting
+        # Keep the ctypes views alive: they pin the slots so they can't be resized/moved
+        self.views = [(ctypes.c_char * TLV_READ_LEN).from_buffer(slot) for slot in slots]
+        for i in range(n):
+            sel = self.select_msgs[i]
+            sel.addr, sel.flags, sel.len = mux_address, 0, 1
+            sel.buf = ctypes.addressof(self.masks) + i
+            rd = self.read_msgs[i]
+            rd.addr, rd.flags, rd.len = sensor_addresses[i], I2C_M_RD, TLV_READ_LEN
+            rd.buf = ctypes.addressof(self.views[i])
+            self.select_data[i].msgs = ctypes.pointer(self.select_msgs[i])
+            self.select_data[i].nmsgs = 1
+            self.read_data[i].msgs = ctypes.pointer(self.read_msgs[i])
+            self.read_data[i].nmsgs = 1
+        for i in range(n):
+            # [select channel of sensor i+1, read sensor i]: the select takes effect at this transfer's STOP
+            self.pipe_msgs[2 * i] = self.select_msgs[(i + 1) % n]
+            self.pipe_msgs[2 * i + 1] = self.read_msgs[i]
+            self.pipe_data[i].msgs = ctypes.cast(ctypes.byref(self.pipe_msgs, 2 * i * ctypes.sizeof(_I2CMsg)),
+                                                 ctypes.POINTER(_I2CMsg))
+            self.pipe_data[i].nmsgs = 2
+
+    def _ioctl(self, data):
+        if self.libc.ioctl(self.fd, I2C_RDWR, ctypes.addressof(data)) < 0:
+            self.current = None # Mux state unknown after a bus error: reselect next time
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def read(self, i):
+        """Fill slot i with the current register window of sensor i."""
+        ch = self.channels[i]
+        if self.current != ch:
+            self._ioctl(self.select_data[i]) # Prime: first read, after an error or out of order
+            self.current = ch
+        if self.pipelined:
+            self._ioctl(self.pipe_data[i])
+            self.current = self.next_channels[i]
+        else:
+            self._ioctl(self.read_data[i])
+
+    def close(self):
+        os.close(self.fd)
+
 # --- Initialize Sensors ---
 sensors = []
 print(f"Attempting to initialize {NUM_SENSORS} TLV493D sensor(s)...")
@@ -42,6 +370,8 @@ for i in range(NUM_SENSORS):
         print(f"  Initializing sensor on TCA channel {i}...")
         # Each tca[i] is an I2C-like object for that specific channel
         sensor_on_channel = adafruit_tlv493d.TLV493D(tca[i])
+        if TLV_FAST_MODE:
+            set_tlv493d_fast_mode(sensor_on_channel.i2c_device)
         sensors.append(sensor_on_channel)
         print(f"  Sensor {i} initialized successfully on channel {i}.")
         # Test read
@@ -63,27 +393,194 @@ if not sensors:
 
 print(f"\nSuccessfully initialized {len(sensors)} out of {NUM_SENSORS} configured sensors.")
 
+# --- Binary Packet Layout ---
+# Little-endian: uint8 sequence number, uint8 sensor count, then float32 x, y, z per sensor.
+# The receiver reads the count byte to know how many floats follow (see TestScripts/PC_TestRx.py).
+PKT = struct.Struct(f"<BB{len(sensors) * 3}f")
+PKT_HEADER = struct.Struct("<BB")
+_buf = bytearray(PKT.size)
+# The float section of the packet, viewed as [sensor, axis]: decode_tlv493d() writes into it directly
+mag_values = np.frombuffer(_buf, dtype="<f4", offset=PKT_HEADER.size).reshape(len(sensors), 3)
+seq = 0
+
+# One 7-byte register window per sensor, read straight from each sensor's I2CDevice.
+# This replaces the driver's 10-byte read + per-axis Python unpacking in sensor.magnetic.
+_raw = bytearray(TLV_READ_LEN * len(sensors))
+_raw_slots = [memoryview(_raw)[i * TLV_READ_LEN:(i + 1) * TLV_READ_LEN] for i in range(len(sensors))]
+_sensor_devices = [sensor.i2c_device for sensor in sensors]
+
+fast_reader = None
+if USE_I2C_FASTPATH and sys.platform.startswith("linux"):
+    try:
+        # Sensors are assumed to sit on channels 0..N-1 (see the note in the main loop)
+        fast_reader = TLVFastReader(I2C_BUS, tca.address, [d.device_address for d in _sensor_devices],
+                                    range(len(sensors)), _raw_slots)
+        tca._last_ch = None # The fast path writes the mux behind CachedTCA's back
+        print(f"Reading sensors with raw I2C_RDWR ioctls on /dev/i2c-{I2C_BUS}.")
+    except (OSError, AttributeError) as e:
+        print(f"Raw I2C read path unavailable ({e}), using the adafruit driver path.")
+        fast_reader = None
+
 # --- Initialize UDP Socket ---
 udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+try:
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+    udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, SOCKET_TOS)
+    if hasattr(socket, "SO_PRIORITY"):
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, SOCKET_PRIORITY)
+except OSError as e:
+    print(f"Warning: could not apply UDP socket options: {e}")
+sndbuf = udp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+if sndbuf < SOCKET_SNDBUF:
+    print(f"Warning: SO_SNDBUF is {sndbuf} bytes (requested {SOCKET_SNDBUF}). Raise net.core.wmem_max.")
+# The destination never changes: connect once so the kernel caches the route
+# instead of resolving and validating the address on every send
+udp_socket.connect((HOST_IP, HOST_PORT))
+
+# --- Datagram sizing ---
+# Several binary frames are packed back to back into one datagram when the sender thread has a
+# backlog (each frame carries its own count byte, so the receiver just walks the buffer).
+# IP_PMTUDISC_DO sets DF: a datagram that doesn't fit the path MTU fails with EMSGSIZE instead of
+# being silently fragmented, and each datagram is sized to stay within one Ethernet frame.
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10) # Linux values, not exported on every Python build
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+path_mtu = PATH_MTU_FALLBACK
+if sys.platform.startswith("linux"):
+    try:
+        udp_socket.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        path_mtu = udp_socket.getsockopt(socket.IPPROTO_IP, IP_MTU) # Valid once connected
+    except OSError as e:
+        print(f"Warning: could not enable path MTU discovery: {e}. Assuming MTU {path_mtu}.")
+MAX_DATAGRAM = path_mtu - IPV4_UDP_OVERHEAD
+FRAMES_PER_DATAGRAM = 1 if args.text else max(1, MAX_DATAGRAM // PKT.size) # Text payloads aren't self-delimiting
+print(f"Path MTU {path_mtu}: up to {FRAMES_PER_DATAGRAM} frame(s) of {PKT.size} bytes per datagram.")
+
+# --- UDP GSO (UDP_SEGMENT) ---
+# With UDP_SEGMENT set on the socket, a send larger than the segment size is passed down the stack
+# as one buffer and split into segment-size datagrams late (or by the NIC), instead of building one
+# socket buffer per datagram. Sends up to the segment size go out unchanged, so the receiver sees
+# the same datagrams either way. Binary frames only: segmentation needs fixed-size records.
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GSO_MAX_SEGMENTS = 64 # Kernel limit per send
+UDP_MAX_SEND = 65507      # Largest UDP payload the kernel accepts in one send
+segment_size = FRAMES_PER_DATAGRAM * PKT.size
+frames_per_send = FRAMES_PER_DATAGRAM
+if USE_UDP_GSO and not args.text and sys.platform.startswith("linux"):
+    try:
+        udp_socket.setsockopt(SOL_UDP, UDP_SEGMENT, segment_size)
+        frames_per_send = FRAMES_PER_DATAGRAM * min(UDP_GSO_MAX_SEGMENTS, UDP_MAX_SEND // segment_size)
+        print(f"UDP GSO enabled: up to {frames_per_send // FRAMES_PER_DATAGRAM} datagrams per send.")
+    except OSError as e:
+        print(f"UDP GSO unavailable ({e}), sending one datagram per sendmmsg() entry.")
+sender = BatchSender(udp_socket, slot_size=max(MAX_PAYLOAD, frames_per_send * PKT.size))
+
+def disable_gso():
+    """Fall back to one datagram per send, e.g. when the interface can't checksum-offload GSO sends."""
+    global frames_per_send
+    udp_socket.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+    frames_per_send = FRAMES_PER_DATAGRAM
 print(f"Sending UDP data to {HOST_IP}:{HOST_PORT}")
 
+# --- UDP Sender Thread ---
+# Sensor polling (main thread) and UDP transmission overlap: the main loop packs each cycle into a
+# buffer taken from a preallocated pool, the sender thread drains the ready frames, packs up to
+# FRAMES_PER_DATAGRAM per datagram and up to SEND_BATCH datagrams per sendmmsg() call, then hands the
+# buffers back. I2C reads and sendmmsg() both release the GIL.
+_free_frames = queue.SimpleQueue()
+for _ in range(FRAME_POOL):
+    _free_frames.put(bytearray(PKT.size))
+_ready_frames = queue.SimpleQueue()
+_stop_sender = threading.Event()
+dropped_frames = 0
+
+def pin_current_thread(cpu):
+    """Pin the calling thread to one CPU core (Linux only, best effort)."""
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError as e:
+            print(f"Warning: could not pin {threading.current_thread().name} to CPU {cpu}: {e}")
+
+def send_frames(batch):
+    for start in range(0, len(batch), frames_per_send):
+        sender.queue(*batch[start:start + frames_per_send]) # Copies into the sendmmsg slots
+    sender.flush()
+
+def udp_sender_loop():
+    pin_current_thread(SENDER_CPU)
+    while True:
+        try:
+            frame = _ready_frames.get(timeout=0.1)
+        except queue.Empty:
+            if _stop_sender.is_set():
+                break # Stop requested and everything queued has been sent
+            continue
+        batch = [frame]
+        while len(batch) < SEND_BATCH * FRAMES_PER_DATAGRAM:
+            try:
+                batch.append(_ready_frames.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            send_frames(batch)
+        except OSError as e:
+            if e.errno == errno.EIO and frames_per_send > FRAMES_PER_DATAGRAM:
+                print(f"UDP GSO send failed ({e}), disabling GSO.")
+                try:
+                    disable_gso()
+                    send_frames(batch)
+                except OSError as e:
+                    print(f"Error sending UDP batch: {e}")
+            else:
+                print(f"Error sending UDP batch: {e}")
+        for frame in batch:
+            if isinstance(frame, bytearray): # Text-mode payloads are plain bytes, not pool buffers
+                _free_frames.put(frame)
+
+sender_thread = threading.Thread(target=udp_sender_loop, name="UdpSenderThread", daemon=True)
+sender_thread.start()
+pin_current_thread(PRODUCER_CPU)
+
+# Real-time scheduling for the polling loop so it gets the CPU back right at each deadline
+if hasattr(os, "sched_setscheduler") and os.geteuid() == 0:
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(SCHED_FIFO_PRIORITY))
+        print(f"Polling loop running with SCHED_FIFO priority {SCHED_FIFO_PRIORITY}.")
+    except OSError as e:
+        print(f"Warning: could not enable SCHED_FIFO: {e}")
+
 # --- Calculate delay for target frequency ---
 if SEND_FREQUENCY_HZ > 0:
     desired_delay_s = 1.0 / SEND_FREQUENCY_HZ
 else:
     desired_delay_s = 0 # Max speed
+period_ns = int(desired_delay_s * 1e9)
 
 # --- Main Loop ---
 packet_count = 0
+cycle_count = 0
+stale_cycles = 0
+_last_frames = [-1] * len(sensors) # Last frame counter seen per sensor
 start_time = time.monotonic()
+next_deadline_ns = time.monotonic_ns()
+
+# The binary loop body works on preallocated buffers only, so the cyclic collector has nothing to
+# reclaim but would still pause the loop at random. Freeze everything built during setup and run
+# collections manually every GC_COLLECT_EVERY cycles instead.
+gc.collect()
+gc.freeze()
+gc.disable()
 
 try:
     while True:
         loop_start_time = time.monotonic()
+        cycle_count += 1
+        if cycle_count % GC_COLLECT_EVERY == 0:
+            gc.collect()
         
-        message_parts = [] # To build the consolidated UDP message
-
-        for i, sensor in enumerate(sensors):
+        for i, device in enumerate(_sensor_devices):
             try:
                 # The sensor object 'sensor' was initialized with tca[original_channel_index]
                 # If sensors were skipped during init, 'i' here is the index in the 'sensors' list,
@@ -93,57 +590,90 @@ try:
                 # A better approach would be to store (channel_idx, sensor_obj) tuples if skipping is common.
                 # For now, we assume `sensors[i]` corresponds to `tca[i]` conceptually.
 
-                mag_x, mag_y, mag_z = sensor.magnetic
-
-                # Add data for this sensor to our message list
-                # Using a unique name for each data point makes parsing easy in TouchDesigner
-                message_parts.append(f"sensor{i}_x {mag_x:.3f}") # sensor ID corresponds to its index in the list
-                message_parts.append(f"sensor{i}_y {mag_y:.3f}")
-                message_parts.append(f"sensor{i}_z {mag_z:.3f}")
+                # Single read transaction, no separate status poll: staleness is visible
+                # in the frame counter bits (see tlv493d_frame_counter).
+                if fast_reader is not None:
+                    fast_reader.read(i)
+                else:
+                    with device as dev:
+                        dev.readinto(_raw_slots[i])
 
             except OSError as e:
                 print(f"Error reading sensor {i}: {e}. I2C communication issue?")
-                # Optionally, send placeholder values or skip this sensor for this cycle
-                message_parts.append(f"sensor{i}_x 0.0")
-                message_parts.append(f"sensor{i}_y 0.0")
-                message_parts.append(f"sensor{i}_z 0.0")
+                # All-zero registers decode to 0.0 on every axis for this cycle
+                _raw_slots[i][:] = bytes(TLV_READ_LEN)
             except Exception as e:
                 print(f"Unexpected error reading sensor {i}: {e}")
-                message_parts.append(f"sensor{i}_x 0.0")
-                message_parts.append(f"sensor{i}_y 0.0")
-                message_parts.append(f"sensor{i}_z 0.0")
+                _raw_slots[i][:] = bytes(TLV_READ_LEN)
+
+        fresh = True
+        if SKIP_STALE_FRAMES:
+            # A sensor's frame counter only advances on a new conversion: unchanged on every
+            # sensor means this cycle would resend the previous packet
+            fresh = False
+            for i in range(len(_last_frames)):
+                frame_counter = tlv493d_frame_counter(_raw, i)
+                if frame_counter != _last_frames[i]:
+                    _last_frames[i] = frame_counter
+                    fresh = True
 
+        if not fresh:
+            udp_payload = None
+            stale_cycles += 1
+        elif args.text:
+            decode_tlv493d(_raw, mag_values)
+            # Legacy format: one "sensor{i}_{axis} value" line per axis
+            udp_payload = "\n".join(
+                f"sensor{i // 3}_{'xyz'[i % 3]} {value:.3f}" for i, value in enumerate(mag_values.flat)
+            ).encode('utf-8')
+        else:
+            decode_tlv493d(_raw, mag_values)
+            PKT_HEADER.pack_into(_buf, 0, seq, len(sensors))
+            seq = (seq + 1) & 0xFF
+            try:
+                udp_payload = _free_frames.get_nowait()
+                udp_payload[:] = _buf
+            except queue.Empty:
+                udp_payload = None # Sender can't keep up: drop this frame rather than block polling
+                dropped_frames += 1
 
-        if message_parts:
-            # Join all parts into a single string, separated by newlines
-            udp_payload = "\n".join(message_parts)
-            udp_socket.sendto(udp_payload.encode('utf-8'), (HOST_IP, HOST_PORT))
+        if udp_payload is not None:
+            _ready_frames.put(udp_payload)
             packet_count += 1
 
         # Calculate time taken for this loop iteration
         loop_time_taken = time.monotonic() - loop_start_time
         
         # Optional: Control send frequency
-        if desired_delay_s > 0:
-            sleep_duration = desired_delay_s - loop_time_taken
-            if sleep_duration > 0:
-                time.sleep(sleep_duration)
+        if period_ns > 0:
+            next_deadline_ns += period_ns
+            now_ns = time.monotonic_ns()
+            if next_deadline_ns < now_ns - period_ns:
+                next_deadline_ns = now_ns # More than a full period late: skip missed ticks instead of bursting
+            sleep_until_ns(next_deadline_ns)
         # elif desired_delay_s == 0 and loop_time_taken < 0.0001: # If running very fast, yield a tiny bit
             # time.sleep(0) # Yield thread, effectively ~1us or more depending on OS
 
         # Print performance stats occasionally (e.g., every 100 packets or every few seconds)
-        if packet_count % 100 == 0 and packet_count > 0:
+        if udp_payload is not None and packet_count % 100 == 0:
             current_run_time = time.monotonic() - start_time
             if current_run_time > 0:
                 actual_freq = packet_count / current_run_time
-                print(f"Sent {packet_count} packets. Avg Freq: {actual_freq:.2f} Hz. Last loop: {loop_time_taken*1000:.2f} ms")
+                print(f"Sent {packet_count} packets. Avg Freq: {actual_freq:.2f} Hz. Last loop: {loop_time_taken*1000:.2f} ms. Dropped: {dropped_frames}. Stale: {stale_cycles}")
 
 
 except KeyboardInterrupt:
     print("\nProgram interrupted by user. Exiting.")
 finally:
-    print("Closing UDP socket.")
+    gc.enable()
+    print("Flushing queued packets and closing UDP socket.")
+    _stop_sender.set()
+    sender_thread.join(timeout=2.0)
+    if sender_thread.is_alive():
+        print("Warning: UDP sender thread did not finish flushing.")
     udp_socket.close()
+    if fast_reader is not None:
+        fast_reader.close()
     current_run_time = time.monotonic() - start_time
     if current_run_time > 0 and packet_count > 0:
         actual_freq = packet_count / current_run_time
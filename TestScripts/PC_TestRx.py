@@ -1,14 +1,175 @@
 # Run this on your PC (TouchDesigner machine)
+import os
+import sys
 import socket
+import struct
+import json
+import ctypes
+import argparse
 
 UDP_IP = "0.0.0.0"  # Listen on all available interfaces
 UDP_PORT = 8000
+SOCKET_RCVBUF = 12 * 1024 * 1024  # On Linux the kernel caps this at net.core.rmem_max,
+                                  # so raise it first: sudo sysctl -w net.core.rmem_max=12582912
+SOCKET_TOS = 0xB8                 # IP_TOS: DSCP EF (expedited forwarding)
+RX_BATCH = 64                     # Max datagrams per recvmmsg() call (Linux)
+RX_BUF_SIZE = 9000                # Up to one jumbo-frame MTU per preallocated receive buffer
+
+# Binary packet header sent by rpi_i2c_udp_sender_mk1.py: uint8 sequence, uint8 sensor count,
+# followed by count * 3 little-endian float32 values (x, y, z per sensor).
+# One datagram may carry several of these frames back to back (sized to the path MTU).
+PKT_HEADER = struct.Struct("<BB")
+
+# Binary frame sent by the tamaki senders (PayloadFormat = binary): big-endian uint8 version,
+# uint8 flags, uint8 sensor count, [float64 monotonic timestamp "t" when flag bit 0 is set (root
+# sender with SamplesPerPacket > 1)], then count * 3 float32 values (x, y, z per sensor).
+# The sensor IDs are not on the wire: release_mk2 sends them once in a JSON hello packet,
+# {"hello": {"format": "binary", "version": 1, "sensors": [...]}}, before the first frame.
+TAMAKI_HEADER = struct.Struct("!BBB")
+TAMAKI_VERSION = 1
+TAMAKI_FLAG_TIMESTAMP = 0x01
+TAMAKI_TIMESTAMP = struct.Struct("!d")
+
+parser = argparse.ArgumentParser(description="Print UDP packets from the Pi sensor sender.")
+parser.add_argument("--text", action="store_true",
+                    help="Expect the legacy text format instead of binary packets.")
+parser.add_argument("--format", choices=("mk1", "tamaki"), default="mk1",
+                    help="Binary layout: mk1 (Archive/rpi_i2c_udp_sender_mk1.py, little-endian) or "
+                         "tamaki (tamaki_udp_sender.py / release_mk2 PayloadFormat = binary, big-endian).")
+args = parser.parse_args()
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+try:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, SOCKET_TOS)
+except OSError as e:
+    print(f"Warning: could not apply UDP socket options: {e}")
 sock.bind((UDP_IP, UDP_PORT))
 
+# --- Receive Buffers ---
+# A fixed pool of buffers is reused for every packet; nothing is allocated per datagram.
+bufs = [bytearray(RX_BUF_SIZE) for _ in range(RX_BATCH)]
+views = [memoryview(b) for b in bufs]
+lengths = [0] * RX_BATCH
+senders = [None] * RX_BATCH
+
+# --- Batched receive (Linux recvmmsg) ---
+MSG_WAITFORONE = 0x10000 # Block for the first datagram, then return whatever else is queued
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+SOCKADDR_IN_SIZE = 16
+_recvmmsg = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        _recvmmsg = _libc.recvmmsg
+        _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        _recvmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError) as e:
+        print(f"recvmmsg unavailable ({e}), falling back to recv_into().")
+        _recvmmsg = None
+
+if _recvmmsg is not None:
+    _iovecs = (_IOVec * RX_BATCH)()
+    _msgs = (_MMsgHdr * RX_BATCH)()
+    _names = (ctypes.c_ubyte * (SOCKADDR_IN_SIZE * RX_BATCH))()
+    _buf_refs = [(ctypes.c_char * RX_BUF_SIZE).from_buffer(b) for b in bufs] # Pins the bytearrays
+    for i in range(RX_BATCH):
+        _iovecs[i].iov_base = ctypes.addressof(_buf_refs[i])
+        _iovecs[i].iov_len = RX_BUF_SIZE
+        _msgs[i].msg_hdr.msg_iov = ctypes.pointer(_iovecs[i])
+        _msgs[i].msg_hdr.msg_iovlen = 1
+        _msgs[i].msg_hdr.msg_name = ctypes.addressof(_names) + i * SOCKADDR_IN_SIZE
+    _fd = sock.fileno()
+
+def receive_batch():
+    """Fill bufs/lengths/senders with the next datagrams and return how many arrived."""
+    if _recvmmsg is None:
+        # Windows/macOS: one datagram per call, still into a reused buffer
+        lengths[0], senders[0] = sock.recvfrom_into(bufs[0])
+        return 1
+    for i in range(RX_BATCH):
+        _msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE # The kernel overwrites this on every receive
+    n = _recvmmsg(_fd, _msgs, RX_BATCH, MSG_WAITFORONE, None)
+    if n < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    for i in range(n):
+        lengths[i] = _msgs[i].msg_len
+        name = bytes(_names[i * SOCKADDR_IN_SIZE:(i + 1) * SOCKADDR_IN_SIZE])
+        senders[i] = (socket.inet_ntoa(name[4:8]), int.from_bytes(name[2:4], "big"))
+    return n
+
+# Sensor ID tables from hello packets, per sender address
+sensor_ids = {}
+
+def print_tamaki_packet(data, addr):
+    if data[:1] == b"{":
+        # JSON: the hello packet (sensor ID table), or a sender left on PayloadFormat = json
+        try:
+            message = json.loads(bytes(data))
+        except ValueError:
+            print(f"Received invalid JSON from {addr}")
+            return
+        hello = message.get("hello") if isinstance(message, dict) else None
+        if hello is None:
+            print(f"Received message from {addr}: {bytes(data).decode('utf-8')}")
+            return
+        sensor_ids[addr] = hello.get("sensors", [])
+        print(f"Hello from {addr}: format {hello.get('format')}, version {hello.get('version')}, sensors {sensor_ids[addr]}")
+        return
+    ids = sensor_ids.get(addr, ())
+    offset = 0
+    while offset + TAMAKI_HEADER.size <= len(data):
+        version, flags, count = TAMAKI_HEADER.unpack_from(data, offset)
+        if version != TAMAKI_VERSION or flags & ~TAMAKI_FLAG_TIMESTAMP:
+            print(f"Unsupported frame from {addr}: version {version}, flags {flags:#04x}")
+            return
+        offset += TAMAKI_HEADER.size
+        stamp = ""
+        if flags & TAMAKI_FLAG_TIMESTAMP:
+            stamp = f" t={TAMAKI_TIMESTAMP.unpack_from(data, offset)[0]:.6f}"
+            offset += TAMAKI_TIMESTAMP.size
+        values = struct.unpack_from(f"!{count * 3}f", data, offset)
+        offset += count * 12
+        readings = ", ".join(
+            f"{ids[i] if i < len(ids) else f'sensor{i}'}=({values[3*i]:.3f}, {values[3*i+1]:.3f}, {values[3*i+2]:.3f})"
+            for i in range(count)
+        )
+        print(f"Received frame from {addr}:{stamp} {readings}")
+
+def print_packet(data, addr):
+    if args.text:
+        print(f"Received message from {addr}: {bytes(data).decode('utf-8')}")
+        return
+    if args.format == "tamaki":
+        print_tamaki_packet(data, addr)
+        return
+    offset = 0
+    while offset + PKT_HEADER.size <= len(data):
+        seq, count = PKT_HEADER.unpack_from(data, offset)
+        offset += PKT_HEADER.size
+        values = struct.unpack_from(f"<{count * 3}f", data, offset)
+        offset += count * 12
+        readings = ", ".join(
+            f"sensor{i}=({values[3*i]:.3f}, {values[3*i+1]:.3f}, {values[3*i+2]:.3f})" for i in range(count)
+        )
+        print(f"Received packet #{seq} from {addr}: {readings}")
+
 print(f"Listening for UDP packets on port {UDP_PORT}...")
 
 while True:
-    data, addr = sock.recvfrom(1024) # buffer size is 1024 bytes
-    print(f"Received message from {addr}: {data.decode('utf-8')}")
+    n = receive_batch()
+    for i in range(n):
+        print_packet(views[i][:lengths[i]], senders[i])
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2025 Olivier Jean for Artifical Imagination
+# SPDX-License-Identifier: MIT
+
+# MicroPython sender for a Raspberry Pi Pico W (RP2040): polls the TLV493D sensors behind the
+# TCA9548A and streams them to TouchDesigner over Wi-Fi, without Linux scheduling jitter.
+# Copy to the Pico as main.py. Packets use the same binary layout as Archive/rpi_i2c_udp_sender_mk1.py
+# (uint8 sequence, uint8 sensor count, float32 x, y, z per sensor), so PC_TestRx.py reads them as is.
+# Change the destination at runtime over USB serial by sending a line: "HOST 192.168.1.101 8000"
+# Wi-Fi credentials live in wifi_secrets.py next to main.py (not committed): copy
+# wifi_secrets.example.py, fill in WIFI_SSID / WIFI_PASSWORD and upload both files.
+#
+# Scope: the Pico replaces the Pi in the sensor path (sensors -> Pico -> Wi-Fi -> PC) instead of acting
+# as an I2C coprocessor feeding the Pi. One loop on core0 with the hardware I2C peripheral at 1 MHz,
+# no PIO bit-banged I2C, DMA ring or core1 sender: the RP2040 has no OS scheduler to get around, and at
+# a couple of sensors the reads fit well inside the send period. Prototype, not yet run on hardware.
+
+import sys
+import time
+import struct
+import select
+import socket
+import network
+from machine import I2C, Pin
+
+try:
+    from wifi_secrets import WIFI_SSID, WIFI_PASSWORD
+except ImportError:
+    print("Missing wifi_secrets.py: copy wifi_secrets.example.py, set WIFI_SSID / WIFI_PASSWORD and upload it.")
+    raise
+
+# --- Configuration ---
+HOST_IP = "192.168.1.101"  # IP address of the PC running TouchDesigner
+HOST_PORT = 8000          # Port TouchDesigner is listening on
+NUM_SENSORS = 2           # Sensors on TCA channels 0..NUM_SENSORS-1
+SEND_FREQUENCY_HZ = 200   # 0 for max speed
+I2C_FREQ = 1_000_000      # TLV493D and TCA9548A both support Fast-mode Plus
+I2C_SDA = 4               # GP4 / GP5: I2C0 on the Pico W header
+I2C_SCL = 5
+TCA_ADDRESS = 0x70
+TLV_ADDRESS = 0x5E
+TLV_READ_LEN = 7
+TLV_UT_PER_LSB = 98.0
+
+# --- Wi-Fi ---
+wlan = network.WLAN(network.STA_IF)
+wlan.active(True)
+wlan.config(pm=0xa11140) # Disable Wi-Fi power saving: it adds tens of ms of latency
+wlan.connect(WIFI_SSID, WIFI_PASSWORD)
+while not wlan.isconnected():
+    print("Waiting for Wi-Fi...")
+    time.sleep(0.5)
+print(f"Connected: {wlan.ifconfig()[0]}")
+
+# --- I2C ---
+i2c = I2C(0, sda=Pin(I2C_SDA), scl=Pin(I2C_SCL), freq=I2C_FREQ)
+_masks = [bytes([1 << ch]) for ch in range(NUM_SENSORS)]
+_raw = bytearray(TLV_READ_LEN)
+
+def read_xyz(channel):
+    """Select the channel and read one TLV493D register window. Returns (x, y, z) in uT."""
+    i2c.writeto(TCA_ADDRESS, _masks[channel])
+    i2c.readfrom_into(TLV_ADDRESS, _raw)
+    x = (_raw[0] << 4) | (_raw[4] >> 4)
+    y = (_raw[1] << 4) | (_raw[4] & 0x0F)
+    z = (_raw[2] << 4) | (_raw[5] & 0x0F)
+    # Sign-extend the 12-bit two's complement values
+    return (((x ^ 0x800) - 0x800) * TLV_UT_PER_LSB,
+            ((y ^ 0x800) - 0x800) * TLV_UT_PER_LSB,
+            ((z ^ 0x800) - 0x800) * TLV_UT_PER_LSB)
+
+def init_sensor(channel):
+    """Switch the TLV493D out of power-down into fast mode, keeping its factory bits."""
+    i2c.writeto(TCA_ADDRESS, _masks[channel])
+    regs = bytearray(10)
+    i2c.readfrom_into(TLV_ADDRESS, regs)
+    cfg = bytearray(4)                   # Write register 0 is reserved: 0x00
+    cfg[1] = (regs[7] & 0x18) | 0x02     # MOD1: factory bits 4:3, FAST=1, LOW=0, INT=0
+    cfg[2] = regs[8]                     # Reserved: copy factory value
+    cfg[3] = regs[9] & 0x1F | 0x20       # MOD2: factory bits 4:0, parity test on (PT, bit 5), temperature on (T=0)
+    if sum(bin(b).count("1") for b in cfg) % 2 == 0:
+        cfg[1] |= 0x80                   # Parity bit: odd parity over all written bits
+    i2c.writeto(TLV_ADDRESS, cfg)
+
+for ch in range(NUM_SENSORS):
+    try:
+        init_sensor(ch)
+        print(f"Sensor on channel {ch} initialized.")
+    except OSError as e:
+        print(f"Error initializing sensor on channel {ch}: {e}")
+
+# --- UDP ---
+PKT_FMT = f"<BB{NUM_SENSORS * 3}f" # MicroPython's struct has no Struct class: pass the format each call
+_buf = bytearray(struct.calcsize(PKT_FMT))
+_values = [0.0] * (NUM_SENSORS * 3)
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+dest = socket.getaddrinfo(HOST_IP, HOST_PORT)[0][-1]
+print(f"Sending UDP data to {HOST_IP}:{HOST_PORT}")
+
+# --- USB serial config ---
+_stdin = select.poll()
+_stdin.register(sys.stdin, select.POLLIN)
+
+def poll_config():
+    global dest
+    if not _stdin.poll(0):
+        return
+    parts = sys.stdin.readline().split()
+    if len(parts) == 3 and parts[0] == "HOST":
+        try:
+            dest = socket.getaddrinfo(parts[1], int(parts[2]))[0][-1]
+            print(f"Sending UDP data to {parts[1]}:{parts[2]}")
+        except (OSError, ValueError) as e:
+            print(f"Invalid HOST command: {e}")
+
+# --- Main Loop ---
+period_us = 1_000_000 // SEND_FREQUENCY_HZ if SEND_FREQUENCY_HZ > 0 else 0
+next_deadline = time.ticks_us()
+seq = 0
+while True:
+    for ch in range(NUM_SENSORS):
+        try:
+            _values[3 * ch], _values[3 * ch + 1], _values[3 * ch + 2] = read_xyz(ch)
+        except OSError:
+            _values[3 * ch] = _values[3 * ch + 1] = _values[3 * ch + 2] = 0.0
+    struct.pack_into(PKT_FMT, _buf, 0, seq, NUM_SENSORS, *_values)
+    seq = (seq + 1) & 0xFF
+    try:
+        sock.sendto(_buf, dest)
+    except OSError as e:
+        print(f"Error sending UDP packet: {e}")
+    poll_config()
+
+    if period_us:
+        next_deadline = time.ticks_add(next_deadline, period_us)
+        remaining = time.ticks_diff(next_deadline, time.ticks_us())
+        if remaining > 0:
+            time.sleep_us(remaining)
+        elif remaining < -period_us:
+            next_deadline = time.ticks_us() # More than a full period late: skip missed ticks
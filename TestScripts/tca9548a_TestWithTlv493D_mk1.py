@@ -6,15 +6,16 @@
 import time
 import board
 #import adafruit_tsl2591
-import adafruit_tca9548a
 import adafruit_tlv493d
+from tca_utils import CachedTCA
 
 # Create I2C bus as normal
 i2c = board.I2C()  # uses board.SCL and board.SDA
 # i2c = board.STEMMA_I2C()  # For using the built-in STEMMA QT connector on a microcontroller
 
 # Create the TCA9548A object and give it the I2C bus
-tca = adafruit_tca9548a.TCA9548A(i2c)
+# CachedTCA only rewrites the mux control register when the channel changes
+tca = CachedTCA(i2c)
 
 # For each sensor, create it using the TCA9548A channel instead of the I2C object
 tlv1 = adafruit_tlv493d.TLV493D(tca[0])
@@ -0,0 +1,212 @@
+# SPDX-FileCopyrightText: 2025 Olivier Jean for Artifical Imagination
+# SPDX-License-Identifier: MIT
+
+# Shared TCA9548A helpers for the test scripts.
+# Usage: from tca_utils import get_tca, safe_scan ; tca = get_tca()
+
+import time
+import functools
+import board
+import adafruit_tca9548a
+import adafruit_tlv493d
+
+__all__ = ["SENSOR_ADDRESS", "NUM_CHANNELS", "CH_MASKS", "CH_ALL", "CH_CLEAR",
+           "CachedTCA", "get_tca", "mux_address",
+           "safe_ping", "scan_bulk", "safe_scan", "read_sensor", "recover_channel"]
+
+# Constants
+SENSOR_ADDRESS = 0x5E
+NUM_CHANNELS = 8
+
+# Mux control register values, built once instead of a bytes([...]) per write
+CH_MASKS = tuple(bytes([1 << ch]) for ch in range(NUM_CHANNELS))
+CH_ALL = bytes([(1 << NUM_CHANNELS) - 1])
+CH_CLEAR = bytes([0x00])
+
+
+# --- Cached Channel Select ---
+# The stock TCA9548A_Channel writes the channel mask on every try_lock() and 0x00 on every
+# unlock(), so each sensor transaction costs two extra mux writes. CachedTCA remembers the
+# last selected channel and only writes the control register when it actually changes.
+# NOTE: a channel stays enabled after unlock(). If a device on the parent bus shares an
+# address with a device behind the mux (e.g. a direct TLV493D at 0x5E), call tca.deselect()
+# before talking to it.
+
+class CachedTCAChannel(adafruit_tca9548a.TCA9548A_Channel):
+    """TCA9548A channel that skips the mux write when it is already selected."""
+
+    def __init__(self, tca, channel):
+        super().__init__(tca, channel)
+        self.channel = channel
+
+    def try_lock(self):
+        while not self.tca.i2c.try_lock():
+            time.sleep(0)
+        if self.tca._last_ch != self.channel:
+            try:
+                self.tca.i2c.writeto(self.tca.address, self.channel_switch)
+            except OSError:
+                self.tca.invalidate()
+                self.tca.i2c.unlock()
+                raise
+            self.tca._last_ch = self.channel
+        return True
+
+    def unlock(self):
+        # Leave the channel selected so the next try_lock() on it is free
+        return self.tca.i2c.unlock()
+
+    # Any bus error leaves the mux state unknown: force a rewrite on the next lock
+    def readfrom_into(self, address, buffer, **kwargs):
+        try:
+            return super().readfrom_into(address, buffer, **kwargs)
+        except OSError:
+            self.tca.invalidate()
+            raise
+
+    def writeto(self, address, buffer, **kwargs):
+        try:
+            return super().writeto(address, buffer, **kwargs)
+        except OSError:
+            self.tca.invalidate()
+            raise
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, **kwargs):
+        try:
+            return super().writeto_then_readfrom(address, buffer_out, buffer_in, **kwargs)
+        except OSError:
+            self.tca.invalidate()
+            raise
+
+
+class CachedTCA(adafruit_tca9548a.TCA9548A):
+    """Drop-in TCA9548A whose channels cache the currently selected mux channel."""
+
+    def __init__(self, i2c, address=0x70):
+        super().__init__(i2c, address)
+        self._last_ch = None
+
+    def __getitem__(self, key):
+        if not 0 <= key <= 7:
+            raise IndexError("Channel must be an integer in the range: 0-7.")
+        if self.channels[key] is None:
+            self.channels[key] = CachedTCAChannel(self, key)
+        return self.channels[key]
+
+    def invalidate(self):
+        """Forget the cached channel so the next lock rewrites the control register."""
+        self._last_ch = None
+
+    def deselect(self):
+        """Disable all channels, e.g. before accessing devices directly on the parent bus."""
+        while not self.i2c.try_lock():
+            time.sleep(0)
+        try:
+            self.i2c.writeto(self.address, CH_CLEAR)
+        finally:
+            self._last_ch = None
+            self.i2c.unlock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tca(address=0x70):
+    """Shared CachedTCA on board.I2C(), created once per mux address."""
+    return CachedTCA(board.I2C(), address)
+
+def mux_address(tca):
+    # Attribute name differs between adafruit_tca9548a releases
+    if hasattr(tca, "address"):
+        return tca.address
+    return tca.i2c_device.device_address
+
+
+# --- Safe Ping ---
+def safe_ping(i2c_obj, address):
+    try:
+        i2c_obj.writeto(address, b'')  # Empty write = probe
+        return True
+    except Exception:
+        return False
+
+# --- Bulk Scan ---
+def scan_bulk(tca=None, address=SENSOR_ADDRESS, num_channels=NUM_CHANNELS):
+    """Return the list of channels with a device ACKing at address.
+    The bus is locked once for the whole scan and the mux mask is written directly,
+    instead of a select + deselect write pair per channel. A first probe with every
+    channel enabled skips the per-channel pass entirely when nothing answers."""
+    tca = tca or get_tca()
+    i2c = tca.i2c
+    mux = mux_address(tca)
+    found = []
+    while not i2c.try_lock():
+        time.sleep(0)
+    try:
+        i2c.writeto(mux, CH_ALL if num_channels == NUM_CHANNELS else bytes([(1 << num_channels) - 1]))
+        if safe_ping(i2c, address):
+            # Identical addresses can't be told apart with all channels on: resolve per channel
+            for ch in range(num_channels):
+                i2c.writeto(mux, CH_MASKS[ch])
+                if safe_ping(i2c, address):
+                    found.append(ch)
+    finally:
+        try:
+            i2c.writeto(mux, CH_CLEAR)
+        finally:
+            if isinstance(tca, CachedTCA):
+                tca.invalidate()
+            i2c.unlock()
+    return found
+
+# --- Safe Scan ---
+def safe_scan(tca=None, address=SENSOR_ADDRESS, num_channels=NUM_CHANNELS):
+    print("Performing safe scan of all channels...")
+    try:
+        found = scan_bulk(tca, address, num_channels)
+    except OSError as e:
+        print(f"Scan failed: {e}")
+        return []
+    for ch in range(num_channels):
+        print(f"Channel {ch}: {'Sensor found' if ch in found else 'No sensor'}")
+    return found
+
+# --- Read Sensor ---
+def read_sensor(channel, tca=None):
+    tca = tca or get_tca()
+    try:
+        sensor = adafruit_tlv493d.TLV493D(tca[channel])
+        x, y, z = sensor.magnetic
+        print(f"Read from channel {channel}: x={x:.3f}, y={y:.3f}, z={z:.3f}")
+        time.sleep(1)
+        print(f"Read2 from channel {channel}: x={x:.3f}, y={y:.3f}, z={z:.3f}")
+        return True
+    except Exception as e:
+        print(f"Read failed on channel {channel}: {e}")
+        return False
+
+# --- Recover Channel ---
+def recover_channel(channel, sensor_address=SENSOR_ADDRESS, tca=None):
+    tca = tca or get_tca()
+    mux = mux_address(tca)
+    try:
+        # Disable all channels
+        tca.i2c.writeto(mux, CH_CLEAR)
+        time.sleep(0.05)
+
+        # Enable only the channel in question
+        tca.i2c.writeto(mux, CH_MASKS[channel])
+        time.sleep(0.05)
+        if isinstance(tca, CachedTCA):
+            tca.invalidate() # Mux was written behind the channel objects' back
+
+        if tca[channel].try_lock():
+            try:
+                tca[channel].writeto(sensor_address, b'')
+                print(f"Recover attempt: Sensor on channel {channel} responded after reselection.")
+                return True
+            except Exception as e:
+                print(f"Recover attempt failed on channel {channel}: {e}")
+            finally:
+                tca[channel].unlock()
+    except Exception as e:
+        print(f"Recover exception on channel {channel}: {e}")
+    return False
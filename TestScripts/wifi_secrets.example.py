@@ -0,0 +1,4 @@
+# Wi-Fi credentials for picow_tlv_udp_sender.py.
+# Copy to wifi_secrets.py, fill in, and upload next to main.py on the Pico W. wifi_secrets.py is git-ignored.
+WIFI_SSID = "your-ssid"
+WIFI_PASSWORD = "your-password"
@@ -3,30 +3,44 @@
 # Avoid Scan method from tca9548a 
 
 
-import time
 import board
-import adafruit_tca9548a
 import adafruit_tlv493d
-
-def find_tlv493d_sensors(i2c_bus=None, max_channels=8):
+from tca_utils import CachedTCA
+
+SENSOR_ADDRESS = 0x5E
+
+# Create I2C bus and TCA9548A once, shared by every scan
+i2c = board.I2C()  # uses board.SCL and board.SDA
+tca = CachedTCA(i2c)
+
+def safe_ping(channel, address):
+	"""Zero-byte write to address on a TCA channel; True if the device ACKs."""
+	if not channel.try_lock():
+		return False
+	try:
+		channel.writeto(address, b'')  # Empty write = probe
+		return True
+	except OSError:
+		return False
+	finally:
+		channel.unlock()
+
+def find_tlv493d_sensors(max_channels=8):
 	"""Scan all TCA9548A channels and return a list of detected TLV493D sensor objects."""
-	# Create I2C bus as normal
-	i2c = board.I2C()  # uses board.SCL and board.SDA
-	# Create the TCA9548A object and give it the I2C bus
-	tca = adafruit_tca9548a.TCA9548A(i2c)
-
 	detected_sensors = []
 
 	for channel in range(max_channels):
+		print(f"Trying channel {channel}...")
+		# Cheap address probe first: the driver init (several register transfers) only runs on hits
+		if not safe_ping(tca[channel], SENSOR_ADDRESS):
+			print(f"❌ No TLV493D on channel {channel}")
+			continue
 		try:
-			print(f"Trying channel {channel}...")
 			sensor = adafruit_tlv493d.TLV493D(tca[channel])
-			# Access a property to force communication and confirm it's working
-			_ = sensor.magnetic
 			print(f"✅ TLV493D detected on channel {channel}")
 			detected_sensors.append((channel, sensor))
 		except Exception as e:
-			print(f"❌ No TLV493D on channel {channel} (Error: {e})")
+			print(f"❌ Device at {hex(SENSOR_ADDRESS)} on channel {channel} failed TLV493D init (Error: {e})")
 
 	return detected_sensors
 
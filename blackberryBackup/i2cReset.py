@@ -1,26 +1,75 @@
+import os
+import mmap
+import ctypes
 import smbus
 import time
 import RPi.GPIO as GPIO
-import subprocess
 
 # Define I2C bus and SCL pin
 I2C_BUS = 1
 SCL_PIN = 3  # Adjust according to your wiring
+PINMUX_PATH = "/sys/class/pinctrl/pinctrl0/pinmux"
+GPIOMEM_PATH = "/dev/gpiomem"
+HALF_PERIOD_NS = 5000  # 5 us high + 5 us low = 100 kHz, standard-mode I2C clock
+
+# BCM283x/BCM2711 GPIO registers (32-bit word offsets into /dev/gpiomem)
+GPSET0 = 0x1C // 4
+GPCLR0 = 0x28 // 4
 
 # Initialize GPIO
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(SCL_PIN, GPIO.OUT)
 
+def open_gpio_registers():
+    # Map the GPIO register block so pin writes are single stores instead of library calls.
+    # Pi 1-4 only: the Pi 5 GPIOs live on the RP1 chip with a different register layout.
+    try:
+        with open("/proc/device-tree/compatible", "rb") as f:
+            if b"bcm2712" in f.read():
+                return None
+        fd = os.open(GPIOMEM_PATH, os.O_RDWR | os.O_SYNC)
+    except OSError:
+        return None
+    try:
+        mem = mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    return (ctypes.c_uint32 * 1024).from_buffer(mem) # Keeps the mapping alive
+
+def busy_wait_ns(ns):
+    # time.sleep() can't do microseconds: spin on the high-resolution counter instead
+    end = time.perf_counter_ns() + ns
+    while time.perf_counter_ns() < end:
+        pass
+
 def toggle_scl(scl_pin, count):
+    regs = open_gpio_registers()
+    if regs is not None:
+        bit = 1 << scl_pin
+        for _ in range(count):
+            regs[GPSET0] = bit
+            busy_wait_ns(HALF_PERIOD_NS)
+            regs[GPCLR0] = bit
+            busy_wait_ns(HALF_PERIOD_NS)
+        return
+    # Fallback (Pi 5, no /dev/gpiomem): same timing through RPi.GPIO, slower per write
     for _ in range(count):
         GPIO.output(scl_pin, GPIO.HIGH)
-        time.sleep(0.1)  # Short delay
+        busy_wait_ns(HALF_PERIOD_NS)
         GPIO.output(scl_pin, GPIO.LOW)
-        time.sleep(0.1)  # Short delay
+        busy_wait_ns(HALF_PERIOD_NS)
 
 def set_scl_to_i2c():
-    # Set GPIO3 back to SCL1 using pinctrl
-    subprocess.run(["echo", "3", ">", "/sys/class/pinctrl/pinctrl0/pinmux"], shell=True)
+    # Set GPIO3 back to SCL1 using pinctrl.
+    # Write the sysfs file directly: no shell fork, and the old subprocess call never
+    # performed the redirect (">" was passed to echo as a plain argument).
+    try:
+        with open(PINMUX_PATH, "w") as f:
+            f.write("3")
+    except OSError as e:
+        print(f"Could not write {PINMUX_PATH}: {e}")
 
 
 def unstick_i2c_bus():
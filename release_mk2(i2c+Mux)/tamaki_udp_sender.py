@@ -8,9 +8,40 @@ import adafruit_tca9548a
 import adafruit_tlv493d # Make sure this matches the library name
 import json
 import os
+import errno
+import sys
+import ctypes
 import threading
+import selectors
+import collections
 import logging
 import configparser
+import subprocess
+import struct
+
+# --- JSON Backend (command listener / status replies) ---
+# orjson (Rust, bytes in and out) is several times faster than the stdlib. Its wheels need a
+# 64-bit OS / recent glibc, so fall back to ujson (C, armv6/v7 wheels), then to the stdlib json.
+try:
+    import orjson
+    json_dumps = orjson.dumps # -> bytes
+    json_loads = orjson.loads # Accepts bytes directly
+    JSONDecodeError = orjson.JSONDecodeError
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        def json_dumps(obj):
+            return ujson.dumps(obj).encode('utf-8')
+        json_loads = ujson.loads # Accepts bytes directly
+        JSONDecodeError = getattr(ujson, "JSONDecodeError", ValueError) # Older ujson raises plain ValueError
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        def json_dumps(obj):
+            return json.dumps(obj).encode('utf-8')
+        json_loads = json.loads
+        JSONDecodeError = json.JSONDecodeError
+        JSON_BACKEND = "json"
 
 # --- Setup Logging ---
 logging.basicConfig(
@@ -18,6 +49,8 @@ logging.basicConfig(
     format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
     handlers=[logging.StreamHandler()]
 )
+# Checked once: used for exc_info on error paths instead of a getLogger() lookup per call
+IS_DEBUG = logging.getLogger().isEnabledFor(logging.DEBUG)
 
 # --- Command Constants ---
 CMD_REBOOT = "reboot"
@@ -25,11 +58,76 @@ CMD_SHUTDOWN = "shutdown"
 CMD_SET_FREQUENCY = "set_frequency"
 CMD_GET_STATUS = "get_status"
 
+# --- Send Batching ---
+SEND_BATCH_MAX = 16 # Preallocated sendmmsg() slots; SendBatchSize in config.ini is clamped to this
+SEND_QUEUE_MAX = 256 # Payloads buffered between sampler and sender; the oldest is dropped when full
+
+# --- Socket Buffers ---
+# The kernel caps these at net.core.wmem_max / rmem_max. Raise them to match, e.g.:
+#   sudo sysctl -w net.core.wmem_max=12582912 net.core.rmem_max=12582912
+SENSOR_SOCKET_SNDBUF = 4 * 1024 * 1024
+COMMAND_SOCKET_RCVBUF = 4 * 1024 * 1024
+SO_SNDBUFFORCE = getattr(socket, "SO_SNDBUFFORCE", 32) # Linux values; not exported by Python's socket module
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+
+# --- Packet Priority ---
+SENSOR_SOCKET_TOS = 0xB8 # DSCP EF (expedited forwarding) << 2: priority queues on WMM Wi-Fi / QoS switches
+SENSOR_SOCKET_PRIORITY = 6 # SO_PRIORITY: highest value allowed without CAP_NET_ADMIN
+
+def set_socket_buffer(sock, option, force_option, size, label):
+    # Try the *BUFFORCE variant first (ignores the sysctl cap, needs CAP_NET_ADMIN), then the plain one
+    if sys.platform.startswith("linux"):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+            return
+        except OSError:
+            pass # EPERM without CAP_NET_ADMIN
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+    except OSError as e:
+        logging.warning(f"Could not set {label} on socket: {e}")
+        return
+    actual = sock.getsockopt(socket.SOL_SOCKET, option) // 2 # Linux reports double the usable size
+    if actual < size:
+        logging.warning(f"{label} is {actual} bytes (requested {size}). Raise the net.core sysctl limit.")
+
+# --- Thread Placement (Pi: cores 0-3) ---
+# For the least jitter, keep other work off the sampler core: add isolcpus=3 to /boot/firmware/cmdline.txt
+SAMPLER_CPU = 3
+SENDER_CPU = 2
+COMMAND_LISTENER_CPU = 1
+SAMPLER_FIFO_PRIORITY = 50 # SCHED_FIFO priority for the sampler (needs root or CAP_SYS_NICE)
+
+def pin_current_thread(cpu):
+    # Linux only; best effort so the script still runs elsewhere
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+            logging.info(f"{threading.current_thread().name} pinned to CPU {cpu}.")
+        except OSError as e:
+            logging.warning(f"Could not pin {threading.current_thread().name} to CPU {cpu}: {e}")
+
+def enable_realtime_scheduling(priority):
+    # Call from the thread itself, after other threads are started (new threads inherit the policy)
+    if hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logging.info(f"{threading.current_thread().name} running with SCHED_FIFO priority {priority}.")
+        except OSError as e:
+            logging.warning(f"Could not enable SCHED_FIFO (run as root or grant CAP_SYS_NICE): {e}")
+
 # --- Global Variables & Shared Objects ---
-g_send_frequency_hz = 0.0
-g_frequency_lock = threading.Lock()
+g_send_frequency_hz = 0.0 # Single writer (command listener), read every tick by the sampler: a float
+                          # rebind/load is atomic under the GIL, so no lock.
 g_stop_command_listener = threading.Event()
-g_sensor_configs_from_file = [] # Stores parsed sensor definitions from config
+g_stop_pipe_r, g_stop_pipe_w = os.pipe() # Readable once stop is requested: wakes the command listener's select()
+g_send_queue = collections.deque(maxlen=SEND_QUEUE_MAX) # Sampler appends, sender thread pops (both atomic)
+g_send_ready = threading.Event() # Set by the sampler once SEND_BATCH_SIZE payloads are queued
+g_sent_packets = 0 # Written by the sender thread only
+g_dropped_packets = 0 # Written by the sampler only: payloads pushed out of a full g_send_queue
+g_sensor_configs_from_file = [] # Stores parsed sensor definitions from config, in ActiveSensors order
+g_direct_sensors = [] # The same definitions split by type while parsing
+g_tca_sensors = []
 g_active_sensor_objects = [] # Stores successfully initialized sensor objects and their IDs
 g_initialized_sensor_count = 0
 g_enable_system_commands = False
@@ -38,6 +136,10 @@ g_enable_system_commands = False
 HOST_IP_PC = "127.0.0.1"
 HOST_PORT_PC = 8000
 PI_COMMAND_PORT = 8001
+SEND_BATCH_SIZE = 1 # Payloads per sendmmsg() call (1 = send every sample immediately)
+SEND_BATCH_MAX_DELAY_S = 0.02 # Flush a partial batch once its oldest payload is this old
+PAYLOAD_FORMAT = "json" # "json" or "binary", see build_payload_template()
+SEND_UDP_GSO = False # Flush batches as one UDP GSO send() instead of sendmmsg(), see BatchSender
 # TCA object will be global if at least one TCA sensor is defined
 tca = None
 i2c = None
@@ -45,7 +147,7 @@ i2c = None
 
 # --- Configuration Loading ---
 def load_configuration():
-    global HOST_IP_PC, HOST_PORT_PC, PI_COMMAND_PORT
+    global HOST_IP_PC, HOST_PORT_PC, PI_COMMAND_PORT, SEND_BATCH_SIZE, SEND_BATCH_MAX_DELAY_S, PAYLOAD_FORMAT, SEND_UDP_GSO
     global g_send_frequency_hz, g_enable_system_commands, g_sensor_configs_from_file
     
     # Get the absolute path of the directory where the script is located
@@ -54,7 +156,7 @@ def load_configuration():
     # Construct the full path to the config.ini file
     config_file_path = os.path.join(script_dir, 'config.ini')
     
-    config = configparser.ConfigParser()
+    config = configparser.ConfigParser(interpolation=None) # No %(name)s values in config.ini: skip interpolation on every get
 
     if not os.path.exists(config_file_path):
         logging.error(f"Configuration file '{config_file_path}' not found. Exiting.")
@@ -63,12 +165,22 @@ def load_configuration():
     try:
         config.read(config_file_path)
 
-        HOST_IP_PC = config.get('Network', 'HostIPPC', fallback='127.0.0.1')
-        HOST_PORT_PC = config.getint('Network', 'HostPortPC', fallback=8000)
-        PI_COMMAND_PORT = config.getint('Network', 'PiCommandPort', fallback=8001)
+        # Look each section up once; missing sections read as empty so the fallbacks apply
+        network = config['Network'] if config.has_section('Network') else {}
+        sensors_general = config['SensorsGeneral'] if config.has_section('SensorsGeneral') else {}
+
+        HOST_IP_PC = network.get('HostIPPC', '127.0.0.1')
+        HOST_PORT_PC = int(network.get('HostPortPC', 8000))
+        PI_COMMAND_PORT = int(network.get('PiCommandPort', 8001))
+        SEND_BATCH_SIZE = min(max(1, int(network.get('SendBatchSize', 1))), SEND_BATCH_MAX)
+        SEND_BATCH_MAX_DELAY_S = float(network.get('SendBatchMaxDelayMs', 20.0)) / 1000.0
+        SEND_UDP_GSO = config.getboolean('Network', 'UdpGso', fallback=False)
+        PAYLOAD_FORMAT = network.get('PayloadFormat', 'json').strip().lower()
+        if PAYLOAD_FORMAT not in ('json', 'binary'):
+            raise ValueError(f"PayloadFormat must be 'json' or 'binary', got '{PAYLOAD_FORMAT}'")
         
-        g_send_frequency_hz = config.getfloat('SensorsGeneral', 'InitialSendFrequencyHz', fallback=0.0)
-        active_sensor_ids_str = config.get('SensorsGeneral', 'ActiveSensors', fallback='')
+        g_send_frequency_hz = float(sensors_general.get('InitialSendFrequencyHz', 0.0))
+        active_sensor_ids_str = sensors_general.get('ActiveSensors', '')
         active_sensor_ids = [s.strip() for s in active_sensor_ids_str.split(',') if s.strip()]
 
         g_enable_system_commands = config.getboolean('System', 'EnableSystemCommands', fallback=False)
@@ -80,24 +192,26 @@ def load_configuration():
                 logging.warning(f"Sensor section '[{sensor_id}]' listed in ActiveSensors not found in config. Skipping.")
                 continue
             
+            sect = config[sensor_id]
             sensor_def = {'id_str': sensor_id} # Use section name as id_str
-            sensor_def['type'] = config.get(sensor_id, 'type', fallback='').lower()
-            sensor_def['name'] = config.get(sensor_id, 'name', fallback=sensor_id) # Default name to id_str
+            sensor_def['type'] = sect.get('type', '').lower()
+            sensor_def['name'] = sect.get('name', sensor_id) # Default name to id_str
             
             if sensor_def['type'] == 'direct_i2c':
-                addr_str = config.get(sensor_id, 'address', fallback=None)
+                addr_str = sect.get('address')
                 sensor_def['address'] = int(addr_str, 0) if addr_str else None # int(x,0) handles 0x, 0o, decimal
             elif sensor_def['type'] == 'tca9548a':
-                if not config.has_option(sensor_id, 'tca_channel'):
+                if 'tca_channel' not in sect:
                     logging.error(f"Sensor '{sensor_id}' is type 'tca9548a' but 'tca_channel' is missing. Skipping.")
                     continue
-                sensor_def['tca_channel'] = config.getint(sensor_id, 'tca_channel')
-                addr_str = config.get(sensor_id, 'address', fallback=None)
+                sensor_def['tca_channel'] = int(sect['tca_channel'])
+                addr_str = sect.get('address')
                 sensor_def['address'] = int(addr_str, 0) if addr_str else None
             else:
                 logging.error(f"Unknown sensor type '{sensor_def['type']}' for sensor '{sensor_id}'. Skipping.")
                 continue
             g_sensor_configs_from_file.append(sensor_def)
+            (g_tca_sensors if sensor_def['type'] == 'tca9548a' else g_direct_sensors).append(sensor_def)
 
     except (configparser.Error) as e:
         logging.error(f"Error parsing configuration file '{config_file_path}': {e}. Exiting.")
@@ -112,8 +226,10 @@ def load_configuration():
     logging.info("Configuration loaded successfully.")
     logging.info(f"  Target PC IP: {HOST_IP_PC}, Port: {HOST_PORT_PC}")
     logging.info(f"  Pi Command Port: {PI_COMMAND_PORT}")
+    logging.info(f"  Payload Format: {PAYLOAD_FORMAT}")
+    logging.info(f"  Send Batch Size: {SEND_BATCH_SIZE} (max delay {SEND_BATCH_MAX_DELAY_S * 1000:.1f} ms)")
     logging.info(f"  Initial Send Frequency: {g_send_frequency_hz} Hz")
-    logging.info(f"  Parsed {len(g_sensor_configs_from_file)} active sensor configurations.")
+    logging.info(f"  Parsed {len(g_sensor_configs_from_file)} active sensor configurations ({len(g_direct_sensors)} direct, {len(g_tca_sensors)} on TCA9548A).")
 
 # --- Sensor Initialization ---
 def initialize_hardware_and_sensors():
@@ -127,8 +243,7 @@ def initialize_hardware_and_sensors():
         exit(1)
     
     # Initialize TCA9548A only if at least one sensor uses it
-    needs_tca = any(s_def['type'] == 'tca9548a' for s_def in g_sensor_configs_from_file)
-    if needs_tca:
+    if g_tca_sensors:
         try:
             tca = adafruit_tca9548a.TCA9548A(i2c)
             logging.info("TCA9548A multiplexer initialized.")
@@ -147,7 +262,7 @@ def initialize_hardware_and_sensors():
 
         if sensor_def.get('address') is not None:
             address_arg['address'] = sensor_def['address']
-            logging.debug(f"  Sensor '{friendly_name}' ({sensor_id_str}) will use custom address: {hex(sensor_def['address'])}")
+            logging.debug("  Sensor '%s' (%s) will use custom address: %s", friendly_name, sensor_id_str, hex(sensor_def['address']))
 
 
         logging.info(f"  Initializing '{friendly_name}' ({sensor_id_str}), type: {sensor_type}...")
@@ -168,15 +283,19 @@ def initialize_hardware_and_sensors():
                 i2c_interface_for_sensor = tca[channel]
                 sensor_obj = adafruit_tlv493d.TLV493D(i2c_interface_for_sensor, **address_arg)
             
-            # If we reach here, sensor_obj should be valid
-            g_active_sensor_objects.append({'id_str': sensor_id_str, 'name': friendly_name, 'obj': sensor_obj, 'original_def': sensor_def})
+            # If we reach here, sensor_obj should be valid. The read loop talks to the chip directly,
+            # so keep its address, mux channel (None = parent bus) and a register buffer.
+            g_active_sensor_objects.append({'id_str': sensor_id_str, 'name': friendly_name, 'obj': sensor_obj, 'original_def': sensor_def,
+                                            'address': sensor_obj.i2c_device.device_address,
+                                            'channel': sensor_def['tca_channel'] if sensor_type == 'tca9548a' else None,
+                                            'raw': bytearray(TLV_READ_LEN)})
             g_initialized_sensor_count += 1
             logging.info(f"    Successfully initialized '{friendly_name}' ({sensor_id_str}).")
 
         except ValueError as e: 
             logging.warning(f"    Could not initialize '{friendly_name}' ({sensor_id_str}): {e} (Often means sensor not found at address).")
         except Exception as e:
-            logging.error(f"    Unexpected error initializing '{friendly_name}' ({sensor_id_str}): {e}", exc_info=logging.getLogger().level == logging.DEBUG)
+            logging.error(f"    Unexpected error initializing '{friendly_name}' ({sensor_id_str}): {e}", exc_info=IS_DEBUG)
         
     if g_initialized_sensor_count == 0 and g_sensor_configs_from_file:
         logging.warning("No active sensors were successfully initialized. Will send empty 'Sensor' dict or 0s if placeholders are kept.")
@@ -185,138 +304,430 @@ def initialize_hardware_and_sensors():
 
 
 # --- Sensor Reading and JSON Building ---
-def read_sensors_and_build_json():
-    payload_dict = {"Sensor": {}} # Ensure "Sensor" key always exists
-    
+TLV_READ_LEN = 7          # Bx, By, Bz high bytes, temp/frame/channel, Bx/By low, flags/Bz low, temp low
+TLV_UT_PER_LSB = 98.0     # 0.098 mT per LSB, same scaling as adafruit_tlv493d.magnetic (uT)
+TLV_MAX_ABS_UT = 2048 * TLV_UT_PER_LSB # 12-bit two's complement extreme: -2048 LSB = -200.7 mT
+TCA_CH_MASKS = tuple(bytes([1 << ch]) for ch in range(8))
+TCA_CH_CLEAR = b'\x00'
+ZERO_XYZ = (0.0, 0.0, 0.0)
+
+def mux_address(tca_obj):
+    # Attribute name differs between adafruit_tca9548a releases
+    if hasattr(tca_obj, "address"):
+        return tca_obj.address
+    return tca_obj.i2c_device.device_address
+
+BINARY_PAYLOAD_VERSION = 1
+g_payload_template = b"" # Built once by build_payload_template(), filled with %-formatting every loop
+g_binary_packer = None # struct.Struct for PayloadFormat = binary, see build_payload_template()
+g_read_order = [] # Indices into g_active_sensor_objects: parent-bus sensors first, then by TCA channel
+g_tca_address = None # Mux address if any active sensor sits behind it
+# Per-sensor read state as parallel lists indexed like g_active_sensor_objects (no dict lookups per read)
+g_sensor_addresses = []
+g_sensor_channels = []
+g_sensor_raw = []
+g_sensor_labels = [] # "'name' (id_str)" for log messages
+g_mag_values = [] # Flat x, y, z per sensor, reused every loop
+g_read_plan = [] # (value offset, mux mask or None, address, raw buffer, label) per sensor, in read order
+
+def build_payload_template():
+    # The active sensor list is fixed after init, so the JSON layout is too. Build it once as a
+    # bytes %-template: {"Sensor":{"Sensor_0":[{"axis":"x","val":%.3f},...],...}}
+    # The hot loop then only formats the floats: no dict building, no JSON encoder walk, no encode.
+    # The sensor IDs are baked into the template, so this already is the specialized formatter:
+    # a single bytes.__mod__ call in C. An exec()-generated f-string function would do the same
+    # work with 3N Python-level index/format steps on top.
+    global g_payload_template, g_read_order, g_tca_address, g_mag_values, g_read_plan, g_binary_packer
+    for info in g_active_sensor_objects:
+        g_sensor_addresses.append(info['address'])
+        g_sensor_channels.append(info['channel'])
+        g_sensor_raw.append(info['raw'])
+        g_sensor_labels.append(f"'{info['name']}' ({info['id_str']})")
+    g_mag_values = [0.0] * (3 * len(g_active_sensor_objects))
+    channels = g_sensor_channels
+    g_read_order = sorted(range(len(channels)), key=lambda idx: -1 if channels[idx] is None else channels[idx])
+    if any(ch is not None for ch in channels):
+        g_tca_address = mux_address(tca)
+    g_read_plan = [(3 * idx, None if channels[idx] is None else TCA_CH_MASKS[channels[idx]],
+                    g_sensor_addresses[idx], g_sensor_raw[idx], g_sensor_labels[idx]) for idx in g_read_order]
+    sensor_fragments = []
     for active_sensor_info in g_active_sensor_objects:
-        sensor_obj = active_sensor_info['obj']
-        sensor_id_str = active_sensor_info['id_str'] # This is the key for the JSON
-        friendly_name = active_sensor_info['name']
-        
-        sensor_data_list = []
-        mag_x, mag_y, mag_z = 0.0, 0.0, 0.0
-
-        if sensor_obj: # Should always be true if it's in g_active_sensor_objects
+        key = json.dumps(active_sensor_info['id_str']).replace('%', '%%') # Quoted/escaped once here
+        axes = ",".join('{"axis":"' + axis + '","val":%.3f}' for axis in "xyz")
+        sensor_fragments.append(key + ':[' + axes + ']')
+    g_payload_template = ('{"Sensor":{' + ",".join(sensor_fragments) + '}}').encode('utf-8')
+
+    # PayloadFormat = binary: fixed-size big-endian frame, 3 + 12 * N bytes
+    #   uint8 version (BINARY_PAYLOAD_VERSION), uint8 flags (0, reserved), uint8 sensor count,
+    #   then float32 x, y, z per sensor in the same order as the JSON keys / ActiveSensors.
+    # The sensor IDs are not on the wire: build_hello_payload() announces them once at startup
+    # and get_status returns them.
+    if PAYLOAD_FORMAT == 'binary':
+        g_binary_packer = struct.Struct("!BBB" + "fff" * len(g_active_sensor_objects))
+
+def build_hello_payload():
+    return json_dumps({"hello": {"format": PAYLOAD_FORMAT, "version": BINARY_PAYLOAD_VERSION,
+                                 "sensors": [info['id_str'] for info in g_active_sensor_objects]}})
+
+def max_payload_size():
+    # Longest payload the template can produce: TLV493D readings stay within +/-TLV_MAX_ABS_UT
+    # ("-200704.000" uT, 11 characters), so 16 characters per float is a safe bound.
+    if g_binary_packer is not None:
+        return g_binary_packer.size
+    field_len = max(16, len(f"{-TLV_MAX_ABS_UT:.3f}"))
+    return len(g_payload_template) + field_len * len(g_mag_values)
+
+def read_sensors_and_build_payload():
+    # One bus lock for the whole pass. Parent-bus sensors are read first with the mux off, then each
+    # TCA channel is selected with one direct mask write and its sensor read raw: no per-sensor
+    # lock/select/deselect through TCA9548A_Channel and no TLV493D.magnetic property. The mux is
+    # cleared again at the end, so a direct sensor sharing 0x5E never collides with one behind it.
+    # This runs once per sample, so it is written for the interpreter: everything it needs is
+    # precomputed in g_read_plan, bus methods and globals are bound to locals, and the TLV493D
+    # decode is inlined rather than called per sensor.
+    # The sensors convert in parallel with this pass without any extra kick-off writes: in the master
+    # controlled mode adafruit_tlv493d configures, finishing a read starts that sensor's next
+    # measurement, which runs while the remaining sensors are read.
+    values = g_mag_values
+    writeto = i2c.writeto
+    readfrom_into = i2c.readfrom_into
+    tca_address = g_tca_address
+    scale = TLV_UT_PER_LSB
+    selected = None
+    while not i2c.try_lock():
+        pass
+    try:
+        for base, mask, address, raw, label in g_read_plan:
             try:
-                mag_x, mag_y, mag_z = sensor_obj.magnetic
+                if mask is not None and mask is not selected:
+                    selected = None # Unknown until the write succeeds
+                    writeto(tca_address, mask)
+                    selected = mask
+                readfrom_into(address, raw)
             except OSError as e:
-                logging.warning(f"I2C Error reading '{friendly_name}' ({sensor_id_str}): {e}. Sending 0s for this cycle.")
-            except Exception as e:
-                logging.error(f"Unexpected error reading '{friendly_name}' ({sensor_id_str}): {e}. Sending 0s.", exc_info=logging.getLogger().level == logging.DEBUG)
-        
-        sensor_data_list.append({"axis": "x", "val": round(mag_x, 3)})
-        sensor_data_list.append({"axis": "y", "val": round(mag_y, 3)})
-        sensor_data_list.append({"axis": "z", "val": round(mag_z, 3)})
-        payload_dict["Sensor"][sensor_id_str] = sensor_data_list
+                values[base:base + 3] = ZERO_XYZ
+                logging.warning(f"I2C Error reading {label}: {e}. Sending 0s for this cycle.")
+                continue
+            # 12-bit fields from the 7-byte register window, sign-extended (same result as TLV493D.magnetic)
+            values[base] = ((((raw[0] << 4) | (raw[4] >> 4)) ^ 0x800) - 0x800) * scale
+            values[base + 1] = ((((raw[1] << 4) | (raw[4] & 0x0F)) ^ 0x800) - 0x800) * scale
+            values[base + 2] = ((((raw[2] << 4) | (raw[5] & 0x0F)) ^ 0x800) - 0x800) * scale
+        if g_tca_address is not None:
+            try:
+                i2c.writeto(g_tca_address, TCA_CH_CLEAR)
+            except OSError as e:
+                logging.warning(f"I2C Error clearing TCA9548A channels: {e}")
+    finally:
+        i2c.unlock()
     
-    # If you want to include placeholders for sensors defined in config but FAILED to init:
-    # You'd iterate g_sensor_configs_from_file and if an id_str is not in payload_dict["Sensor"], add it with 0s.
-    # For now, only successfully initialized sensors are included.
+    # Only successfully initialized sensors are included (the template is built from g_active_sensor_objects).
+    if g_binary_packer is not None:
+        return g_binary_packer.pack(BINARY_PAYLOAD_VERSION, 0, len(g_read_plan), *values)
+    return g_payload_template % tuple(values)
+
+# --- Batched UDP Sender (sendmmsg) ---
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+# UDP generic segmentation offload (Linux 4.18+): one send() of N equal-size segments leaves as N datagrams
+SOL_UDP = getattr(socket, "SOL_UDP", 17) # Linux values; not exported by every Python build
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GSO_MAX_BYTES = 65000 # A GSO send must still fit one UDP length field (minus headers)
+IP_MTU = getattr(socket, "IP_MTU", 14) # Path MTU of a connected socket (Linux)
+PATH_MTU_FALLBACK = 1500 # Assumed when the kernel can't report it
+IPV4_UDP_OVERHEAD = 28 # IPv4 (20) + UDP (8) headers: each GSO segment must fit one datagram
+
+class BatchSender:
+    """Queues UDP payloads and flushes them with a single sendmmsg(2) call on Linux.
+    Payloads are copied into preallocated slots whose addresses are wired into the iovecs once,
+    so a flush allocates nothing. Falls back to one send() per payload elsewhere, or if libc has
+    no sendmmsg. The socket must already be connect()ed: messages carry no destination address.
+    With gso=True (and kernel support) a flush is a single send() instead: every payload but the
+    last is padded to slot_size with ASCII spaces (legal trailing whitespace in JSON; binary frames
+    are fixed-size and never padded) and the kernel cuts the buffer back into one datagram each.
+    If a GSO send fails (EIO: no TX checksum offload on the interface, EINVAL: segment too large)
+    GSO is switched off and the batch goes out through sendmmsg() instead."""
+
+    def __init__(self, sock, slot_size, batch_size=SEND_BATCH_MAX, gso=False):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.count = 0
+        self.slots = [bytearray(slot_size) for _ in range(batch_size)]
+        self.slot_views = [memoryview(slot) for slot in self.slots]
+        self.lengths = [0] * batch_size
+        self.gso_view = None
+        if gso:
+            self.enable_gso(slot_size)
+        self.libc = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.libc = ctypes.CDLL("libc.so.6", use_errno=True)
+                self.libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+                self.libc.sendmmsg.restype = ctypes.c_int
+            except (OSError, AttributeError) as e:
+                logging.warning(f"sendmmsg unavailable ({e}), falling back to send().")
+                self.libc = None
+        if self.libc is None:
+            return
+
+        self.iovecs = (_IOVec * batch_size)()
+        self.msgs = (_MMsgHdr * batch_size)()
+        # Keep the ctypes views alive: they pin the slots so they can't be resized/moved
+        self.ctypes_views = [(ctypes.c_char * slot_size).from_buffer(slot) for slot in self.slots]
+        for i, view in enumerate(self.ctypes_views):
+            self.iovecs[i].iov_base = ctypes.addressof(view)
+            hdr = self.msgs[i].msg_hdr # msg_name stays NULL: the connected socket supplies the peer
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.fd = sock.fileno()
+
+    def enable_gso(self, slot_size):
+        if slot_size * self.batch_size > UDP_GSO_MAX_BYTES:
+            logging.warning(f"UDP GSO disabled: {self.batch_size} x {slot_size} bytes exceeds one GSO send.")
+            return
+        try:
+            path_mtu = self.sock.getsockopt(socket.IPPROTO_IP, IP_MTU) # Valid once connected
+        except OSError:
+            path_mtu = PATH_MTU_FALLBACK
+        if slot_size > path_mtu - IPV4_UDP_OVERHEAD:
+            logging.warning(f"UDP GSO disabled: {slot_size}-byte segments exceed the path MTU ({path_mtu}).")
+            return
+        try:
+            self.sock.setsockopt(SOL_UDP, UDP_SEGMENT, slot_size)
+        except OSError as e:
+            logging.warning(f"UDP GSO unavailable ({e}), using sendmmsg().")
+            return
+        self.slot_size = slot_size
+        self.gso_view = memoryview(bytearray(slot_size * self.batch_size))
+        self.pad_view = memoryview(b' ' * slot_size)
+        logging.info(f"UDP GSO enabled: {slot_size}-byte segments.")
+
+    def disable_gso(self):
+        try:
+            self.sock.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+        except OSError as e:
+            logging.warning(f"Could not clear UDP_SEGMENT: {e}")
+        self.gso_view = None
+
+    def flush_gso(self, n):
+        # Copy the queued payloads into one buffer at slot_size strides; the last one stays unpadded
+        size = self.slot_size
+        buf = self.gso_view
+        offset = 0
+        for i in range(n):
+            length = self.lengths[i]
+            buf[offset:offset + length] = self.slot_views[i][:length]
+            if i < n - 1 and length < size:
+                buf[offset + length:offset + size] = self.pad_view[:size - length]
+            offset += size if i < n - 1 else length
+        try:
+            self.sock.send(buf[:offset])
+        except OSError as e:
+            if e.errno not in (errno.EIO, errno.EINVAL):
+                raise
+            logging.warning(f"UDP GSO send failed ({e}), disabling GSO and resending through sendmmsg().")
+            self.disable_gso()
+            return self.flush_slots(n)
+        return n
+
+    def queue(self, payload):
+        """Copy one payload into the next slot; flushes when the batch is full. Returns the number of datagrams sent."""
+        i = self.count
+        n = len(payload)
+        self.slot_views[i][:n] = payload # Same-size slice store: no resize, the slot stays pinned
+        self.lengths[i] = n
+        self.count += 1
+        if self.count >= self.batch_size:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """Send all queued payloads. Returns the number of datagrams sent."""
+        n = self.count
+        if n == 0:
+            return 0
+        self.count = 0
+        if self.gso_view is not None and n > 1:
+            return self.flush_gso(n)
+        return self.flush_slots(n)
+
+    def flush_slots(self, n):
+        # One datagram per slot: sendmmsg() on Linux, plain send() otherwise (or for a single payload)
+        if self.libc is None or n == 1:
+            for i in range(n):
+                self.sock.send(self.slot_views[i][:self.lengths[i]])
+            return n
+        for i in range(n):
+            self.iovecs[i].iov_len = self.lengths[i]
+        sent = self.libc.sendmmsg(self.fd, self.msgs, n, 0)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+# --- Sender Thread ---
+def sensor_sender(sender):
+    # Sends whatever the sampler queued: wakes as soon as a full batch is waiting, or after
+    # SEND_BATCH_MAX_DELAY_S for a partial one, and drains the queue through sendmmsg().
+    # A stalled socket or network only delays this thread, never the sampler's I2C cadence.
+    global g_sent_packets
+    pin_current_thread(SENDER_CPU)
+    logging.info("Sensor sender started.")
+    while True:
+        stopping = g_stop_command_listener.is_set()
+        g_send_ready.wait(SEND_BATCH_MAX_DELAY_S)
+        g_send_ready.clear()
+        try:
+            while g_send_queue:
+                g_sent_packets += sender.queue(g_send_queue.popleft())
+            g_sent_packets += sender.flush()
+        except socket.error as e:
+            logging.error(f"SENDER: Socket error sending sensor data: {e}")
+        except Exception as e:
+            logging.error(f"SENDER: Unexpected error sending sensor data: {e}", exc_info=IS_DEBUG)
+        if stopping:
+            break # Final drain done
+    logging.info("Sensor sender stopped.")
+
+# --- UDP Command Listener Function (largely unchanged, ensure logging uses new format) ---
+def request_stop():
+    g_stop_command_listener.set()
+    os.write(g_stop_pipe_w, b"x")
 
+def run_system_command(argv):
+    # Exec the command directly (no /bin/sh in between) in its own session, without waiting:
+    # the ACK has already been sent and the listener keeps running until the system goes down.
     try:
-        return json.dumps(payload_dict)
-    except TypeError as e:
-        logging.error(f"Error serializing sensor data to JSON: {e}")
-        logging.debug(f"Problematic data for JSON: {payload_dict}")
-        return None
+        subprocess.Popen(argv, close_fds=True, start_new_session=True)
+    except OSError as e:
+        logging.error(f"COMMAND_LISTENER: Could not run {' '.join(argv)}: {e}")
+
+# --- Command Handlers ---
+# Each handler takes (command_json, addr, sock) and replies on sock. Dispatch is a dict lookup on the
+# "command" field, see CMD_HANDLERS below.
+ACK_REBOOT = f"ACK: {CMD_REBOOT} initiated.".encode('utf-8')
+NACK_REBOOT_DISABLED = f"NACK: {CMD_REBOOT} disabled by configuration.".encode('utf-8')
+ACK_SHUTDOWN = f"ACK: {CMD_SHUTDOWN} initiated.".encode('utf-8')
+NACK_SHUTDOWN_DISABLED = f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode('utf-8')
+NACK_INVALID_JSON = "NACK: Invalid JSON format".encode('utf-8')
+
+def handle_reboot(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
+        sock.sendto(ACK_REBOOT, addr)
+        run_system_command(["sudo", "reboot"])
+    else:
+        logging.warning(f"COMMAND_LISTENER: {CMD_REBOOT} command received but system commands are disabled in config.")
+        sock.sendto(NACK_REBOOT_DISABLED, addr)
+
+def handle_shutdown(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
+        sock.sendto(ACK_SHUTDOWN, addr)
+        run_system_command(["sudo", "shutdown", "-h", "now"])
+    else:
+        logging.warning(f"COMMAND_LISTENER: {CMD_SHUTDOWN} command received but system commands are disabled in config.")
+        sock.sendto(NACK_SHUTDOWN_DISABLED, addr)
+
+def handle_set_frequency(command_json, addr, sock):
+    global g_send_frequency_hz
+    new_freq_val = command_json.get("hz")
+    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
+        g_send_frequency_hz = float(new_freq_val)
+        logging.info(f"COMMAND_LISTENER: Send frequency set to: {g_send_frequency_hz} Hz")
+        sock.sendto(f"ACK: Frequency set to {g_send_frequency_hz} Hz".encode('utf-8'), addr)
+    else:
+        logging.warning(f"COMMAND_LISTENER: Invalid frequency value received: {new_freq_val}")
+        sock.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode('utf-8'), addr)
+
+def handle_get_status(command_json, addr, sock):
+    status_msg = {
+        "status": "OK",
+        "send_frequency_hz": g_send_frequency_hz,
+        "initialized_sensors": g_initialized_sensor_count,
+        "active_configured_sensors": len(g_sensor_configs_from_file),
+        "payload_format": PAYLOAD_FORMAT,
+        "sensor_ids": [info['id_str'] for info in g_active_sensor_objects] # Binary payload order
+    }
+    sock.sendto(json_dumps(status_msg), addr)
+
+def handle_unknown(command_json, addr, sock):
+    action = command_json.get("command")
+    logging.warning(f"COMMAND_LISTENER: Unknown command received: {action}")
+    sock.sendto(f"NACK: Unknown command '{action}'".encode('utf-8'), addr)
+
+CMD_HANDLERS = {
+    CMD_REBOOT: handle_reboot,
+    CMD_SHUTDOWN: handle_shutdown,
+    CMD_SET_FREQUENCY: handle_set_frequency,
+    CMD_GET_STATUS: handle_get_status,
+}
 
-# --- UDP Command Listener Function (largely unchanged, ensure logging uses new format) ---
 def command_listener():
-    global g_send_frequency_hz, g_frequency_lock, g_enable_system_commands
-    # ... (rest of command_listener is mostly the same as before, ensure logging is updated) ...
-    # For CMD_GET_STATUS, NUM_SENSORS should reflect number of *active configured* sensors
-    # num_active_configured_sensors = len(g_sensor_configs_from_file)
+    pin_current_thread(COMMAND_LISTENER_CPU)
 
     listener_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    set_socket_buffer(listener_socket, socket.SO_RCVBUF, SO_RCVBUFFORCE, COMMAND_SOCKET_RCVBUF, "SO_RCVBUF")
     try:
         listener_socket.bind(("", PI_COMMAND_PORT)) # Listen on all interfaces
-        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT}")
+        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT} (JSON: {JSON_BACKEND})")
     except OSError as e:
         logging.error(f"COMMAND_LISTENER: Could not bind to command port {PI_COMMAND_PORT}: {e}. Thread exiting.")
         return
 
-    listener_socket.settimeout(1.0) 
+    # Block in select() on the socket and the stop pipe: no 1 s timeout wake-ups, instant shutdown
+    listener_socket.setblocking(False)
+    selector = selectors.DefaultSelector() # epoll on Linux
+    selector.register(listener_socket, selectors.EVENT_READ)
+    selector.register(g_stop_pipe_r, selectors.EVENT_READ)
 
     while not g_stop_command_listener.is_set():
         try:
+            events = selector.select()
+            if not any(key.fileobj is listener_socket for key, _ in events):
+                continue # Woken by request_stop()
             data, addr = listener_socket.recvfrom(1024)
-            command_str = data.decode('utf-8')
-            logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_str}")
 
             try:
-                command_json = json.loads(command_str)
+                command_json = json_loads(data) # Parse the raw bytes: the text is only decoded to log bad input
+                logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_json}")
                 action = command_json.get("command")
+                CMD_HANDLERS.get(action, handle_unknown)(command_json, addr, listener_socket)
 
-                if action == CMD_REBOOT:
-                    # ... (same as before, check g_enable_system_commands)
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
-                        listener_socket.sendto(f"ACK: {CMD_REBOOT} initiated.".encode('utf-8'), addr)
-                        os.system("sudo reboot") 
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: {CMD_REBOOT} command received but system commands are disabled in config.")
-                        listener_socket.sendto(f"NACK: {CMD_REBOOT} disabled by configuration.".encode('utf-8'), addr)
-                
-                elif action == CMD_SHUTDOWN:
-                    # ... (same as before, check g_enable_system_commands)
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
-                        listener_socket.sendto(f"ACK: {CMD_SHUTDOWN} initiated.".encode('utf-8'), addr)
-                        os.system("sudo shutdown -h now") 
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: {CMD_SHUTDOWN} command received but system commands are disabled in config.")
-                        listener_socket.sendto(f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode('utf-8'), addr)
-
-                elif action == CMD_SET_FREQUENCY:
-                    # ... (same as before)
-                    new_freq_val = command_json.get("hz")
-                    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
-                        with g_frequency_lock:
-                            g_send_frequency_hz = float(new_freq_val)
-                        logging.info(f"COMMAND_LISTENER: Send frequency set to: {g_send_frequency_hz} Hz")
-                        listener_socket.sendto(f"ACK: Frequency set to {g_send_frequency_hz} Hz".encode('utf-8'), addr)
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: Invalid frequency value received: {new_freq_val}")
-                        listener_socket.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode('utf-8'), addr)
-                
-                elif action == CMD_GET_STATUS:
-                    with g_frequency_lock:
-                        current_freq = g_send_frequency_hz
-                    num_active_configured = len(g_sensor_configs_from_file)
-                    status_msg = {
-                        "status": "OK",
-                        "send_frequency_hz": current_freq,
-                        "initialized_sensors": g_initialized_sensor_count,
-                        "active_configured_sensors": num_active_configured
-                    }
-                    listener_socket.sendto(json.dumps(status_msg).encode('utf-8'), addr)
-
-                else:
-                    logging.warning(f"COMMAND_LISTENER: Unknown command received: {action}")
-                    listener_socket.sendto(f"NACK: Unknown command '{action}'".encode('utf-8'), addr)
-
-            except json.JSONDecodeError:
-                logging.error(f"COMMAND_LISTENER: Invalid JSON received from {addr}: {command_str}")
-                listener_socket.sendto("NACK: Invalid JSON format".encode('utf-8'), addr)
+            except JSONDecodeError:
+                logging.error(f"COMMAND_LISTENER: Invalid JSON received from {addr}: {data.decode('utf-8', 'replace')}")
+                listener_socket.sendto(NACK_INVALID_JSON, addr)
             except Exception as e:
-                logging.error(f"COMMAND_LISTENER: Error processing command from {addr}: {e}", exc_info=logging.getLogger().level == logging.DEBUG)
+                logging.error(f"COMMAND_LISTENER: Error processing command from {addr}: {e}", exc_info=IS_DEBUG)
                 listener_socket.sendto(f"NACK: Error processing command - {e}".encode('utf-8'), addr)
 
-        except socket.timeout:
-            continue 
+        except BlockingIOError:
+            continue # Readiness without a datagram (e.g. dropped on checksum error)
         except Exception as e:
-            logging.error(f"COMMAND_LISTENER: Unexpected error in listener loop: {e}", exc_info=logging.getLogger().level == logging.DEBUG)
+            logging.error(f"COMMAND_LISTENER: Unexpected error in listener loop: {e}", exc_info=IS_DEBUG)
             time.sleep(0.1) 
 
+    selector.close()
     listener_socket.close()
     logging.info("Command listener stopped.")
 
 
 # --- Main Application ---
 def main():
+    global g_dropped_packets
     load_configuration() # Load config first
     initialize_hardware_and_sensors() # Then initialize hardware based on config
+    build_payload_template()
 
     if not g_active_sensor_objects and not g_sensor_configs_from_file:
         logging.warning("No sensors configured or initialized. The application might not send useful data.")
@@ -328,50 +739,93 @@ def main():
     command_thread.start()
 
     sensor_data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    logging.info(f"Sending sensor data as JSON to {HOST_IP_PC}:{HOST_PORT_PC}")
+    set_socket_buffer(sensor_data_socket, socket.SO_SNDBUF, SO_SNDBUFFORCE, SENSOR_SOCKET_SNDBUF, "SO_SNDBUF")
+    try:
+        sensor_data_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, SENSOR_SOCKET_TOS)
+        if hasattr(socket, "SO_PRIORITY"):
+            sensor_data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, SENSOR_SOCKET_PRIORITY)
+    except OSError as e:
+        logging.warning(f"Could not set packet priority on sensor data socket: {e}")
+    # The destination is fixed: connect once so each send skips the address parsing/lookup
+    sensor_data_socket.connect((HOST_IP_PC, HOST_PORT_PC))
+    logging.info(f"Sending sensor data as {PAYLOAD_FORMAT} to {HOST_IP_PC}:{HOST_PORT_PC}")
+    if PAYLOAD_FORMAT == 'binary':
+        try:
+            sensor_data_socket.send(build_hello_payload()) # Sensor ID table for the binary frames
+        except OSError as e:
+            logging.warning(f"Could not send hello packet: {e}")
+    # Chunks the drained queue into sendmmsg() calls of up to SEND_BATCH_MAX
+    # (created after the hello packet: with UDP GSO on, larger sends would be cut into segments)
+    sender = BatchSender(sensor_data_socket, max_payload_size(), gso=SEND_UDP_GSO)
+
+    # The main thread samples; a separate thread owns the socket
+    sender_thread = threading.Thread(target=sensor_sender, args=(sender,), name="SenderThread", daemon=True)
+    sender_thread.start()
+
+    # The sampler runs on the main thread: own core, real-time priority
+    pin_current_thread(SAMPLER_CPU)
+    enable_realtime_scheduling(SAMPLER_FIFO_PRIORITY)
 
-    packet_count = 0
     start_time = time.monotonic()
+    next_deadline = start_time # Absolute pacing: each tick is due one period after the previous deadline
+    last_delay_s = None
+    next_log_count = 1 # Sender counts arrive in batches: log on crossing the interval, not on exact multiples
+    # Hot-loop references bound once as locals (LOAD_FAST instead of global + attribute lookups)
+    monotonic = time.monotonic
+    sleep = time.sleep
+    stop_requested = g_stop_command_listener.is_set
+    read_payload = read_sensors_and_build_payload
+    send_queue = g_send_queue
+    enqueue = g_send_queue.append
+    send_ready = g_send_ready.set
     
     try:
-        while not g_stop_command_listener.is_set():
-            with g_frequency_lock:
-                current_target_freq = g_send_frequency_hz
+        while not stop_requested():
+            current_target_freq = g_send_frequency_hz
             
             if current_target_freq > 0:
                 desired_delay_s = 1.0 / current_target_freq
             else:
                 desired_delay_s = 0.0
 
-            loop_start_time = time.monotonic()
+            if desired_delay_s != last_delay_s:
+                next_deadline = monotonic() # Frequency changed: restart the schedule from now
+                last_delay_s = desired_delay_s
+                # Log roughly every 5 s of packets; only recomputed when the frequency changes
+                log_interval_packets = max(1, int(current_target_freq * 5)) if current_target_freq > 0.1 else 200
+
+            loop_start_time = monotonic()
             
-            udp_payload_json = read_sensors_and_build_json()
+            udp_payload = read_payload()
             
-            if udp_payload_json:
-                try:
-                    sensor_data_socket.sendto(udp_payload_json.encode('utf-8'), (HOST_IP_PC, HOST_PORT_PC))
-                    packet_count += 1
-                except socket.error as e:
-                    logging.error(f"MAIN_LOOP: Socket error sending sensor data: {e}")
-                except Exception as e:
-                    logging.error(f"MAIN_LOOP: Unexpected error sending sensor data: {e}", exc_info=logging.getLogger().level == logging.DEBUG)
+            if udp_payload:
+                if len(send_queue) == SEND_QUEUE_MAX:
+                    g_dropped_packets += 1 # Sender is behind: the deque drops the oldest payload
+                enqueue(udp_payload)
+                if len(send_queue) >= SEND_BATCH_SIZE:
+                    send_ready()
             
-            loop_time_taken = time.monotonic() - loop_start_time
+            now = monotonic()
+            loop_time_taken = now - loop_start_time
             
             if desired_delay_s > 0:
-                sleep_duration = desired_delay_s - loop_time_taken
+                # Sleep until the absolute deadline, so sleep overshoot doesn't accumulate into drift
+                next_deadline += desired_delay_s
+                sleep_duration = next_deadline - now
                 if sleep_duration > 0:
-                    time.sleep(sleep_duration)
+                    sleep(sleep_duration)
+                elif sleep_duration < -desired_delay_s:
+                    next_deadline = now # More than a full period late: skip the missed ticks instead of bursting
 
             # Log stats periodically
-            log_interval_packets = (int(current_target_freq * 5) if current_target_freq > 0.1 else 200)
-            if log_interval_packets < 1: log_interval_packets = 1 # Avoid division by zero or too frequent logging
-            if packet_count > 0 and packet_count % log_interval_packets == 0 :
-                current_run_time = time.monotonic() - start_time
+            packet_count = g_sent_packets
+            if packet_count >= next_log_count:
+                next_log_count = packet_count + log_interval_packets
+                current_run_time = monotonic() - start_time
                 if current_run_time > 0:
                     actual_freq = packet_count / current_run_time
                     freq_target_str = f"{current_target_freq:.1f} Hz" if current_target_freq > 0 else "Max"
-                    logging.info(f"Sent {packet_count} sensor packets. Avg Freq: {actual_freq:.2f} Hz (Target: {freq_target_str}). Loop: {loop_time_taken*1000:.3f} ms")
+                    logging.info(f"Sent {packet_count} sensor packets. Avg Freq: {actual_freq:.2f} Hz (Target: {freq_target_str}). Loop: {loop_time_taken*1000:.3f} ms. Dropped: {g_dropped_packets}")
 
     except KeyboardInterrupt:
         logging.info("MAIN_LOOP: Program interrupted by user. Initiating shutdown.")
@@ -379,16 +833,21 @@ def main():
         logging.error(f"MAIN_LOOP: An unhandled exception occurred: {e}", exc_info=True)
     finally:
         logging.info("MAIN_LOOP: Stopping command listener thread...")
-        g_stop_command_listener.set() 
+        request_stop() 
         if command_thread.is_alive():
             command_thread.join(timeout=2.0) 
             if command_thread.is_alive():
                 logging.warning("MAIN_LOOP: Command listener thread did not terminate gracefully.")
 
+        g_send_ready.set() # Wake the sender for its final drain
+        sender_thread.join(timeout=2.0)
+        if sender_thread.is_alive():
+            logging.warning("MAIN_LOOP: Sender thread did not terminate gracefully.")
         logging.info("MAIN_LOOP: Closing sensor data UDP socket.")
         sensor_data_socket.close()
         
         current_run_time = time.monotonic() - start_time
+        packet_count = g_sent_packets
         if current_run_time > 0 and packet_count > 0:
             actual_freq = packet_count / current_run_time
             logging.info(f"Total sensor packets sent: {packet_count}")
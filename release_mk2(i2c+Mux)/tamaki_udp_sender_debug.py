@@ -1,18 +1,23 @@
 # SPDX-FileCopyrightText: 2023 Your Name/Org
 # SPDX-License-Identifier: MIT
 
+import os
 import time
 import board
 import socket
 import adafruit_tca9548a
 import adafruit_tlv493d
-import json
 import logging
 
 # --- Minimal Configuration ---
 TARGET_HOST_IP = "192.168.6.51"  # <--- SET YOUR PC's IP ADDRESS
 TARGET_HOST_PORT = 8000
 SEND_INTERVAL_SECONDS = 0.05  # Send data every 0.1 seconds (10 Hz)
+# Capped by net.core.wmem_max: sudo sysctl -w net.core.wmem_max=12582912
+UDP_SNDBUF = 4 * 1024 * 1024
+# Same core and priority as the sampler in tamaki_udp_sender.py, so read timings here are comparable
+LOOP_CPU = 3
+LOOP_FIFO_PRIORITY = 50 # SCHED_FIFO needs root or CAP_SYS_NICE
 
 # --- Setup Logging (Basic) ---
 logging.basicConfig(
@@ -83,12 +88,34 @@ def initialize_sensors_minimal():
     return False
 
 
+# --- Scheduling ---
+def pin_and_prioritize():
+    # Linux only; best effort so the script still runs elsewhere or without root
+    try:
+        os.sched_setaffinity(0, {LOOP_CPU})
+        logging.info(f"Pinned to CPU {LOOP_CPU}.")
+    except (AttributeError, OSError) as e:
+        logging.warning(f"Could not pin to CPU {LOOP_CPU}: {e}")
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(LOOP_FIFO_PRIORITY))
+        logging.info(f"Running with SCHED_FIFO priority {LOOP_FIFO_PRIORITY}.")
+    except (AttributeError, OSError) as e:
+        logging.warning(f"Could not enable SCHED_FIFO (run as root?): {e}")
+
+# --- Payload Template ---
+# The schema is fixed once the sensors are known, so the JSON is a bytes %-template built once:
+# {"Sensor":{"Sensor_0":[{"axis":"x","val":1.234},...],...}}. Each send only formats the floats.
+def build_payload_template(sensor_names):
+    sensor_fragments = []
+    for name in sensor_names:
+        sensor_fragments.append(f'"{name}":[{{"axis":"x","val":%.3f}},{{"axis":"y","val":%.3f}},{{"axis":"z","val":%.3f}}]')
+    return ('{"Sensor":{' + ",".join(sensor_fragments) + '}}').encode('ascii')
+
 # --- UDP Sender Function ---
-def send_udp_data(udp_socket, data_dict):
+def send_udp_data(udp_socket, payload):
     try:
-        payload = json.dumps(data_dict)
-        udp_socket.sendto(payload.encode('utf-8'), (TARGET_HOST_IP, TARGET_HOST_PORT))
-        logging.debug(f"UDP Sent: {payload}")
+        udp_socket.send(payload) # Socket is connected to the target in main
+        logging.debug("UDP Sent: %s", payload)
     except Exception as e:
         logging.error(f"Error sending UDP data: {e}")
 
@@ -99,26 +126,35 @@ if __name__ == "__main__":
         exit()
 
     udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UDP_SNDBUF)
+    logging.debug(f"SO_SNDBUF: {udp_sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)} bytes")
+    # Single destination: connect once so each send() skips the address copy and route lookup
+    udp_sock.connect((TARGET_HOST_IP, TARGET_HOST_PORT))
     logging.info(f"--- Starting Main Loop (Sending to {TARGET_HOST_IP}:{TARGET_HOST_PORT}) ---")
 
+    active_sensors = []
+    if sensor0_direct:
+        active_sensors.append("Sensor_0")
+    if sensor1_tca_ch0:
+        active_sensors.append("Sensor_1")
+    payload_template = build_payload_template(active_sensors)
+    values = [0.0] * (3 * len(active_sensors)) # x, y, z per active sensor, in template order
+    s1_base = 3 if sensor0_direct else 0
+
+    pin_and_prioritize()
+    next_deadline = time.monotonic() # Absolute schedule: a slow iteration doesn't push back every later send
+
     try:
         while True:
-            sensor_data_payload = {"Sensor": {}}
-            
             # --- Read Sensor 0 (Direct I2C) ---
             if sensor0_direct:
                 logging.debug("Reading Sensor 0 (Direct I2C)...")
                 try:
-                    s0_x, s0_y, s0_z = sensor0_direct.magnetic
-                    sensor_data_payload["Sensor"]["Sensor_0"] = [
-                        {"axis": "x", "val": round(s0_x, 3)},
-                        {"axis": "y", "val": round(s0_y, 3)},
-                        {"axis": "z", "val": round(s0_z, 3)}
-                    ]
+                    s0_x, s0_y, s0_z = values[0:3] = sensor0_direct.magnetic
                     logging.debug(f"  Sensor 0 Data: X={s0_x:.3f}, Y={s0_y:.3f}, Z={s0_z:.3f}")
                 except Exception as e:
                     logging.warning(f"  Error reading Sensor 0: {e}")
-                    sensor_data_payload["Sensor"]["Sensor_0"] = [{"axis": "x", "val":0.0},{"axis": "y", "val":0.0},{"axis": "z", "val":0.0}] # Placeholder
+                    values[0:3] = (0.0, 0.0, 0.0) # Placeholder
 
             # --- Optional DELAY 1 ---
             time.sleep(0.05) # <--- UNCOMMENT TO TEST DELAY AFTER DIRECT READ
@@ -127,25 +163,25 @@ if __name__ == "__main__":
             if sensor1_tca_ch0:
                 logging.debug("Reading Sensor 1 (TCA Channel 0)...")
                 try:
-                    s1_x, s1_y, s1_z = sensor1_tca_ch0.magnetic
-                    sensor_data_payload["Sensor"]["Sensor_1"] = [
-                        {"axis": "x", "val": round(s1_x, 3)},
-                        {"axis": "y", "val": round(s1_y, 3)},
-                        {"axis": "z", "val": round(s1_z, 3)}
-                    ]
+                    s1_x, s1_y, s1_z = values[s1_base:s1_base + 3] = sensor1_tca_ch0.magnetic
                     logging.debug(f"  Sensor 1 Data: X={s1_x:.3f}, Y={s1_y:.3f}, Z={s1_z:.3f}")
                 except Exception as e:
                     logging.warning(f"  Error reading Sensor 1: {e}")
-                    sensor_data_payload["Sensor"]["Sensor_1"] = [{"axis": "x", "val":0.0},{"axis": "y", "val":0.0},{"axis": "z", "val":0.0}] # Placeholder
+                    values[s1_base:s1_base + 3] = (0.0, 0.0, 0.0) # Placeholder
 
             # --- Optional DELAY 2 ---
             # time.sleep(0.05) # <--- UNCOMMENT TO TEST DELAY AFTER TCA READ
 
             # Send data if any sensor was read
-            if sensor_data_payload["Sensor"]:
-                send_udp_data(udp_sock, sensor_data_payload)
+            if values:
+                send_udp_data(udp_sock, payload_template % tuple(values))
             
-            time.sleep(SEND_INTERVAL_SECONDS)
+            next_deadline += SEND_INTERVAL_SECONDS
+            remaining = next_deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            elif remaining < -SEND_INTERVAL_SECONDS:
+                next_deadline = time.monotonic() # More than a full interval late: skip missed sends
 
     except KeyboardInterrupt:
         logging.info("Program terminated by user.")
@@ -2,4 +2,7 @@
 
 # This will run the Python script in the virtualenv, inside the 'tamaki' screen
 # This assume sudoers has been modified.
-screen -S tamaki -dm bash -c "source env/bin/activate && python3 tamaki_udp_sender.py"
\ No newline at end of file
+# The interpreter can be overridden, e.g. PYTHON=pypy3 ./startTamaki.sh to run under PyPy
+# (the env must then be created with pypy3 -m venv env; orjson does not support PyPy, so the JSON shim falls back).
+PYTHON="${PYTHON:-python3}"
+screen -S tamaki -dm bash -c "source env/bin/activate && $PYTHON tamaki_udp_sender.py"
\ No newline at end of file
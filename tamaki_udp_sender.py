@@ -7,11 +7,40 @@ import board
 import socket
 import adafruit_tca9548a
 import adafruit_tlv493d
-import json
 import os
+import errno
+import sys
+import ctypes
 import threading
+import selectors
 import logging
 import configparser
+import struct
+
+# --- JSON Backend (command listener / status replies) ---
+# orjson (Rust, returns bytes) is several times faster than the stdlib on the Pi. Its wheels need a
+# 64-bit OS / recent glibc, so fall back to ujson (C, armv6/v7 wheels), then to the stdlib json.
+try:
+    import orjson
+    json_dumps = orjson.dumps # -> bytes
+    json_loads = orjson.loads # Accepts bytes directly
+    JSONDecodeError = orjson.JSONDecodeError
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        def json_dumps(obj):
+            return ujson.dumps(obj).encode('utf-8')
+        json_loads = ujson.loads # Accepts bytes directly
+        JSONDecodeError = getattr(ujson, "JSONDecodeError", ValueError) # Older ujson raises plain ValueError
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        import json
+        def json_dumps(obj):
+            return json.dumps(obj).encode('utf-8')
+        json_loads = json.loads
+        JSONDecodeError = json.JSONDecodeError
+        JSON_BACKEND = "json"
 
 # --- Setup Logging ---
 logging.basicConfig(
@@ -27,55 +56,188 @@ CMD_SHUTDOWN = "shutdown"
 CMD_SET_FREQUENCY = "set_frequency"
 CMD_GET_STATUS = "get_status" # Example of a new potential command
 
+# --- Socket Tuning ---
+SENSOR_SOCKET_SNDBUF = 4 * 1024 * 1024 # Capped by net.core.wmem_max: sudo sysctl -w net.core.wmem_max=12582912
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10) # Linux values; not exported by every Python build
+IP_PMTUDISC_DONT = getattr(socket, "IP_PMTUDISC_DONT", 0)
+SENSOR_SOCKET_PRIORITY = 6 # SO_PRIORITY: highest value allowed without CAP_NET_ADMIN
+SENSOR_SOCKET_TOS = 0xB8 # DSCP EF (expedited forwarding) << 2: priority queues on WMM Wi-Fi / QoS switches
+SEND_BATCH_MAX = 16 # Datagrams per sendmmsg() call; SendBatchSize in config.ini is clamped to this
+
+# --- I2C Addresses ---
+TCA_ADDRESS = 0x70
+TCA_NUM_CHANNELS = 8
+TLV_ADDRESS = 0x5E
+
+# --- Thread Placement (Pi: cores 0-3) ---
+# For the least jitter, keep other work off the send core: add isolcpus=3 to /boot/firmware/cmdline.txt
+SEND_LOOP_CPU = 3
+SENSOR_READER_CPU = 2
+COMMAND_LISTENER_CPU = 1
+SEND_LOOP_FIFO_PRIORITY = 50 # SCHED_FIFO priority for the send loop (needs root or CAP_SYS_NICE)
+
+STATS_LOG_INTERVAL_S = 5.0 # Seconds between stats lines, logged from the command listener thread
+
 # --- Global Variables & Shared Objects ---
-g_send_frequency_hz = 0.0  # Will be set from config
-g_frequency_lock = threading.Lock()
+g_send_frequency_hz = 0.0  # Will be set from config. Single writer (command listener), read every tick
+                           # by the send loop: a float rebind/load is atomic under the GIL, so no lock.
 g_stop_command_listener = threading.Event()
-g_sensor_configs = [] # To store sensor objects and their IDs
+g_stop_pipe_r, g_stop_pipe_w = os.pipe() # Readable once stop is requested: wakes the command listener's select()
+# Configured sensors as parallel lists indexed by slot (None in g_sensor_objs if init failed)
+g_sensor_objs = []
+g_sensor_ids = []
+g_sensor_channels = []
+g_sensor_devices = [] # Each sensor's I2CDevice (None if init failed), read directly by read_tlv493d_xyz()
+g_sensor_raw = [] # Preallocated register buffer per sensor
 g_initialized_sensor_count = 0
 g_enable_system_commands = False # Will be set from config
+g_payload_template = b"" # Prebuilt JSON payload bytes %-template, see build_payload_template()
+g_binary_packer = None # struct.Struct for PayloadFormat = binary, see build_payload_template()
+g_send_buf = None # Binary: SAMPLES_PER_PACKET frames packed in place, reused for every datagram
+g_send_view = None
+g_pending_json = [] # JSON: encoded samples waiting for the next datagram (newline-separated)
+g_pending_count = 0 # Samples queued for the next datagram
+g_sensor_values = [] # Flat x, y, z per configured sensor, the reader thread's working buffer
+g_latest_sample = None # Last complete set of sensor values (tuple), replaced whole by the reader thread
+g_new_sample = threading.Event() # Set by the reader thread after each published sample
+g_value_offset = 0 # 1 when g_sensor_values[0] holds the sample timestamp
+# Send loop counters: only bumped on the hot path, formatted and logged by stats_logger()
+g_stats = {"sent": 0, "missed": 0, "dropped": 0, "last_loop_ms": 0.0}
+g_start_time = None # time.monotonic() when the send loop started
 
 # --- Configuration Loading ---
+def config_fatal(message):
+    logging.error(f"{message} Exiting.")
+    exit(1)
+
 def load_configuration():
-    global HOST_IP_PC, HOST_PORT_PC, PI_COMMAND_PORT, NUM_SENSORS
+    global HOST_IP_PC, HOST_PORT_PC, PI_COMMAND_PORT, NUM_SENSORS, SAMPLES_PER_PACKET, PAYLOAD_FORMAT, SEND_BATCH_SIZE
+    global SEND_UDP_GSO
     global g_send_frequency_hz, g_enable_system_commands
 
     config = configparser.ConfigParser()
     config_file_path = 'config.ini'
 
-    if not os.path.exists(config_file_path):
-        logging.error(f"Configuration file '{config_file_path}' not found. Exiting.")
-        exit(1)
-    
     try:
-        config.read(config_file_path)
+        # One open + read (no separate exists() check): a missing file is reported by the open itself
+        with open(config_file_path, 'r') as f:
+            config.read_string(f.read(), source=config_file_path)
 
         HOST_IP_PC = config.get('Network', 'HostIPPC', fallback='127.0.0.1')
         HOST_PORT_PC = config.getint('Network', 'HostPortPC', fallback=8000)
         PI_COMMAND_PORT = config.getint('Network', 'PiCommandPort', fallback=8001)
+        PAYLOAD_FORMAT = config.get('Network', 'PayloadFormat', fallback='json').strip().lower()
+        if PAYLOAD_FORMAT not in ('json', 'binary'):
+            raise ValueError(f"PayloadFormat must be 'json' or 'binary', got '{PAYLOAD_FORMAT}'")
+        SEND_BATCH_SIZE = min(max(1, config.getint('Network', 'SendBatchSize', fallback=1)), SEND_BATCH_MAX)
+        SEND_UDP_GSO = config.getboolean('Network', 'UdpGso', fallback=False)
         
         NUM_SENSORS = config.getint('Sensors', 'NumSensors', fallback=0)
         g_send_frequency_hz = config.getfloat('Sensors', 'InitialSendFrequencyHz', fallback=0.0)
+        SAMPLES_PER_PACKET = max(1, config.getint('Sensors', 'SamplesPerPacket', fallback=1))
 
         g_enable_system_commands = config.getboolean('System', 'EnableSystemCommands', fallback=False)
         logging.info(f"System commands (reboot/shutdown) enabled: {g_enable_system_commands}")
 
+    except FileNotFoundError:
+        config_fatal(f"Configuration file '{config_file_path}' not found.")
     except (configparser.Error) as e:
-        logging.error(f"Error parsing configuration file '{config_file_path}': {e}. Exiting.")
-        exit(1)
+        config_fatal(f"Error parsing configuration file '{config_file_path}': {e}.")
     except ValueError as e:
-        logging.error(f"Configuration error: Invalid value in '{config_file_path}': {e}. Exiting.")
-        exit(1)
+        config_fatal(f"Configuration error: Invalid value in '{config_file_path}': {e}.")
     
     logging.info("Configuration loaded successfully.")
     logging.info(f"  Target PC IP: {HOST_IP_PC}, Port: {HOST_PORT_PC}")
     logging.info(f"  Pi Command Port: {PI_COMMAND_PORT}")
+    logging.info(f"  Payload Format: {PAYLOAD_FORMAT}")
     logging.info(f"  Number of Sensors: {NUM_SENSORS}")
     logging.info(f"  Initial Send Frequency: {g_send_frequency_hz} Hz")
+    logging.info(f"  Samples Per Packet: {SAMPLES_PER_PACKET}")
+    logging.info(f"  Send Batch Size: {SEND_BATCH_SIZE} datagram(s)")
+
+def request_stop():
+    g_stop_command_listener.set()
+    os.write(g_stop_pipe_w, b"x")
+
+# --- Scheduling Helpers ---
+def pin_current_thread(cpu):
+    # Linux only; best effort so the script still runs elsewhere
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+            logging.info(f"{threading.current_thread().name} pinned to CPU {cpu}.")
+        except OSError as e:
+            logging.warning(f"Could not pin {threading.current_thread().name} to CPU {cpu}: {e}")
+
+def enable_realtime_scheduling(priority):
+    # Call from the thread itself, after other threads are started (new threads inherit the policy)
+    if hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logging.info(f"{threading.current_thread().name} running with SCHED_FIFO priority {priority}.")
+        except OSError as e:
+            logging.warning(f"Could not enable SCHED_FIFO (run as root?): {e}")
+
+# --- Absolute-Deadline Pacing ---
+# Sleeping for "period - time spent" drifts by the wake-up latency every cycle. The send loop instead
+# advances an absolute CLOCK_MONOTONIC deadline (the clock behind time.monotonic_ns() on Linux) and
+# sleeps until it with clock_nanosleep(TIMER_ABSTIME); time.sleep is the fallback elsewhere.
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+EINTR = 4
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_clock_nanosleep = None
+if sys.platform.startswith("linux"):
+    try:
+        _clock_nanosleep = ctypes.CDLL("libc.so.6", use_errno=True).clock_nanosleep
+        _clock_nanosleep.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+        _clock_nanosleep.restype = ctypes.c_int
+    except (OSError, AttributeError) as e:
+        logging.warning(f"clock_nanosleep unavailable ({e}), falling back to time.sleep().")
+_deadline_ts = _Timespec() # Send loop's; other threads pass their own, see sensor_reader()
+
+def sleep_until_ns(deadline_ns, ts=_deadline_ts):
+    # deadline_ns is a time.monotonic_ns() timestamp
+    if _clock_nanosleep is not None:
+        ts.tv_sec, ts.tv_nsec = divmod(deadline_ns, 1_000_000_000)
+        while _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ts, None) == EINTR:
+            pass # Interrupted by a signal: the deadline is absolute, so just retry
+        return
+    remaining_ns = deadline_ns - time.monotonic_ns()
+    if remaining_ns > 0:
+        time.sleep(remaining_ns / 1e9)
 
 # --- Sensor Initialization ---
+def probe_sensor_channels(num_channels):
+    # Presence check for every channel under a single bus lock: write the mux mask directly and
+    # send an empty write to the TLV493D address, so empty channels cost one NACK instead of a
+    # failed driver init each. Returns the set of channels that ACKed, or None if the probe itself
+    # failed (then every channel is tried with the driver as before).
+    present = set()
+    while not i2c.try_lock():
+        time.sleep(0)
+    try:
+        for ch in range(min(num_channels, TCA_NUM_CHANNELS)):
+            i2c.writeto(TCA_ADDRESS, bytes([1 << ch]))
+            try:
+                i2c.writeto(TLV_ADDRESS, b'') # Empty write = probe
+                present.add(ch)
+            except OSError:
+                pass
+        i2c.writeto(TCA_ADDRESS, b'\x00') # Leave all channels off, as the TCA driver expects
+    except OSError as e:
+        logging.warning(f"Channel probe failed ({e}), initializing every channel.")
+        return None
+    finally:
+        i2c.unlock()
+    logging.info(f"TLV493D found on TCA channel(s): {sorted(present)}")
+    return present
+
 def initialize_hardware_and_sensors():
-    global i2c, tca, g_sensor_configs, g_initialized_sensor_count, NUM_SENSORS
+    global i2c, tca, g_initialized_sensor_count, NUM_SENSORS
 
     try:
         i2c = board.I2C()
@@ -84,199 +246,573 @@ def initialize_hardware_and_sensors():
         exit(1)
     
     try:
-        tca = adafruit_tca9548a.TCA9548A(i2c)
+        tca = adafruit_tca9548a.TCA9548A(i2c, TCA_ADDRESS)
     except Exception as e: # Broad exception for TCA init issues (e.g., not found)
         logging.error(f"Error initializing TCA9548A multiplexer: {e}. Is it connected? Exiting.")
         exit(1)
 
     logging.info(f"Attempting to initialize up to {NUM_SENSORS} TLV493D sensor(s)...")
+    present = probe_sensor_channels(NUM_SENSORS)
     for i in range(NUM_SENSORS):
         sensor_id_str = f"Sensor_{i}"
         sensor_obj = None
-        try:
-            logging.debug(f"  Initializing sensor for TCA channel {i} (ID: '{sensor_id_str}')...")
-            sensor_obj = adafruit_tlv493d.TLV493D(tca[i])
-            g_initialized_sensor_count += 1
-            logging.info(f"  Sensor '{sensor_id_str}' initialized successfully on channel {i}.")
-        except ValueError as e: # Often due to no device on I2C address
-            logging.warning(f"  Could not initialize sensor '{sensor_id_str}' on TCA channel {i}: {e}")
-        except Exception as e:
-            logging.error(f"  Unexpected error initializing sensor '{sensor_id_str}' on TCA channel {i}: {e}")
+        if present is not None and i not in present:
+            logging.warning(f"  No TLV493D at 0x{TLV_ADDRESS:02X} on TCA channel {i}: skipping sensor '{sensor_id_str}'.")
+        else:
+            try:
+                logging.debug(f"  Initializing sensor for TCA channel {i} (ID: '{sensor_id_str}')...")
+                sensor_obj = adafruit_tlv493d.TLV493D(tca[i])
+                g_initialized_sensor_count += 1
+                logging.info(f"  Sensor '{sensor_id_str}' initialized successfully on channel {i}.")
+            except ValueError as e: # Often due to no device on I2C address
+                logging.warning(f"  Could not initialize sensor '{sensor_id_str}' on TCA channel {i}: {e}")
+            except Exception as e:
+                logging.error(f"  Unexpected error initializing sensor '{sensor_id_str}' on TCA channel {i}: {e}")
         
-        g_sensor_configs.append({'id_str': sensor_id_str, 'obj': sensor_obj, 'channel': i})
+        g_sensor_objs.append(sensor_obj)
+        g_sensor_devices.append(sensor_obj.i2c_device if sensor_obj else None)
+        g_sensor_raw.append(bytearray(TLV_READ_LEN))
+        g_sensor_ids.append(sensor_id_str)
+        g_sensor_channels.append(i)
 
     if g_initialized_sensor_count == 0 and NUM_SENSORS > 0:
         logging.warning("No sensors were successfully initialized. Will send 0s for all.")
     else:
         logging.info(f"Successfully initialized {g_initialized_sensor_count}/{NUM_SENSORS} sensor(s).")
 
-# --- Sensor Reading and JSON Building ---
-def read_sensors_and_build_json():
-    payload_dict = {"Sensor": {}}
-    for config in g_sensor_configs:
-        sensor_obj = config['obj']
-        sensor_id_str = config['id_str']
-        sensor_data_list = []
-        mag_x, mag_y, mag_z = 0.0, 0.0, 0.0 # Default to 0.0
-
-        if sensor_obj:
+# --- Sensor Reading and Payload Building ---
+BINARY_PAYLOAD_VERSION = 1
+JSON_PAYLOAD_VERSION = 2 # v1 (no "v" key): "Sensor_0":[{"axis":"x","val":1.234},...]; v2: "Sensor_0":[x,y,z]
+ZERO_XYZ = (0.0, 0.0, 0.0)
+TLV_READ_LEN = 7          # Bx, By, Bz high bytes, temp/frame/channel, Bx/By low, flags/Bz low, temp low
+TLV_UT_PER_LSB = 98.0     # 0.098 mT per LSB, same scaling as adafruit_tlv493d.magnetic (uT)
+TLV_MAX_ABS_UT = 2048 * TLV_UT_PER_LSB # 12-bit two's complement extreme: -2048 LSB = -200.7 mT
+
+def read_tlv493d_xyz(device, raw):
+    # One 7-byte register read decoded with inline bit math. TLV493D.magnetic reads 10 bytes and
+    # extracts each field through a generic mask/shift lookup loop, which dominated the reader's time.
+    with device as dev:
+        dev.readinto(raw)
+    x = (raw[0] << 4) | (raw[4] >> 4)
+    y = (raw[1] << 4) | (raw[4] & 0x0F)
+    z = (raw[2] << 4) | (raw[5] & 0x0F)
+    # Sign-extend the 12-bit two's complement values
+    return (((x ^ 0x800) - 0x800) * TLV_UT_PER_LSB,
+            ((y ^ 0x800) - 0x800) * TLV_UT_PER_LSB,
+            ((z ^ 0x800) - 0x800) * TLV_UT_PER_LSB)
+
+def build_payload_template():
+    # The payload schema is fixed once sensors are initialized, so build it as a single bytes
+    # %-template: {"v":2,"Sensor":{"Sensor_0":[x,y,z],...}}. Each tick only substitutes the floats,
+    # straight into bytes, with no dict/list building, JSON encoder call or str -> bytes encode. The flat [x,y,z] arrays replace the v1
+    # per-axis {"axis":"x","val":...} objects, about a third of the bytes per sensor.
+    # When several samples share a datagram, each one is prefixed with its monotonic timestamp "t".
+    global g_payload_template, g_sensor_values, g_value_offset, g_binary_packer, g_send_buf, g_send_view
+    g_value_offset = 1 if SAMPLES_PER_PACKET > 1 else 0
+    sensor_fragments = []
+    for sensor_id_str in g_sensor_ids:
+        sensor_fragments.append('"' + sensor_id_str + '":[%.3f,%.3f,%.3f]')
+    header = '{"v":' + str(JSON_PAYLOAD_VERSION) + ',' + ('"t":%.6f,' if g_value_offset else '')
+    g_payload_template = (header + '"Sensor":{' + ",".join(sensor_fragments) + '}}').encode('ascii')
+    g_sensor_values = [0.0] * (g_value_offset + 3 * len(g_sensor_objs))
+
+    # PayloadFormat = binary: fixed-size big-endian frame, 3 + [8] + 12 * N bytes
+    #   uint8 version (BINARY_PAYLOAD_VERSION), uint8 flags (bit 0: timestamp present), uint8 sensor count,
+    #   [float64 monotonic timestamp "t" when flag bit 0], then float32 x, y, z per sensor in config order.
+    # Frames batched by SamplesPerPacket are concatenated with no separator.
+    if PAYLOAD_FORMAT == 'binary':
+        g_binary_packer = struct.Struct("!BBB" + ("d" if g_value_offset else "") + "fff" * len(g_sensor_objs))
+        g_send_buf = bytearray(g_binary_packer.size * SAMPLES_PER_PACKET)
+        g_send_view = memoryview(g_send_buf)
+
+def queue_latest_sample():
+    # Binary frames are packed straight into the reused send buffer (no per-tick bytes object);
+    # JSON still needs one bytes object per sample since %-formatting can't write into a buffer.
+    global g_pending_count
+    if g_binary_packer is not None:
+        g_binary_packer.pack_into(g_send_buf, g_pending_count * g_binary_packer.size,
+                                  BINARY_PAYLOAD_VERSION, g_value_offset, len(g_sensor_objs), *g_latest_sample)
+    else:
+        g_pending_json.append(g_payload_template % g_latest_sample)
+    g_pending_count += 1
+
+def take_pending_payload():
+    # Returns the queued samples as one datagram payload and resets the queue. The binary memoryview
+    # aliases g_send_buf: send it before queueing the next sample.
+    global g_pending_count
+    if g_binary_packer is not None:
+        payload = g_send_view[:g_pending_count * g_binary_packer.size]
+    else:
+        payload = b"\n".join(g_pending_json)
+        g_pending_json.clear()
+    g_pending_count = 0
+    return payload
+
+def max_payload_size():
+    # Longest datagram take_pending_payload() can return. TLV493D readings stay within
+    # +/-TLV_MAX_ABS_UT ("-200704.000" uT, 11 characters) and the timestamp is seconds of uptime,
+    # so 16 characters per float is safe.
+    if g_binary_packer is not None:
+        return len(g_send_buf)
+    field_len = max(16, len(f"{-TLV_MAX_ABS_UT:.3f}"))
+    return (len(g_payload_template) + field_len * len(g_sensor_values) + 1) * SAMPLES_PER_PACKET
+
+# --- Batched UDP Sender (sendmmsg) ---
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+# UDP generic segmentation offload (Linux 4.18+): one send() of N equal-size segments leaves as N datagrams
+SOL_UDP = getattr(socket, "SOL_UDP", 17) # Linux values; not exported by every Python build
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GSO_MAX_BYTES = 65000 # A GSO send must still fit one UDP length field (minus headers)
+IP_MTU = getattr(socket, "IP_MTU", 14) # Path MTU of a connected socket (Linux)
+PATH_MTU_FALLBACK = 1500 # Assumed when the kernel can't report it
+IPV4_UDP_OVERHEAD = 28 # IPv4 (20) + UDP (8) headers: each GSO segment must fit one datagram
+
+class BatchSender:
+    """Queues UDP payloads and flushes them with a single sendmmsg(2) call on Linux.
+    Payloads are copied into preallocated slots whose addresses are wired into the iovecs once,
+    so a flush allocates nothing. Falls back to one send() per payload elsewhere, or if libc has
+    no sendmmsg. The socket must already be connect()ed: messages carry no destination address.
+    With gso=True (and kernel support) a flush is a single send() instead: every payload but the
+    last is padded to slot_size with ASCII spaces (legal trailing whitespace in JSON; binary frames
+    are fixed-size and never padded) and the kernel cuts the buffer back into one datagram each.
+    If a GSO send fails (EIO: no TX checksum offload on the interface, EINVAL: segment too large)
+    GSO is switched off and the batch goes out through sendmmsg() instead."""
+
+    def __init__(self, sock, slot_size, batch_size, gso=False):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.count = 0
+        self.slots = [bytearray(slot_size) for _ in range(batch_size)]
+        self.slot_views = [memoryview(slot) for slot in self.slots]
+        self.lengths = [0] * batch_size
+        self.gso_view = None
+        if gso:
+            self.enable_gso(slot_size)
+        self.libc = None
+        if sys.platform.startswith("linux"):
             try:
-                mag_x, mag_y, mag_z = sensor_obj.magnetic
+                self.libc = ctypes.CDLL("libc.so.6", use_errno=True)
+                self.libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+                self.libc.sendmmsg.restype = ctypes.c_int
+            except (OSError, AttributeError) as e:
+                logging.warning(f"sendmmsg unavailable ({e}), falling back to send().")
+                self.libc = None
+        if self.libc is None:
+            return
+
+        self.iovecs = (_IOVec * batch_size)()
+        self.msgs = (_MMsgHdr * batch_size)()
+        # Keep the ctypes views alive: they pin the slots so they can't be resized/moved
+        self.ctypes_views = [(ctypes.c_char * slot_size).from_buffer(slot) for slot in self.slots]
+        for i, view in enumerate(self.ctypes_views):
+            self.iovecs[i].iov_base = ctypes.addressof(view)
+            hdr = self.msgs[i].msg_hdr # msg_name stays NULL: the connected socket supplies the peer
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.fd = sock.fileno()
+
+    def enable_gso(self, slot_size):
+        if slot_size * self.batch_size > UDP_GSO_MAX_BYTES:
+            logging.warning(f"UDP GSO disabled: {self.batch_size} x {slot_size} bytes exceeds one GSO send.")
+            return
+        try:
+            path_mtu = self.sock.getsockopt(socket.IPPROTO_IP, IP_MTU) # Valid once connected
+        except OSError:
+            path_mtu = PATH_MTU_FALLBACK
+        if slot_size > path_mtu - IPV4_UDP_OVERHEAD:
+            logging.warning(f"UDP GSO disabled: {slot_size}-byte segments exceed the path MTU ({path_mtu}).")
+            return
+        try:
+            self.sock.setsockopt(SOL_UDP, UDP_SEGMENT, slot_size)
+        except OSError as e:
+            logging.warning(f"UDP GSO unavailable ({e}), using sendmmsg().")
+            return
+        self.slot_size = slot_size
+        self.gso_view = memoryview(bytearray(slot_size * self.batch_size))
+        self.pad_view = memoryview(b' ' * slot_size)
+        logging.info(f"UDP GSO enabled: {slot_size}-byte segments.")
+
+    def disable_gso(self):
+        try:
+            self.sock.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+        except OSError as e:
+            logging.warning(f"Could not clear UDP_SEGMENT: {e}")
+        self.gso_view = None
+
+    def flush_gso(self, n):
+        # Copy the queued payloads into one buffer at slot_size strides; the last one stays unpadded
+        size = self.slot_size
+        buf = self.gso_view
+        offset = 0
+        for i in range(n):
+            length = self.lengths[i]
+            buf[offset:offset + length] = self.slot_views[i][:length]
+            if i < n - 1 and length < size:
+                buf[offset + length:offset + size] = self.pad_view[:size - length]
+            offset += size if i < n - 1 else length
+        try:
+            self.sock.send(buf[:offset])
+        except OSError as e:
+            if e.errno not in (errno.EIO, errno.EINVAL):
+                raise
+            logging.warning(f"UDP GSO send failed ({e}), disabling GSO and resending through sendmmsg().")
+            self.disable_gso()
+            return self.flush_slots(n)
+        return n
+
+    def queue(self, payload):
+        """Copy one payload into the next slot; flushes when the batch is full. Returns the number of datagrams sent."""
+        i = self.count
+        n = len(payload)
+        self.slot_views[i][:n] = payload # Same-size slice store: no resize, the slot stays pinned
+        self.lengths[i] = n
+        self.count += 1
+        if self.count >= self.batch_size:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """Send all queued payloads. Returns the number of datagrams sent."""
+        n = self.count
+        if n == 0:
+            return 0
+        self.count = 0
+        if self.gso_view is not None and n > 1:
+            return self.flush_gso(n)
+        return self.flush_slots(n)
+
+    def flush_slots(self, n):
+        # One datagram per slot: sendmmsg() on Linux, plain send() otherwise (or for a single payload)
+        if self.libc is None or n == 1:
+            for i in range(n):
+                self.sock.send(self.slot_views[i][:self.lengths[i]])
+            return n
+        for i in range(n):
+            self.iovecs[i].iov_len = self.lengths[i]
+        sent = self.libc.sendmmsg(self.fd, self.msgs, n, 0)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+# --- I2C Error Reporting ---
+# A loose sensor can fail every read: count every error but log at most one line per interval,
+# so a flaky bus doesn't also turn into a logging storm in the reader thread.
+I2C_ERROR_LOG_INTERVAL_S = 1.0
+g_i2c_errors = 0
+g_next_i2c_error_log = 0.0
+
+def note_i2c_error(i, e, level=logging.WARNING, kind="I2C Error"):
+    global g_i2c_errors, g_next_i2c_error_log
+    g_i2c_errors += 1
+    now = time.monotonic()
+    if now >= g_next_i2c_error_log:
+        g_next_i2c_error_log = now + I2C_ERROR_LOG_INTERVAL_S
+        logging.log(level, f"{kind} reading {g_sensor_ids[i]} on ch {g_sensor_channels[i]}: {e}. Sending 0s. ({g_i2c_errors} read errors so far)")
+
+def read_sensors(values):
+    if g_value_offset:
+        values[0] = time.monotonic()
+    # Raw floats go straight into the value list (one slice store per sensor); the 3-decimal
+    # rounding happens only once, in the template's C-level {:.3f} formatting.
+    base = g_value_offset
+    for i, device in enumerate(g_sensor_devices):
+        if device:
+            try:
+                values[base:base + 3] = read_tlv493d_xyz(device, g_sensor_raw[i])
             except OSError as e: # More specific for I2C communication issues
-                logging.warning(f"I2C Error reading {sensor_id_str} on ch {config['channel']}: {e}. Sending 0s.")
+                note_i2c_error(i, e)
+                values[base:base + 3] = ZERO_XYZ
             except Exception as e:
-                logging.error(f"Unexpected error reading {sensor_id_str} on ch {config['channel']}: {e}. Sending 0s.")
-        
-        sensor_data_list.append({"axis": "x", "val": round(mag_x, 3)})
-        sensor_data_list.append({"axis": "y", "val": round(mag_y, 3)})
-        sensor_data_list.append({"axis": "z", "val": round(mag_z, 3)})
-        payload_dict["Sensor"][sensor_id_str] = sensor_data_list
-    
-    try:
-        return json.dumps(payload_dict)
-    except TypeError as e:
-        logging.error(f"Error serializing sensor data to JSON: {e}")
-        logging.debug(f"Problematic data for JSON: {payload_dict}")
-        return None # Indicate failure
+                note_i2c_error(i, e, logging.ERROR, "Unexpected error")
+                values[base:base + 3] = ZERO_XYZ
+        else:
+            values[base:base + 3] = ZERO_XYZ # Default to 0.0
+        base += 3
+
+# --- Sensor Reader Thread ---
+# The TCA9548A serializes the bus, so reading sensors from several threads wouldn't overlap anything.
+# Instead one thread reads all sensors back to back and publishes each complete set as a new tuple
+# (a single reference swap, atomic under the GIL). The send loop formats the latest sample and never
+# waits on I2C; the GIL is released during each I2C transfer.
+# Conversions already overlap: adafruit_tlv493d puts each sensor in master controlled mode, where the
+# end of a read starts that sensor's next measurement. While the other sensors are read and the loop
+# comes round again, every sensor converts in parallel, so a separate kick-off pass would add one bus
+# transaction per sensor and save nothing.
+# The reader is paced to the send period on its own absolute deadline, so it reads about one sample
+# per tick instead of spinning on the bus (and the GIL). At max speed (0 Hz) it reads back to back.
+def sensor_reader():
+    global g_latest_sample
+    pin_current_thread(SENSOR_READER_CPU)
+    logging.info("Sensor reader started.")
+    deadline_ts = _Timespec() # sleep_until_ns() writes the deadline into it: not shared with the send loop
+    next_deadline_ns = time.monotonic_ns()
+    while not g_stop_command_listener.is_set():
+        read_sensors(g_sensor_values)
+        g_latest_sample = tuple(g_sensor_values)
+        g_new_sample.set()
+        if g_initialized_sensor_count == 0:
+            break # Nothing to read: the all-zero sample never changes
+
+        current_target_freq = g_send_frequency_hz
+        if current_target_freq > 0:
+            period_ns = int(1e9 / current_target_freq)
+            next_deadline_ns += period_ns
+            now_ns = time.monotonic_ns()
+            if next_deadline_ns < now_ns - period_ns:
+                next_deadline_ns = now_ns # Reads fell a full period behind: re-anchor instead of bursting
+            sleep_until_ns(next_deadline_ns, deadline_ts)
+        else:
+            next_deadline_ns = time.monotonic_ns() # Re-anchor so a later frequency change starts from now
+    logging.info("Sensor reader stopped.")
+
+# --- Command Handlers ---
+# Each handler takes (command_json, addr, sock) and replies on sock. Dispatch is a dict lookup on the
+# "command" field, see CMD_HANDLERS below.
+ACK_REBOOT = f"ACK: {CMD_REBOOT} initiated.".encode('utf-8')
+NACK_REBOOT_DISABLED = f"NACK: {CMD_REBOOT} disabled by configuration.".encode('utf-8')
+ACK_SHUTDOWN = f"ACK: {CMD_SHUTDOWN} initiated.".encode('utf-8')
+NACK_SHUTDOWN_DISABLED = f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode('utf-8')
+NACK_INVALID_JSON = "NACK: Invalid JSON format".encode('utf-8')
+
+def handle_reboot(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
+        sock.sendto(ACK_REBOOT, addr)
+        os.system("sudo reboot") # Consider security implications
+    else:
+        logging.warning(f"COMMAND_LISTENER: {CMD_REBOOT} command received but system commands are disabled in config.")
+        sock.sendto(NACK_REBOOT_DISABLED, addr)
+
+def handle_shutdown(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
+        sock.sendto(ACK_SHUTDOWN, addr)
+        os.system("sudo shutdown -h now") # Consider security implications
+    else:
+        logging.warning(f"COMMAND_LISTENER: {CMD_SHUTDOWN} command received but system commands are disabled in config.")
+        sock.sendto(NACK_SHUTDOWN_DISABLED, addr)
+
+def handle_set_frequency(command_json, addr, sock):
+    global g_send_frequency_hz
+    new_freq_val = command_json.get("hz")
+    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
+        g_send_frequency_hz = float(new_freq_val)
+        logging.info(f"COMMAND_LISTENER: Send frequency set to: {g_send_frequency_hz} Hz")
+        sock.sendto(f"ACK: Frequency set to {g_send_frequency_hz} Hz".encode('utf-8'), addr)
+    else:
+        logging.warning(f"COMMAND_LISTENER: Invalid frequency value received: {new_freq_val}")
+        sock.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode('utf-8'), addr)
+
+def handle_get_status(command_json, addr, sock):
+    status_msg = {
+        "status": "OK",
+        "send_frequency_hz": g_send_frequency_hz,
+        "initialized_sensors": g_initialized_sensor_count,
+        "total_configured_sensors": NUM_SENSORS
+    }
+    sock.sendto(json_dumps(status_msg), addr)
+
+def handle_unknown(command_json, addr, sock):
+    action = command_json.get("command")
+    logging.warning(f"COMMAND_LISTENER: Unknown command received: {action}")
+    sock.sendto(f"NACK: Unknown command '{action}'".encode('utf-8'), addr)
+
+CMD_HANDLERS = {
+    CMD_REBOOT: handle_reboot,
+    CMD_SHUTDOWN: handle_shutdown,
+    CMD_SET_FREQUENCY: handle_set_frequency,
+    CMD_GET_STATUS: handle_get_status,
+}
+
+# --- Stats Logging ---
+def log_stats():
+    """Logs send loop stats. Called by the command listener, keeping formatting and console I/O off the send loop."""
+    sent = g_stats["sent"]
+    if g_start_time is None or sent == 0:
+        return
+    current_run_time = time.monotonic() - g_start_time
+    actual_freq = sent / current_run_time
+    current_target_freq = g_send_frequency_hz
+    freq_target_str = f"{current_target_freq:.1f} Hz" if current_target_freq > 0 else "Max"
+    logging.info(f"Sent {sent} sensor packets. Avg Freq: {actual_freq:.2f} Hz (Target: {freq_target_str}). Last loop: {g_stats['last_loop_ms']:.3f} ms. Missed ticks: {g_stats['missed']}. Dropped: {g_stats['dropped']}. I2C errors: {g_i2c_errors}")
 
 # --- UDP Command Listener Function ---
+# Also the stats timer: the select() timeout runs to the next stats line, so no separate logger thread
+# is needed. The send loop itself stays out of it: it sleeps in clock_nanosleep(), and epoll timeouts
+# only have millisecond resolution.
 def command_listener():
-    global g_send_frequency_hz, g_frequency_lock, g_enable_system_commands
+    pin_current_thread(COMMAND_LISTENER_CPU)
 
     listener_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         listener_socket.bind(("", PI_COMMAND_PORT)) # Listen on all interfaces
-        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT}")
+        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT} (JSON: {JSON_BACKEND})")
     except OSError as e:
-        logging.error(f"COMMAND_LISTENER: Could not bind to command port {PI_COMMAND_PORT}: {e}. Thread exiting.")
-        return
-
-    listener_socket.settimeout(1.0) # Timeout to allow checking stop event
+        logging.error(f"COMMAND_LISTENER: Could not bind to command port {PI_COMMAND_PORT}: {e}. Commands disabled.")
+        listener_socket.close()
+        listener_socket = None # Keep running for the stats lines
+
+    # Block in select() on the socket and the stop pipe until the next stats line: instant shutdown
+    selector = selectors.DefaultSelector() # epoll on Linux
+    if listener_socket is not None:
+        listener_socket.setblocking(False)
+        selector.register(listener_socket, selectors.EVENT_READ)
+    selector.register(g_stop_pipe_r, selectors.EVENT_READ)
+    next_stats_time = time.monotonic() + STATS_LOG_INTERVAL_S
 
     while not g_stop_command_listener.is_set():
         try:
+            events = selector.select(max(0.0, next_stats_time - time.monotonic()))
+            if time.monotonic() >= next_stats_time:
+                next_stats_time += STATS_LOG_INTERVAL_S
+                log_stats()
+            if not any(key.fileobj is listener_socket for key, _ in events):
+                continue # Woken by request_stop()
             data, addr = listener_socket.recvfrom(1024)
-            command_str = data.decode('utf-8')
-            logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_str}")
 
             try:
-                command_json = json.loads(command_str)
+                command_json = json_loads(data) # Parse the raw bytes: the text is only decoded to log bad input
+                logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_json}")
                 action = command_json.get("command")
+                CMD_HANDLERS.get(action, handle_unknown)(command_json, addr, listener_socket)
 
-                if action == CMD_REBOOT:
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
-                        listener_socket.sendto(f"ACK: {CMD_REBOOT} initiated.".encode('utf-8'), addr)
-                        os.system("sudo reboot") # Consider security implications
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: {CMD_REBOOT} command received but system commands are disabled in config.")
-                        listener_socket.sendto(f"NACK: {CMD_REBOOT} disabled by configuration.".encode('utf-8'), addr)
-                
-                elif action == CMD_SHUTDOWN:
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
-                        listener_socket.sendto(f"ACK: {CMD_SHUTDOWN} initiated.".encode('utf-8'), addr)
-                        os.system("sudo shutdown -h now") # Consider security implications
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: {CMD_SHUTDOWN} command received but system commands are disabled in config.")
-                        listener_socket.sendto(f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode('utf-8'), addr)
-
-                elif action == CMD_SET_FREQUENCY:
-                    new_freq_val = command_json.get("hz")
-                    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
-                        with g_frequency_lock:
-                            g_send_frequency_hz = float(new_freq_val)
-                        logging.info(f"COMMAND_LISTENER: Send frequency set to: {g_send_frequency_hz} Hz")
-                        listener_socket.sendto(f"ACK: Frequency set to {g_send_frequency_hz} Hz".encode('utf-8'), addr)
-                    else:
-                        logging.warning(f"COMMAND_LISTENER: Invalid frequency value received: {new_freq_val}")
-                        listener_socket.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode('utf-8'), addr)
-                
-                elif action == CMD_GET_STATUS: # Example new command
-                    with g_frequency_lock:
-                        current_freq = g_send_frequency_hz
-                    status_msg = {
-                        "status": "OK",
-                        "send_frequency_hz": current_freq,
-                        "initialized_sensors": g_initialized_sensor_count,
-                        "total_configured_sensors": NUM_SENSORS
-                    }
-                    listener_socket.sendto(json.dumps(status_msg).encode('utf-8'), addr)
-
-                else:
-                    logging.warning(f"COMMAND_LISTENER: Unknown command received: {action}")
-                    listener_socket.sendto(f"NACK: Unknown command '{action}'".encode('utf-8'), addr)
-
-            except json.JSONDecodeError:
-                logging.error(f"COMMAND_LISTENER: Invalid JSON received from {addr}: {command_str}")
-                listener_socket.sendto("NACK: Invalid JSON format".encode('utf-8'), addr)
+            except JSONDecodeError:
+                logging.error(f"COMMAND_LISTENER: Invalid JSON received from {addr}: {data.decode('utf-8', 'replace')}")
+                listener_socket.sendto(NACK_INVALID_JSON, addr)
             except Exception as e:
                 logging.error(f"COMMAND_LISTENER: Error processing command from {addr}: {e}")
                 listener_socket.sendto(f"NACK: Error processing command - {e}".encode('utf-8'), addr)
 
-        except socket.timeout:
-            continue # Allows checking g_stop_command_listener periodically
+        except BlockingIOError:
+            continue # Readiness without a datagram (e.g. dropped on checksum error)
         except Exception as e:
             logging.error(f"COMMAND_LISTENER: Unexpected error in listener loop: {e}")
             time.sleep(0.1) # Avoid rapid spamming on persistent errors
 
-    listener_socket.close()
+    selector.close()
+    if listener_socket is not None:
+        listener_socket.close()
     logging.info("Command listener stopped.")
 
 # --- Main Application ---
 def main():
+    global g_start_time
     load_configuration()
     initialize_hardware_and_sensors()
+    build_payload_template()
 
     # Start Command Listener Thread
     command_thread = threading.Thread(target=command_listener, name="CmdListenerThread", daemon=True)
     command_thread.start()
 
+    # Start Sensor Reader Thread and wait for the first complete sample
+    reader_thread = threading.Thread(target=sensor_reader, name="SensorReaderThread", daemon=True)
+    reader_thread.start()
+    g_new_sample.wait()
+
     # Initialize UDP Socket for Sensor Data
     sensor_data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    logging.info(f"Sending sensor data as JSON to {HOST_IP_PC}:{HOST_PORT_PC}")
-
-    packet_count = 0
-    start_time = time.monotonic()
+    try:
+        sensor_data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SENSOR_SOCKET_SNDBUF)
+        sensor_data_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, SENSOR_SOCKET_TOS)
+        if hasattr(socket, "SO_PRIORITY"):
+            sensor_data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, SENSOR_SOCKET_PRIORITY)
+        if sys.platform.startswith("linux"):
+            # Payloads are far below the MTU: skip path MTU probing/DF handling on this socket
+            sensor_data_socket.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DONT)
+    except OSError as e:
+        logging.warning(f"Could not set socket options on sensor data socket: {e}")
+    sndbuf = sensor_data_socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    if sndbuf < SENSOR_SOCKET_SNDBUF:
+        logging.warning(f"SO_SNDBUF is {sndbuf} bytes (requested {SENSOR_SOCKET_SNDBUF}). Raise net.core.wmem_max.")
+    # Never block the send loop on a full buffer: drop the datagram and count it instead
+    sensor_data_socket.setblocking(False)
+    # The destination is fixed: connect once so each send skips the address lookup/validation
+    sensor_data_socket.connect((HOST_IP_PC, HOST_PORT_PC))
+    logging.info(f"Sending sensor data as {PAYLOAD_FORMAT} to {HOST_IP_PC}:{HOST_PORT_PC}")
+    # SendBatchSize > 1: datagrams stay one per SamplesPerPacket, but go out N per sendmmsg() call
+    sender = BatchSender(sensor_data_socket, max_payload_size(), SEND_BATCH_SIZE, SEND_UDP_GSO) if SEND_BATCH_SIZE > 1 else None
+
+    # The send loop runs on the main thread: own core, real-time priority
+    pin_current_thread(SEND_LOOP_CPU)
+    enable_realtime_scheduling(SEND_LOOP_FIFO_PRIORITY)
+
+    start_time = g_start_time = time.monotonic()
+    next_deadline_ns = time.monotonic_ns()
+    # Hot-loop references bound once as locals (LOAD_FAST instead of global + attribute lookups)
+    monotonic = time.monotonic
+    monotonic_ns = time.monotonic_ns
+    stop_requested = g_stop_command_listener.is_set
+    new_sample = g_new_sample
+    queue_sample = queue_latest_sample
+    take_payload = take_pending_payload
+    send = sensor_data_socket.send # os.write(fd) measured no faster: the syscall dominates, not the wrapper
+    stats = g_stats
+    sleep_until = sleep_until_ns
     
     try:
-        while not g_stop_command_listener.is_set(): # Check stop event for main loop too
+        while not stop_requested(): # Check stop event for main loop too
             # Dynamically calculate delay based on global frequency setting
-            with g_frequency_lock:
-                current_target_freq = g_send_frequency_hz
+            current_target_freq = g_send_frequency_hz
             
             if current_target_freq > 0:
                 desired_delay_s = 1.0 / current_target_freq
             else:
                 desired_delay_s = 0.0 # Max speed
 
-            loop_start_time = time.monotonic()
-            
-            udp_payload_json = read_sensors_and_build_json()
+            if desired_delay_s == 0.0:
+                # Max speed: send each new sample once instead of spinning on the same one
+                new_sample.wait(timeout=1.0)
+            new_sample.clear()
+
+            loop_start_time = monotonic()
             
-            if udp_payload_json:
+            queue_sample()
+            if g_pending_count >= SAMPLES_PER_PACKET:
+                sample_count = g_pending_count
+                datagram_count = 1 if sender is None else sender.count + 1 # Datagrams a flush would send
                 try:
-                    sensor_data_socket.sendto(udp_payload_json.encode('utf-8'), (HOST_IP_PC, HOST_PORT_PC))
-                    packet_count += 1
+                    if sender is None:
+                        send(take_payload())
+                        stats["sent"] += sample_count
+                    else:
+                        sent = sender.queue(take_payload()) # Copied: the binary view can be reused
+                        if sent:
+                            stats["sent"] += sent * sample_count
+                            stats["dropped"] += datagram_count - sent
+                except BlockingIOError:
+                    stats["dropped"] += datagram_count # Send buffer full: stale telemetry isn't worth waiting for
                 except socket.error as e: # Catch specific socket errors
                     logging.error(f"MAIN_LOOP: Socket error sending sensor data: {e}")
                 except Exception as e:
                     logging.error(f"MAIN_LOOP: Unexpected error sending sensor data: {e}")
-            
-            loop_time_taken = time.monotonic() - loop_start_time
+
+            stats["last_loop_ms"] = (monotonic() - loop_start_time) * 1000
             
             if desired_delay_s > 0:
-                sleep_duration = desired_delay_s - loop_time_taken
-                if sleep_duration > 0:
-                    time.sleep(sleep_duration)
-
-            if packet_count > 0 and packet_count % (int(current_target_freq * 5) if current_target_freq > 0 else 200) == 0 : # Log roughly every 5s or 200 packets
-                current_run_time = time.monotonic() - start_time
-                if current_run_time > 0:
-                    actual_freq = packet_count / current_run_time
-                    freq_target_str = f"{current_target_freq:.1f} Hz" if current_target_freq > 0 else "Max"
-                    logging.info(f"Sent {packet_count} sensor packets. Avg Freq: {actual_freq:.2f} Hz (Target: {freq_target_str}). Last loop: {loop_time_taken*1000:.3f} ms")
+                period_ns = int(desired_delay_s * 1e9)
+                next_deadline_ns += period_ns
+                now_ns = monotonic_ns()
+                if next_deadline_ns < now_ns - period_ns:
+                    # More than a full period late: skip the missed ticks instead of bursting to catch up
+                    stats["missed"] += 1
+                    next_deadline_ns = now_ns
+                sleep_until(next_deadline_ns)
+            else:
+                next_deadline_ns = monotonic_ns() # Re-anchor so a later frequency change starts from now
 
     except KeyboardInterrupt:
         logging.info("MAIN_LOOP: Program interrupted by user. Initiating shutdown.")
@@ -284,16 +820,32 @@ def main():
         logging.error(f"MAIN_LOOP: An unhandled exception occurred: {e}", exc_info=True) # exc_info=True prints traceback
     finally:
         logging.info("MAIN_LOOP: Stopping command listener thread...")
-        g_stop_command_listener.set() 
+        request_stop() 
         if command_thread.is_alive():
             command_thread.join(timeout=2.0) 
             if command_thread.is_alive():
                 logging.warning("MAIN_LOOP: Command listener thread did not terminate gracefully.")
+        reader_thread.join(timeout=2.0)
+        if reader_thread.is_alive():
+            logging.warning("MAIN_LOOP: Sensor reader thread did not terminate gracefully.")
 
+        if sender is not None and sender.count:
+            try:
+                g_stats["sent"] += sender.flush() * SAMPLES_PER_PACKET # Datagrams still waiting for sendmmsg()
+            except OSError as e:
+                logging.warning(f"MAIN_LOOP: Could not flush queued datagrams: {e}")
+        if g_pending_count:
+            try:
+                sample_count = g_pending_count
+                sensor_data_socket.send(take_pending_payload()) # Partial final batch
+                g_stats["sent"] += sample_count
+            except OSError as e:
+                logging.warning(f"MAIN_LOOP: Could not send final partial batch: {e}")
         logging.info("MAIN_LOOP: Closing sensor data UDP socket.")
         sensor_data_socket.close()
         
         current_run_time = time.monotonic() - start_time
+        packet_count = g_stats["sent"]
         if current_run_time > 0 and packet_count > 0:
             actual_freq = packet_count / current_run_time
             logging.info(f"Total sensor packets sent: {packet_count}")
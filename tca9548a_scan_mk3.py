@@ -1,23 +1,22 @@
 import board
 import busio
 import adafruit_tca9548a
-from adafruit_bus_device.i2c_device import I2CDevice
+
+TCA_ADDRESS = 0x70
 
 # Set up I2C and multiplexer
 i2c = busio.I2C(board.SCL, board.SDA)
-tca = adafruit_tca9548a.TCA9548A(i2c)
+tca = adafruit_tca9548a.TCA9548A(i2c, TCA_ADDRESS)
 
 def safe_scan(tca_channel):
-    found = []
-    for addr in range(0x03, 0x78):
-        try:
-            device = I2CDevice(tca_channel, addr)
-            with device:
-                pass  # If this succeeds, the device is present
-            found.append(addr)
-        except Exception:
-            pass
-    return found
+    # One bus sweep per channel: lock the channel (selects it on the mux) and let scan() probe
+    # every address, instead of constructing and entering an I2CDevice per address.
+    while not tca_channel.try_lock():
+        pass
+    try:
+        return [addr for addr in tca_channel.scan() if addr != TCA_ADDRESS] # The mux answers on every channel
+    finally:
+        tca_channel.unlock()
 
 # Scan all channels
 for ch in range(8):
@@ -7,19 +7,64 @@ import board
 import socket
 import json
 import os
+import sys
+import ctypes
 import threading
+import selectors
+import collections
+import atexit
 import logging
+import logging.handlers
+import queue
 import configparser
 import struct
+import subprocess
 
 from adafruit_seesaw import digitalio, rotaryio, seesaw
 
+# Optional: libgpiod v2 bindings (pip install gpiod), only needed to wake on the Seesaw INT line
+try:
+    import gpiod
+    from gpiod.line import Bias, Edge
+except ImportError:
+    gpiod = None
+
+# --- JSON Backend (command listener / status replies) ---
+# orjson (Rust, bytes in and out) is several times faster than the stdlib and holds the GIL
+# for less time while the OSC loop is running. Its wheels need a 64-bit OS / recent glibc,
+# so fall back to ujson (C, armv6/v7 wheels), then to the stdlib json.
+try:
+    import orjson
+    json_dumps = orjson.dumps # -> bytes
+    json_loads = orjson.loads # Accepts bytes directly
+    JSONDecodeError = orjson.JSONDecodeError
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        def json_dumps(obj):
+            return ujson.dumps(obj).encode("utf-8")
+        json_loads = ujson.loads # Accepts bytes directly
+        JSONDecodeError = getattr(ujson, "JSONDecodeError", ValueError) # Older ujson raises plain ValueError
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        def json_dumps(obj):
+            return json.dumps(obj).encode("utf-8")
+        json_loads = json.loads
+        JSONDecodeError = json.JSONDecodeError
+        JSON_BACKEND = "json"
+
 # --- Setup Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Records are only queued by the calling thread; a background listener formats and writes them,
+# so a slow terminal or SSH session never stalls the OSC loop on a log line.
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'))
+g_log_listener = logging.handlers.QueueListener(queue.SimpleQueue(), _log_handler)
+_queue_handler = logging.handlers.QueueHandler(g_log_listener.queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s')) # Message + traceback only; the full format is applied by _log_handler
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+g_log_listener.start()
+atexit.register(g_log_listener.stop) # Flush the queued records on every exit path, including exit(1)
 
 # --- Command Constants ---
 CMD_REBOOT = "reboot"
@@ -28,9 +73,10 @@ CMD_SET_FREQUENCY = "set_frequency"
 CMD_GET_STATUS = "get_status"
 
 # --- Global Variables & Shared Objects ---
-g_send_frequency_hz = 0.0
-g_frequency_lock = threading.Lock()
+g_send_frequency_hz = 0.0 # Single writer (command listener), read every tick by the main loop: a float
+                          # rebind/load is atomic under the GIL, so no lock. Don't add one back.
 g_stop_command_listener = threading.Event()
+g_stop_pipe_r, g_stop_pipe_w = os.pipe() # Readable once stop is requested: wakes the command listener's select()
 g_enable_system_commands = False
 
 # Rotary globals
@@ -40,7 +86,48 @@ g_encoder = None
 g_button = None
 g_initialized_device_count = 0
 
+# Batched sending (see osc_sender_thread)
+OSC_SEND_QUEUE_MAX = 256 # Queued packets before the oldest are dropped (sender thread falling behind)
+g_send_queue = collections.deque(maxlen=OSC_SEND_QUEUE_MAX) # Main loop appends, sender thread pops (both atomic)
+g_send_ready = threading.Event() # Set by the main loop once flush_at packets are queued (see main)
+g_sent_packets = 0 # Written by the sender thread only
+g_dropped_packets = 0 # Written by the main loop only: packets pushed out of a full g_send_queue
+OSC_BATCH_MAX = 32 # Packets per sendmmsg() call from the sender thread
+OSC_BATCH_MAX_DELAY_S = 0.02 # Flush a partial batch once its oldest packet is this old
+OSC_SEND_FROM_THREAD = False # True: every packet is handed to the sender thread, the poll loop never sends
+OSC_BUNDLE_S = 0.0 # > 0: queue every message and send them as OSC bundles at most this often
+OSC_BUNDLE_MAX = 8 # Messages per bundle; a full bundle is flushed without waiting for the window
+OSC_BATCH_ABOVE_HZ = 500.0 # Target frequencies at or above this (and "max", 0 Hz) go through the sender thread
+SENDER_CPU = 2
+OSC_SEND_ON_CHANGE = True # Only send a channel when its value changed (plus a heartbeat)
+OSC_HEARTBEAT_S = 1.0 # Both channels are re-sent at least this often, so receivers never time out
+
+# Seesaw registers read directly by read_rotary() (same as adafruit_seesaw's encoder_position /
+# digital_read_bulk). The library sleeps 8 ms between the register write and the read, so its two
+# reads cap the loop near 60 Hz; the firmware answers far sooner than that.
+_SEESAW_GPIO_BASE = 0x01
+_SEESAW_GPIO_BULK = 0x04
+_SEESAW_ENCODER_BASE = 0x11
+_SEESAW_ENCODER_POSITION = 0x30
+BUTTON_PIN = 24
+BUTTON_MASK = 1 << BUTTON_PIN
+SEESAW_READ_DELAY_S = 0.0005 # Write -> read turnaround per register read (Arduino library uses 250 us)
+_SEESAW_GPIO_INTENSET = 0x08
+_SEESAW_GPIO_INTFLAG = 0x0A
+_ENCODER_REQ = bytes([_SEESAW_ENCODER_BASE, _SEESAW_ENCODER_POSITION])
+_GPIO_REQ = bytes([_SEESAW_GPIO_BASE, _SEESAW_GPIO_BULK])
+_pos_raw = bytearray(4)
+_gpio_raw = bytearray(4)
+_intflag_raw = bytearray(4)
+IDLE_POLL_HZ = 0.0 # > 0: poll at this rate once the knob has been still for IDLE_AFTER_S (polling mode only)
+IDLE_AFTER_S = 0.5
+INTERRUPT_GPIO = -1 # BCM line wired to the Seesaw INT pin (needs OscSendOnChange); -1 polls at the send frequency instead
+INTERRUPT_GPIO_CHIP = "/dev/gpiochip0"
+_UINT32 = struct.Struct(">I")
+
 # For status/debug
+g_last_command_rx_ns = 0 # Kernel arrival time of the last command (CLOCK_REALTIME ns, 0 = unknown)
+g_last_command_queue_us = 0.0 # Arrival -> handler dispatch
 g_last_position = 0
 g_last_button_pressed = 0  # 1 pressed, 0 released
 
@@ -84,11 +171,331 @@ def osc_message(address: str, type_tags: str, *args) -> bytes:
 
     return addr_bin + tags_bin + arg_bin
 
+# The hot loop always sends one int32 to the same two addresses: their padded address + ",i"
+# type tag headers are built once here, so each packet is one struct pack and one concat.
+# osc_message() stays the general path for anything dynamic.
+OSC_POS_ADDRESS = "/rotary/pos"
+OSC_BTN_ADDRESS = "/rotary/btn"
+_OSC_INT_TAGS = _osc_pad4(b",i\x00")
+_POS_HDR = _osc_pad4(OSC_POS_ADDRESS.encode("utf-8") + b"\x00") + _OSC_INT_TAGS
+_BTN_HDR = _osc_pad4(OSC_BTN_ADDRESS.encode("utf-8") + b"\x00") + _OSC_INT_TAGS
+_INT32 = struct.Struct(">i")
+# Inline sends reuse one position buffer: the header is written once and each tick only
+# packs the int32 in place (OscSender copies it into its slot, so reuse is safe). Packets queued
+# for the sender thread must own their bytes: header + value are packed in one call, one allocation.
+_POS_BUF = bytearray(_POS_HDR + bytes(_INT32.size))
+_POS_BUF_MV = memoryview(_POS_BUF)
+_POS_MSG = struct.Struct(f">{len(_POS_HDR)}si")
+# The button is only ever 0 or 1: both complete messages are prebuilt and indexed by the state
+_BTN_MSGS = (_BTN_HDR + _INT32.pack(0), _BTN_HDR + _INT32.pack(1))
+
+# Combined format ([Network] OscFormat = combined): one "/rotary ,ii" message carries position and
+# button: one 20-byte datagram instead of two. TouchDesigner's OSC In CHOP splits the
+# arguments into rotary1 / rotary2 channels.
+OSC_ROTARY_ADDRESS = "/rotary"
+_ROTARY_HDR = _osc_pad4(OSC_ROTARY_ADDRESS.encode("utf-8") + b"\x00") + _osc_pad4(b",ii\x00")
+_INT32_PAIR = struct.Struct(">ii")
+_ROTARY_BUF = bytearray(_ROTARY_HDR + bytes(_INT32_PAIR.size))
+_ROTARY_BUF_MV = memoryview(_ROTARY_BUF)
+_ROTARY_MSG = struct.Struct(f">{len(_ROTARY_HDR)}sii")
+OSC_FORMAT = "separate" # "separate" (/rotary/pos + /rotary/btn) or "combined" (/rotary)
+
+
+# ---------------- Batched OSC send (sendmmsg) ----------------
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_uint32), ("sin_zero", ctypes.c_char * 8)]
+
+ENOSYS = 38
+EAGAIN = 11
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+OSC_SLOT_SIZE = 64 # Largest OSC packet sent through OscSender
+
+class OscSender:
+    """
+    Sends up to `count` OSC packets per call with a single sendmmsg(2) on Linux,
+    instead of one sendto() each. Packets are copied into preallocated slots whose
+    addresses are wired into the iovecs once, so a send allocates nothing.
+    Falls back to one send per packet if libc has no sendmmsg (or the kernel returns ENOSYS).
+    addr=None means the socket is already connect()ed: messages then carry no destination
+    and the kernel uses the connected socket's cached route.
+    sendmmsg() is called with MSG_DONTWAIT: if the socket buffer is full (e.g. a Wi-Fi stall) the
+    packets that don't fit are dropped and counted in `dropped`, instead of blocking the caller.
+    """
+
+    def __init__(self, sock, addr, count, slot_size=OSC_SLOT_SIZE):
+        self.sock = sock
+        self.addr = addr
+        self.count = count
+        self.dropped = 0
+        self.slots = [bytearray(slot_size) for _ in range(count)]
+        self.slot_views = [memoryview(slot) for slot in self.slots]
+        self.libc = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.libc = ctypes.CDLL("libc.so.6", use_errno=True)
+                self.libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+                self.libc.sendmmsg.restype = ctypes.c_int
+            except (OSError, AttributeError) as e:
+                logging.warning(f"sendmmsg unavailable ({e}), falling back to sendto().")
+                self.libc = None
+        if self.libc is None:
+            return
+
+        # Destination as a sockaddr_in, shared by every message (unconnected socket only)
+        self.sockaddr = None
+        if addr is not None:
+            self.sockaddr = _SockAddrIn()
+            self.sockaddr.sin_family = socket.AF_INET
+            self.sockaddr.sin_port = socket.htons(addr[1])
+            self.sockaddr.sin_addr = struct.unpack("=I", socket.inet_aton(socket.gethostbyname(addr[0])))[0]
+
+        self.iovecs = (_IOVec * count)()
+        self.msgs = (_MMsgHdr * count)()
+        # Keep the ctypes views alive: they pin the slots so they can't be resized/moved
+        self.ctypes_views = [(ctypes.c_char * slot_size).from_buffer(slot) for slot in self.slots]
+        for i, view in enumerate(self.ctypes_views):
+            self.iovecs[i].iov_base = ctypes.addressof(view)
+            hdr = self.msgs[i].msg_hdr
+            if self.sockaddr is not None: # Otherwise msg_name stays NULL: the connected socket supplies the peer
+                hdr.msg_name = ctypes.addressof(self.sockaddr)
+                hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.fd = sock.fileno()
+
+    def send(self, *packets):
+        """Send up to `count` packets. Returns the number of datagrams sent."""
+        if self.libc is not None:
+            for i, packet in enumerate(packets):
+                n = len(packet)
+                self.slot_views[i][:n] = packet # Same-size slice store: no resize, the slot stays pinned
+                self.iovecs[i].iov_len = n
+            try:
+                return self._sendmmsg(len(packets))
+            except OSError as e:
+                if e.errno != ENOSYS:
+                    raise
+            logging.warning("sendmmsg not supported by this kernel, falling back to sendto().")
+            self.libc = None
+        if self.addr is None:
+            for packet in packets:
+                self.sock.send(packet)
+        else:
+            for packet in packets:
+                self.sock.sendto(packet, self.addr)
+        return len(packets)
+
+    def drain(self, queue):
+        """Pop up to `count` packets from a non-empty deque straight into the slots and send
+        them with one sendmmsg(). Returns the number of datagrams sent."""
+        if self.libc is None:
+            n = min(len(queue), self.count)
+            return self.send(*[queue.popleft() for _ in range(n)])
+        popleft = queue.popleft
+        slot_views = self.slot_views
+        iovecs = self.iovecs
+        n = 0
+        while queue and n < self.count:
+            packet = popleft()
+            size = len(packet)
+            slot_views[n][:size] = packet
+            iovecs[n].iov_len = size
+            n += 1
+        return self._sendmmsg(n)
+
+    def _sendmmsg(self, n):
+        # ctypes.CDLL foreign calls drop the GIL: the poll loop and listener run during the syscall
+        sent = self.libc.sendmmsg(self.fd, self.msgs, n, MSG_DONTWAIT)
+        if sent >= 0:
+            self.dropped += n - sent # A short count means the next message would have blocked
+            return sent
+        err = ctypes.get_errno()
+        if err == EAGAIN:
+            self.dropped += n
+            return 0
+        raise OSError(err, os.strerror(err))
+
+
+# --- Socket Buffers ---
+# The kernel caps these at net.core.wmem_max / rmem_max. Raise them to match, e.g.:
+#   sudo sysctl -w net.core.wmem_max=2097152 net.core.rmem_max=2097152
+OSC_SOCKET_SNDBUF = 1 << 20 # Room for several full sendmmsg() batches
+COMMAND_SOCKET_RCVBUF = 1 << 20
+SO_SNDBUFFORCE = getattr(socket, "SO_SNDBUFFORCE", 32) # Linux values; not exported by Python's socket module
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+
+# --- Command Receive Timestamps ---
+# SO_TIMESTAMPNS makes the kernel attach each datagram's arrival time (CLOCK_REALTIME) as a control
+# message, so get_status can report when the command hit the NIC and how long it queued before
+# being handled, without the client/Pi clock skew of comparing wall clocks.
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35) # Linux value; also the SCM_TIMESTAMPNS cmsg type
+_TIMESPEC = struct.Struct("@ll") # struct timespec {time_t tv_sec; long tv_nsec}
+COMMAND_ANCBUF_SIZE = socket.CMSG_SPACE(_TIMESPEC.size)
+
+# --- Packet Priority ---
+OSC_SOCKET_TOS = 0xB8 # DSCP EF (expedited forwarding) << 2: priority queues on WMM Wi-Fi / QoS switches
+OSC_SOCKET_PRIORITY = 6 # SO_PRIORITY: highest value allowed without CAP_NET_ADMIN
+
+def set_socket_buffer(sock, option, force_option, size, label):
+    # Try the *BUFFORCE variant first (ignores the sysctl cap, needs CAP_NET_ADMIN), then the plain one
+    if sys.platform.startswith("linux"):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+            return
+        except OSError:
+            pass # EPERM without CAP_NET_ADMIN
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+    except OSError as e:
+        logging.warning(f"Could not set {label} on socket: {e}")
+        return
+    actual = sock.getsockopt(socket.SOL_SOCKET, option) // 2 # Linux reports double the usable size
+    if actual < size:
+        logging.warning(f"{label} is {actual} bytes (requested {size}). Raise the net.core sysctl limit.")
+
+
+# --- Sender Thread ---
+def pin_current_thread(cpu):
+    # Linux only; best effort so the script still runs elsewhere
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+            logging.info(f"{threading.current_thread().name} pinned to CPU {cpu}.")
+        except OSError as e:
+            logging.warning(f"Could not pin {threading.current_thread().name} to CPU {cpu}: {e}")
+
+# --- Real-Time Scheduling (opt-in: [System] EnableRealtimeScheduling) ---
+ENABLE_REALTIME_SCHEDULING = False
+LOOP_FIFO_PRIORITY = 20 # SCHED_FIFO priority for the main loop (needs root or CAP_SYS_NICE)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+def enable_realtime_scheduling(priority):
+    # Call from the thread itself, after other threads are started (new threads inherit the policy)
+    if hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logging.info(f"{threading.current_thread().name} running with SCHED_FIFO priority {priority}.")
+        except OSError as e:
+            logging.warning(f"Could not enable SCHED_FIFO (run as root or grant CAP_SYS_NICE): {e}")
+
+def lock_memory():
+    # Keep the process resident so the loop never stalls on a page fault (e.g. after swap-out)
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            err = ctypes.get_errno()
+            logging.warning(f"Could not lock memory (mlockall): {os.strerror(err)}")
+        else:
+            logging.info("Process memory locked (mlockall).")
+    except (OSError, AttributeError) as e:
+        logging.warning(f"mlockall unavailable: {e}")
+
+# --- OSC Bundles ---
+# "#bundle" + an "immediately" time tag, then each message prefixed with its int32 size (OSC 1.0)
+_BUNDLE_HDR = _osc_pad4(b"#bundle\x00") + struct.pack(">Q", 1)
+OSC_BUNDLE_SLOT_SIZE = len(_BUNDLE_HDR) + OSC_BUNDLE_MAX * (_INT32.size + OSC_SLOT_SIZE)
+
+def drain_bundles(sender, queue):
+    # Packs the queued messages OSC_BUNDLE_MAX at a time into bundles, all sent with one sendmmsg()
+    popleft = queue.popleft
+    pack_size = _INT32.pack
+    bundles = []
+    while queue and len(bundles) < sender.count:
+        parts = [_BUNDLE_HDR]
+        for _ in range(min(len(queue), OSC_BUNDLE_MAX)):
+            msg = popleft()
+            parts.append(pack_size(len(msg)))
+            parts.append(msg)
+        bundles.append(b"".join(parts))
+    return sender.send(*bundles)
+
+def osc_sender_thread(sender):
+    # At high target frequencies the main loop only queues its packets: this thread wakes once a
+    # full batch is waiting (or after OSC_BATCH_MAX_DELAY_S for a partial one; on every queued
+    # change with OscSendOnChange, so interactive changes aren't held back) and drains the queue
+    # OSC_BATCH_MAX packets per sendmmsg(), so the poll loop never pays for the kernel entry.
+    # With bundling on it wakes every OSC_BUNDLE_S instead and coalesces the messages into bundles.
+    global g_sent_packets
+    pin_current_thread(SENDER_CPU)
+    logging.info("OSC sender started.")
+    send_queue = g_send_queue
+    if OSC_BUNDLE_S > 0:
+        def drain(queue):
+            return drain_bundles(sender, queue)
+        max_delay_s = OSC_BUNDLE_S
+    else:
+        drain = sender.drain
+        max_delay_s = OSC_BATCH_MAX_DELAY_S
+    while True:
+        stopping = g_stop_command_listener.is_set()
+        g_send_ready.wait(max_delay_s)
+        g_send_ready.clear()
+        try:
+            while send_queue:
+                g_sent_packets += drain(send_queue)
+        except Exception as e:
+            logging.error(f"SENDER: Error sending OSC batch: {e}")
+        if stopping:
+            break # Final drain done
+    logging.info("OSC sender stopped.")
+
+
+# --- Absolute-Deadline Pacing ---
+# Sleeping for "period - time spent" drifts by the wake-up latency every cycle. The main loop instead
+# advances an absolute CLOCK_MONOTONIC deadline (the clock behind time.monotonic_ns() on Linux) and
+# sleeps until it with clock_nanosleep(TIMER_ABSTIME); time.sleep is the fallback elsewhere.
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+EINTR = 4
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_clock_nanosleep = None
+if sys.platform.startswith("linux"):
+    try:
+        _clock_nanosleep = ctypes.CDLL("libc.so.6", use_errno=True).clock_nanosleep
+        _clock_nanosleep.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+        _clock_nanosleep.restype = ctypes.c_int
+    except (OSError, AttributeError) as e:
+        logging.warning(f"clock_nanosleep unavailable ({e}), falling back to time.sleep().")
+_deadline_ts = _Timespec()
+
+def sleep_until_ns(deadline_ns):
+    # deadline_ns is a time.monotonic_ns() timestamp
+    if _clock_nanosleep is not None:
+        _deadline_ts.tv_sec, _deadline_ts.tv_nsec = divmod(deadline_ns, 1_000_000_000)
+        while _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, _deadline_ts, None) == EINTR:
+            pass # Interrupted by a signal: the deadline is absolute, so just retry
+        return
+    remaining_ns = deadline_ns - time.monotonic_ns()
+    if remaining_ns > 0:
+        time.sleep(remaining_ns / 1e9)
+
 
 # --- Configuration Loading ---
 def load_configuration():
     global HOST_IP_PC, HOST_PORT_PC, PI_COMMAND_PORT
-    global g_send_frequency_hz, g_enable_system_commands
+    global g_send_frequency_hz, g_enable_system_commands, OSC_BATCH_ABOVE_HZ
+    global OSC_SEND_ON_CHANGE, OSC_HEARTBEAT_S, SEESAW_READ_DELAY_S, OSC_FORMAT, OSC_BUNDLE_S, OSC_SEND_FROM_THREAD
+    global ENABLE_REALTIME_SCHEDULING, LOOP_FIFO_PRIORITY, INTERRUPT_GPIO, INTERRUPT_GPIO_CHIP
+    global IDLE_POLL_HZ, IDLE_AFTER_S
 
     config = configparser.ConfigParser()
     config_file_path = "config.ini"
@@ -103,12 +510,28 @@ def load_configuration():
         HOST_IP_PC = config.get("Network", "HostIPPC", fallback="127.0.0.1")
         HOST_PORT_PC = config.getint("Network", "HostPortPC", fallback=8000)
         PI_COMMAND_PORT = config.getint("Network", "PiCommandPort", fallback=8001)
+        OSC_BATCH_ABOVE_HZ = config.getfloat("Network", "OscBatchAboveHz", fallback=OSC_BATCH_ABOVE_HZ)
+        OSC_FORMAT = config.get("Network", "OscFormat", fallback=OSC_FORMAT).strip().lower()
+        if OSC_FORMAT not in ("separate", "combined"):
+            raise ValueError(f"OscFormat must be 'separate' or 'combined', got '{OSC_FORMAT}'")
+        OSC_SEND_FROM_THREAD = config.getboolean("Network", "OscSendFromThread", fallback=OSC_SEND_FROM_THREAD)
+        OSC_BUNDLE_S = config.getfloat("Network", "OscBundleMs", fallback=OSC_BUNDLE_S * 1000.0) / 1000.0
+        OSC_SEND_ON_CHANGE = config.getboolean("Network", "OscSendOnChange", fallback=OSC_SEND_ON_CHANGE)
+        OSC_HEARTBEAT_S = config.getfloat("Network", "OscHeartbeatS", fallback=OSC_HEARTBEAT_S)
 
         # Keep existing control: set_frequency modifies this at runtime
         g_send_frequency_hz = config.getfloat("Sensors", "InitialSendFrequencyHz", fallback=120.0)
+        IDLE_POLL_HZ = config.getfloat("Sensors", "IdlePollHz", fallback=IDLE_POLL_HZ)
+        IDLE_AFTER_S = config.getfloat("Sensors", "IdleAfterS", fallback=IDLE_AFTER_S)
+        INTERRUPT_GPIO = config.getint("Sensors", "InterruptGpio", fallback=INTERRUPT_GPIO)
+        INTERRUPT_GPIO_CHIP = config.get("Sensors", "InterruptGpioChip", fallback=INTERRUPT_GPIO_CHIP)
+        SEESAW_READ_DELAY_S = config.getfloat("Sensors", "SeesawReadDelayMs", fallback=SEESAW_READ_DELAY_S * 1000.0) / 1000.0
 
         g_enable_system_commands = config.getboolean("System", "EnableSystemCommands", fallback=False)
         logging.info(f"System commands (reboot/shutdown) enabled: {g_enable_system_commands}")
+        ENABLE_REALTIME_SCHEDULING = config.getboolean("System", "EnableRealtimeScheduling", fallback=False)
+        LOOP_FIFO_PRIORITY = config.getint("System", "RealtimePriority", fallback=LOOP_FIFO_PRIORITY)
+        logging.info(f"Real-time scheduling enabled: {ENABLE_REALTIME_SCHEDULING} (priority {LOOP_FIFO_PRIORITY})")
 
     except (configparser.Error) as e:
         logging.error(f"Error parsing configuration file '{config_file_path}': {e}. Exiting.")
@@ -121,6 +544,19 @@ def load_configuration():
     logging.info(f"  Target PC IP: {HOST_IP_PC}, Port: {HOST_PORT_PC}")
     logging.info(f"  Pi Command Port: {PI_COMMAND_PORT}")
     logging.info(f"  Poll/Send Frequency: {g_send_frequency_hz} Hz")
+    logging.info(f"  Seesaw read delay: {SEESAW_READ_DELAY_S * 1000.0:.2f} ms")
+    if IDLE_POLL_HZ > 0:
+        logging.info(f"  Idle poll: {IDLE_POLL_HZ} Hz after {IDLE_AFTER_S} s without change")
+    if INTERRUPT_GPIO >= 0:
+        logging.info(f"  Seesaw interrupt line: {INTERRUPT_GPIO_CHIP} line {INTERRUPT_GPIO}")
+    logging.info(f"  OSC format: {OSC_FORMAT}")
+    if OSC_BUNDLE_S > 0:
+        logging.info(f"  OSC bundles: up to {OSC_BUNDLE_MAX} messages every {OSC_BUNDLE_S * 1000.0:.1f} ms")
+    elif OSC_SEND_FROM_THREAD:
+        logging.info("  OSC sent from the sender thread at every frequency")
+    else:
+        logging.info(f"  Batched sending at or above: {OSC_BATCH_ABOVE_HZ} Hz")
+    logging.info(f"  Send on change only: {OSC_SEND_ON_CHANGE} (heartbeat every {OSC_HEARTBEAT_S} s)")
 
 
 # --- Rotary Encoder Initialization ---
@@ -151,8 +587,8 @@ def initialize_hardware_and_rotary():
 
     # Button on pin 24 with internal pullup
     try:
-        g_seesaw.pin_mode(24, g_seesaw.INPUT_PULLUP)
-        g_button = digitalio.DigitalIO(g_seesaw, 24)
+        g_seesaw.pin_mode(BUTTON_PIN, g_seesaw.INPUT_PULLUP)
+        g_button = digitalio.DigitalIO(g_seesaw, BUTTON_PIN)
     except Exception as e:
         logging.error(f"Error initializing rotary button: {e}")
         exit(1)
@@ -177,6 +613,77 @@ def initialize_hardware_and_rotary():
     logging.info("Rotary encoder initialized successfully (I2C direct, no TCA).")
 
 
+# --- Seesaw Interrupt Line (optional) ---
+# With the Seesaw INT pin (open drain, active low) wired to a Pi GPIO, the main loop sleeps in
+# select() until the encoder turns or the button changes, instead of reading the I2C bus every tick.
+# The encoder interrupt clears when its position is read; the GPIO one when its flags are read.
+class SeesawInterrupt:
+    def __init__(self, chip_path, line):
+        self.request = gpiod.request_lines(
+            chip_path,
+            consumer="timemachine",
+            config={line: gpiod.LineSettings(edge_detection=Edge.FALLING, bias=Bias.PULL_UP)},
+        )
+        self.selector = selectors.DefaultSelector() # epoll on Linux
+        self.selector.register(self.request.fd, selectors.EVENT_READ)
+        self.selector.register(g_stop_pipe_r, selectors.EVENT_READ) # Shutdown wakes the loop at once
+
+    def wait(self, timeout_s):
+        """Block until an INT edge or timeout_s. Returns True if the Seesaw signalled a change."""
+        for key, _ in self.selector.select(timeout_s):
+            if key.fd == self.request.fd:
+                self.request.read_edge_events() # Consume the queued edges
+                return True
+        return False
+
+    def close(self):
+        self.selector.close()
+        self.request.release()
+
+def enable_seesaw_interrupt():
+    # Returns a SeesawInterrupt, or None to keep polling
+    if INTERRUPT_GPIO < 0:
+        return None
+    if not OSC_SEND_ON_CHANGE:
+        # Every tick sends both values, so the loop has to run at the send frequency anyway
+        logging.warning("InterruptGpio needs OscSendOnChange = true: polling at the send frequency instead.")
+        return None
+    if gpiod is None:
+        logging.warning("InterruptGpio is set but the gpiod module (v2) is not installed: polling instead.")
+        return None
+    try:
+        g_seesaw.write(_SEESAW_GPIO_BASE, _SEESAW_GPIO_INTENSET, _UINT32.pack(BUTTON_MASK))
+        g_seesaw.enable_encoder_interrupt()
+        irq = SeesawInterrupt(INTERRUPT_GPIO_CHIP, INTERRUPT_GPIO)
+    except Exception as e:
+        logging.warning(f"Could not set up the Seesaw interrupt line: {e}. Polling instead.")
+        return None
+    logging.info(f"Waiting on Seesaw INT ({INTERRUPT_GPIO_CHIP} line {INTERRUPT_GPIO}) instead of polling.")
+    return irq
+
+def clear_seesaw_gpio_interrupt():
+    try:
+        g_seesaw.read(_SEESAW_GPIO_BASE, _SEESAW_GPIO_INTFLAG, _intflag_raw, delay=SEESAW_READ_DELAY_S)
+    except OSError as e:
+        note_i2c_error("clearing the Seesaw GPIO interrupt", e)
+
+
+# --- I2C Error Reporting ---
+# A loose wire can fail every tick: count every error but log at most one line per interval,
+# so a flaky bus doesn't also turn into a logging storm in the poll loop.
+I2C_ERROR_LOG_INTERVAL_S = 1.0
+g_i2c_errors = 0
+g_next_i2c_error_log = 0.0
+
+def note_i2c_error(what, e):
+    global g_i2c_errors, g_next_i2c_error_log
+    g_i2c_errors += 1
+    now = time.monotonic()
+    if now >= g_next_i2c_error_log:
+        g_next_i2c_error_log = now + I2C_ERROR_LOG_INTERVAL_S
+        logging.warning(f"I2C error {what}: {e}. Using last known value. ({g_i2c_errors} I2C errors so far)")
+
+
 # --- Rotary read (continuous) ---
 def read_rotary():
     """
@@ -189,114 +696,204 @@ def read_rotary():
     position = g_last_position
     button_pressed = g_last_button_pressed
 
-    try:
-        position = g_encoder.position
-        g_last_position = position
-    except OSError as e:
-        logging.warning(f"I2C error reading encoder position: {e}. Using last known value.")
-    except Exception as e:
-        logging.error(f"Unexpected error reading encoder position: {e}. Using last known value.")
+    # Raw register reads with a short turnaround instead of g_encoder.position / g_button.value.
+    # The encoder and GPIO live in different Seesaw modules, so they can't share one burst; both
+    # request/read pairs run under a single bus lock, with the request bytes prebuilt (what
+    # Seesaw.read() does, minus a lock/unlock and a bytearray per transfer).
+    delay = SEESAW_READ_DELAY_S
+    with g_seesaw.i2c_device as i2c:
+        try:
+            i2c.write(_ENCODER_REQ)
+            time.sleep(delay)
+            i2c.readinto(_pos_raw)
+            position = _INT32.unpack(_pos_raw)[0]
+            g_last_position = position
+        except OSError as e:
+            note_i2c_error("reading encoder position", e)
+        except Exception as e:
+            logging.error(f"Unexpected error reading encoder position: {e}. Using last known value.")
+
+        try:
+            i2c.write(_GPIO_REQ)
+            time.sleep(delay)
+            i2c.readinto(_gpio_raw)
+            button_pressed = 0 if _UINT32.unpack(_gpio_raw)[0] & BUTTON_MASK else 1  # pullup: high = not pressed
+            g_last_button_pressed = button_pressed
+        except OSError as e:
+            note_i2c_error("reading button", e)
+        except Exception as e:
+            logging.error(f"Unexpected error reading button: {e}. Using last known value.")
+
+    return position, button_pressed
+
 
+def run_system_command(argv):
+    # Exec the command directly (no /bin/sh in between) in its own session, without waiting:
+    # the ACK has already been sent and the listener keeps running until the system goes down.
     try:
-        button_pressed = 0 if g_button.value else 1
-        g_last_button_pressed = button_pressed
+        subprocess.Popen(argv, close_fds=True, start_new_session=True)
     except OSError as e:
-        logging.warning(f"I2C error reading button: {e}. Using last known value.")
-    except Exception as e:
-        logging.error(f"Unexpected error reading button: {e}. Using last known value.")
-
-    return int(position), int(button_pressed)
+        logging.error(f"COMMAND_LISTENER: Could not run {' '.join(argv)}: {e}")
+
+# --- Command Handlers ---
+# Each handler takes (command_json, addr, sock) and replies on sock. Dispatch is a dict lookup on the
+# "command" field, see CMD_HANDLERS below. Fixed replies are encoded once here.
+ACK_REBOOT = f"ACK: {CMD_REBOOT} initiated.".encode("utf-8")
+NACK_REBOOT_DISABLED = f"NACK: {CMD_REBOOT} disabled by configuration.".encode("utf-8")
+ACK_SHUTDOWN = f"ACK: {CMD_SHUTDOWN} initiated.".encode("utf-8")
+NACK_SHUTDOWN_DISABLED = f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode("utf-8")
+ACK_FREQUENCY_FMT = b"ACK: Frequency set to %r Hz" # %r of a float matches the f-string text
+NACK_INVALID_JSON = "NACK: Invalid JSON format".encode("utf-8")
+
+def handle_reboot(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
+        sock.sendto(ACK_REBOOT, addr)
+        run_system_command(["sudo", "reboot"])
+    else:
+        sock.sendto(NACK_REBOOT_DISABLED, addr)
+
+def handle_shutdown(command_json, addr, sock):
+    if g_enable_system_commands:
+        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
+        sock.sendto(ACK_SHUTDOWN, addr)
+        run_system_command(["sudo", "shutdown", "-h", "now"])
+    else:
+        sock.sendto(NACK_SHUTDOWN_DISABLED, addr)
+
+def handle_set_frequency(command_json, addr, sock):
+    global g_send_frequency_hz
+    new_freq_val = command_json.get("hz")
+    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
+        new_freq = float(new_freq_val)
+        g_send_frequency_hz = new_freq
+        logging.info(f"COMMAND_LISTENER: Send frequency set to: {new_freq} Hz")
+        sock.sendto(ACK_FREQUENCY_FMT % new_freq, addr)
+    else:
+        sock.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode("utf-8"), addr)
+
+# Status reply built once; only the live fields are updated per request (listener thread only)
+_STATUS_MSG = {
+    "status": "OK",
+    "send_frequency_hz": 0.0,
+    "initialized_devices": 0,
+    "device_type": "seesaw_rotary_encoder",
+    "last_position": 0,
+    "button_pressed": 0,
+    "command_rx_ns": 0,
+    "command_queue_us": 0.0,
+    "osc": {
+        "format": "separate",
+        "pos_address": OSC_POS_ADDRESS,
+        "btn_address": OSC_BTN_ADDRESS,
+        "rotary_address": OSC_ROTARY_ADDRESS
+    }
+}
+
+def handle_get_status(command_json, addr, sock):
+    _STATUS_MSG["send_frequency_hz"] = g_send_frequency_hz
+    _STATUS_MSG["initialized_devices"] = g_initialized_device_count
+    _STATUS_MSG["last_position"] = g_last_position
+    _STATUS_MSG["button_pressed"] = g_last_button_pressed
+    _STATUS_MSG["command_rx_ns"] = g_last_command_rx_ns
+    _STATUS_MSG["command_queue_us"] = g_last_command_queue_us
+    _STATUS_MSG["osc"]["format"] = OSC_FORMAT
+    sock.sendto(json_dumps(_STATUS_MSG), addr)
+
+def handle_unknown(command_json, addr, sock):
+    action = command_json.get("command")
+    sock.sendto(f"NACK: Unknown command '{action}'".encode("utf-8"), addr)
+
+CMD_HANDLERS = {
+    CMD_REBOOT: handle_reboot,
+    CMD_SHUTDOWN: handle_shutdown,
+    CMD_SET_FREQUENCY: handle_set_frequency,
+    CMD_GET_STATUS: handle_get_status,
+}
+
+
+# Byte-exact forms of the argument-less commands, as sent by the TouchDesigner monitoring polls:
+# these skip the JSON parser with one dict lookup. Anything else (spacing, extra keys, set_frequency)
+# goes through json_loads as before. The parsed dicts are shared, handlers must not modify them.
+_FAST_COMMANDS = {}
+for _cmd in (CMD_GET_STATUS, CMD_REBOOT, CMD_SHUTDOWN):
+    _FAST_COMMANDS[f'{{"command":"{_cmd}"}}'.encode("utf-8")] = {"command": _cmd}
+    _FAST_COMMANDS[f'{{"command": "{_cmd}"}}'.encode("utf-8")] = {"command": _cmd} # json.dumps() spacing
+del _cmd
 
 
 # --- UDP Command Listener Function (JSON control retained) ---
+def request_stop():
+    g_stop_command_listener.set()
+    os.write(g_stop_pipe_w, b"x")
+
 def command_listener():
-    global g_send_frequency_hz, g_enable_system_commands
+    global g_last_command_rx_ns, g_last_command_queue_us
 
     listener_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    set_socket_buffer(listener_socket, socket.SO_RCVBUF, SO_RCVBUFFORCE, COMMAND_SOCKET_RCVBUF, "SO_RCVBUF")
     try:
         listener_socket.bind(("", PI_COMMAND_PORT))
-        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT}")
+        logging.info(f"Command listener started on UDP port {PI_COMMAND_PORT} (JSON: {JSON_BACKEND})")
     except OSError as e:
         logging.error(f"COMMAND_LISTENER: Could not bind to command port {PI_COMMAND_PORT}: {e}. Thread exiting.")
         return
 
-    listener_socket.settimeout(1.0)
+    try:
+        listener_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError as e:
+        logging.warning(f"COMMAND_LISTENER: Receive timestamps unavailable: {e}")
+
+    # Block in select() on the socket and the stop pipe: no 1 s timeout wake-ups, instant shutdown
+    listener_socket.setblocking(False)
+    selector = selectors.DefaultSelector() # epoll on Linux
+    selector.register(listener_socket, selectors.EVENT_READ)
+    selector.register(g_stop_pipe_r, selectors.EVENT_READ)
 
     while not g_stop_command_listener.is_set():
         try:
-            data, addr = listener_socket.recvfrom(1024)
-            command_str = data.decode("utf-8")
-            logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_str}")
+            events = selector.select()
+            if not any(key.fileobj is listener_socket for key, _ in events):
+                continue # Woken by request_stop()
+            data, ancdata, _, addr = listener_socket.recvmsg(1024, COMMAND_ANCBUF_SIZE)
+            rx_ns = 0
+            for level, cmsg_type, cmsg_data in ancdata:
+                if level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMPNS and len(cmsg_data) >= _TIMESPEC.size:
+                    sec, nsec = _TIMESPEC.unpack_from(cmsg_data)
+                    rx_ns = sec * 1_000_000_000 + nsec
+            g_last_command_rx_ns = rx_ns
+            g_last_command_queue_us = (time.time_ns() - rx_ns) / 1000.0 if rx_ns else 0.0
 
             try:
-                command_json = json.loads(command_str)
+                command_json = _FAST_COMMANDS.get(data.strip())
+                if command_json is None:
+                    command_json = json_loads(data) # Parse the raw bytes: the text is only decoded to log bad input
+                logging.info(f"COMMAND_LISTENER: Received command from {addr}: {command_json}")
                 action = command_json.get("command")
+                CMD_HANDLERS.get(action, handle_unknown)(command_json, addr, listener_socket)
 
-                if action == CMD_REBOOT:
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing REBOOT command.")
-                        listener_socket.sendto(f"ACK: {CMD_REBOOT} initiated.".encode("utf-8"), addr)
-                        os.system("sudo reboot")
-                    else:
-                        listener_socket.sendto(f"NACK: {CMD_REBOOT} disabled by configuration.".encode("utf-8"), addr)
-
-                elif action == CMD_SHUTDOWN:
-                    if g_enable_system_commands:
-                        logging.warning("COMMAND_LISTENER: Executing SHUTDOWN command.")
-                        listener_socket.sendto(f"ACK: {CMD_SHUTDOWN} initiated.".encode("utf-8"), addr)
-                        os.system("sudo shutdown -h now")
-                    else:
-                        listener_socket.sendto(f"NACK: {CMD_SHUTDOWN} disabled by configuration.".encode("utf-8"), addr)
-
-                elif action == CMD_SET_FREQUENCY:
-                    new_freq_val = command_json.get("hz")
-                    if isinstance(new_freq_val, (int, float)) and new_freq_val >= 0:
-                        with g_frequency_lock:
-                            g_send_frequency_hz = float(new_freq_val)
-                        logging.info(f"COMMAND_LISTENER: Send frequency set to: {g_send_frequency_hz} Hz")
-                        listener_socket.sendto(f"ACK: Frequency set to {g_send_frequency_hz} Hz".encode("utf-8"), addr)
-                    else:
-                        listener_socket.sendto(f"NACK: Invalid frequency value '{new_freq_val}'".encode("utf-8"), addr)
-
-                elif action == CMD_GET_STATUS:
-                    with g_frequency_lock:
-                        current_freq = g_send_frequency_hz
-                    status_msg = {
-                        "status": "OK",
-                        "send_frequency_hz": current_freq,
-                        "initialized_devices": g_initialized_device_count,
-                        "device_type": "seesaw_rotary_encoder",
-                        "last_position": g_last_position,
-                        "button_pressed": g_last_button_pressed,
-                        "osc": {
-                            "pos_address": "/rotary/pos",
-                            "btn_address": "/rotary/btn"
-                        }
-                    }
-                    listener_socket.sendto(json.dumps(status_msg).encode("utf-8"), addr)
-
-                else:
-                    listener_socket.sendto(f"NACK: Unknown command '{action}'".encode("utf-8"), addr)
-
-            except json.JSONDecodeError:
-                listener_socket.sendto("NACK: Invalid JSON format".encode("utf-8"), addr)
+            except JSONDecodeError:
+                logging.error(f"COMMAND_LISTENER: Invalid JSON received from {addr}: {data.decode('utf-8', 'replace')}")
+                listener_socket.sendto(NACK_INVALID_JSON, addr)
             except Exception as e:
                 logging.error(f"COMMAND_LISTENER: Error processing command from {addr}: {e}")
                 listener_socket.sendto(f"NACK: Error processing command - {e}".encode("utf-8"), addr)
 
-        except socket.timeout:
-            continue
+        except BlockingIOError:
+            continue # Readiness without a datagram (e.g. dropped on checksum error)
         except Exception as e:
             logging.error(f"COMMAND_LISTENER: Unexpected error in listener loop: {e}")
             time.sleep(0.1)
 
+    selector.close()
     listener_socket.close()
     logging.info("Command listener stopped.")
 
 
 # --- Main Application ---
 def main():
+    global g_dropped_packets
     load_configuration()
     initialize_hardware_and_rotary()
 
@@ -306,54 +903,209 @@ def main():
 
     # UDP socket for OSC output
     osc_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    logging.info(f"Sending OSC to {HOST_IP_PC}:{HOST_PORT_PC}  (/rotary/pos, /rotary/btn)")
+    set_socket_buffer(osc_socket, socket.SO_SNDBUF, SO_SNDBUFFORCE, OSC_SOCKET_SNDBUF, "SO_SNDBUF")
+    try:
+        osc_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, OSC_SOCKET_TOS)
+        if hasattr(socket, "SO_PRIORITY"):
+            osc_socket.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, OSC_SOCKET_PRIORITY)
+    except OSError as e:
+        logging.warning(f"Could not set packet priority on OSC socket: {e}")
+    # The destination is fixed: connect once so each send skips the address copy and route lookup
+    osc_dest = None
+    try:
+        osc_socket.connect((HOST_IP_PC, HOST_PORT_PC))
+    except OSError as e:
+        logging.warning(f"Could not connect OSC socket ({e}), sending with sendto().")
+        osc_dest = (HOST_IP_PC, HOST_PORT_PC)
+    osc_sender = OscSender(osc_socket, osc_dest, 2) # pos + btn in one syscall
+    # High-rate path: separate slots, owned by the sender thread
+    if OSC_BUNDLE_S > 0:
+        batch_sender = OscSender(osc_socket, osc_dest, OSC_BATCH_MAX, OSC_BUNDLE_SLOT_SIZE)
+    else:
+        batch_sender = OscSender(osc_socket, osc_dest, OSC_BATCH_MAX)
+    sender_thread = threading.Thread(target=osc_sender_thread, args=(batch_sender,), name="SenderThread", daemon=True)
+    sender_thread.start()
+
+    # The main loop polls and paces: with real-time scheduling on, nothing else preempts it
+    if ENABLE_REALTIME_SCHEDULING:
+        lock_memory()
+        enable_realtime_scheduling(LOOP_FIFO_PRIORITY)
+    combined = OSC_FORMAT == "combined"
+    if combined:
+        logging.info(f"Sending OSC to {HOST_IP_PC}:{HOST_PORT_PC}  ({OSC_ROTARY_ADDRESS} position button)")
+    else:
+        logging.info(f"Sending OSC to {HOST_IP_PC}:{HOST_PORT_PC}  ({OSC_POS_ADDRESS}, {OSC_BTN_ADDRESS})")
+
+    irq = enable_seesaw_interrupt()
 
     packet_count = 0
     start_time = time.monotonic()
+    next_deadline_ns = time.monotonic_ns()
+    last_target_freq = None
+    next_log_count = 1 # Batched counts arrive in jumps: log on crossing the interval, not on exact multiples
+    last_pos = last_btn = None # Last values actually sent (None forces the first send)
+    next_heartbeat = start_time
+    send_on_change = OSC_SEND_ON_CHANGE
+    heartbeat_s = OSC_HEARTBEAT_S
+    # Hot-loop references bound once as locals (LOAD_FAST instead of global + attribute lookups)
+    monotonic = time.monotonic
+    monotonic_ns = time.monotonic_ns
+    stop_requested = g_stop_command_listener.is_set
+    read = read_rotary
+    send = osc_sender.send
+    send_queue = g_send_queue
+    enqueue = g_send_queue.append
+    queue_max = OSC_SEND_QUEUE_MAX
+    send_ready = g_send_ready.set
+    # Queued messages that wake the sender early (1: hand over every tick, no batching delay).
+    # With send on change, a queued message is a knob movement (or a heartbeat): wake the sender at
+    # once instead of holding it for a full batch, it still drains whatever has piled up per sendmmsg().
+    if OSC_BUNDLE_S > 0:
+        flush_at = OSC_BUNDLE_MAX
+    elif OSC_SEND_FROM_THREAD or send_on_change:
+        flush_at = 1
+    else:
+        flush_at = OSC_BATCH_MAX
+    pack_int_into = _INT32.pack_into
+    pos_buf, pos_buf_mv, pos_off = _POS_BUF, _POS_BUF_MV, len(_POS_HDR)
+    btn_msgs = _BTN_MSGS
+    pos_hdr = _POS_HDR
+    pack_pos_msg = _POS_MSG.pack
+    pack_rotary_msg = _ROTARY_MSG.pack
+    pack_pair_into = _INT32_PAIR.pack_into
+    rotary_buf, rotary_buf_mv, rotary_off = _ROTARY_BUF, _ROTARY_BUF_MV, len(_ROTARY_HDR)
+    rotary_hdr = _ROTARY_HDR
+    sleep_until = sleep_until_ns
+    wait_irq = irq.wait if irq is not None else None
+    clear_gpio_irq = clear_seesaw_gpio_interrupt
+    idle_poll_hz = IDLE_POLL_HZ if irq is None else 0.0 # The interrupt line already idles the loop
+    idle_after_s = IDLE_AFTER_S
+    last_change_time = start_time
+    unsent = False # A value changed but its datagram was dropped: retry next tick without waiting on INT
 
     try:
-        while not g_stop_command_listener.is_set():
-            with g_frequency_lock:
-                current_target_freq = g_send_frequency_hz
-
-            desired_delay_s = (1.0 / current_target_freq) if current_target_freq > 0 else 0.0
-            loop_start_time = time.monotonic()
-
-            # Read hardware (continuous polling)
-            position, button_pressed = read_rotary()
+        while not stop_requested():
+            # A new frequency being picked up one tick late is harmless
+            current_target_freq = g_send_frequency_hz
+
+            if current_target_freq != last_target_freq:
+                # Frequency changed (or first tick): recompute the period and restart the schedule from now
+                period_ns = int(1e9 / current_target_freq) if current_target_freq > 0 else 0
+                # Slower period while the knob is still (only if it is actually slower than the target)
+                if idle_poll_hz > 0 and (current_target_freq <= 0 or idle_poll_hz < current_target_freq):
+                    idle_period_ns = int(1e9 / idle_poll_hz)
+                else:
+                    idle_period_ns = 0
+                next_deadline_ns = monotonic_ns()
+                last_target_freq = current_target_freq
+                batching = OSC_BUNDLE_S > 0 or OSC_SEND_FROM_THREAD or current_target_freq <= 0 or current_target_freq >= OSC_BATCH_ABOVE_HZ
+                # Logging roughly every 5s (*2 because we send 2 packets/loop)
+                log_every = max(int(current_target_freq * 5) * 2, 1) if current_target_freq > 0 else 400
+
+            if wait_irq is not None and not unsent:
+                # Sleep until the Seesaw flags a change; wake anyway in time for the heartbeat
+                if wait_irq(max(0.0, next_heartbeat - monotonic())):
+                    clear_gpio_irq()
+                if stop_requested():
+                    break
+            # One clock read at the top and one after the send per tick (same CLOCK_MONOTONIC as
+            # time.monotonic(), so the seconds value compares with the heartbeat/idle timestamps)
+            loop_start_ns = monotonic_ns()
+            loop_start_time = loop_start_ns * 1e-9
+
+            # Read hardware (continuous polling, or once per interrupt)
+            position, button_pressed = read()
+
+            if position != last_pos or button_pressed != last_btn:
+                last_change_time = loop_start_time
+
+            # Only channels whose value changed are sent; the heartbeat re-sends both
+            send_pos = send_btn = True
+            if send_on_change:
+                if loop_start_time >= next_heartbeat:
+                    next_heartbeat = loop_start_time + heartbeat_s
+                else:
+                    send_pos = position != last_pos
+                    send_btn = button_pressed != last_btn
 
-            # Build & send two OSC messages (2 channels)
+            # Build & send the OSC messages (2 channels). A value only counts as sent (last_pos /
+            # last_btn) once its datagram went out: one dropped by MSG_DONTWAIT is resent next tick.
             try:
-                msg_pos = osc_message("/rotary/pos", "i", position)
-                msg_btn = osc_message("/rotary/btn", "i", button_pressed)
-
-                osc_socket.sendto(msg_pos, (HOST_IP_PC, HOST_PORT_PC))
-                osc_socket.sendto(msg_btn, (HOST_IP_PC, HOST_PORT_PC))
-                packet_count += 2  # two OSC packets per loop
+                if combined:
+                    if send_pos or send_btn:
+                        if batching:
+                            if len(send_queue) == queue_max:
+                                g_dropped_packets += 1 # Sender is behind: the deque drops the oldest packet
+                            enqueue(pack_rotary_msg(rotary_hdr, position, button_pressed))
+                            if len(send_queue) >= flush_at:
+                                send_ready()
+                            sent = 1
+                        else:
+                            pack_pair_into(rotary_buf, rotary_off, position, button_pressed)
+                            sent = send(rotary_buf_mv)
+                            packet_count += sent
+                        if sent:
+                            last_pos = position
+                            last_btn = button_pressed
+                elif batching:
+                    if send_pos:
+                        if len(send_queue) == queue_max:
+                            g_dropped_packets += 1
+                        enqueue(pack_pos_msg(pos_hdr, position))
+                        last_pos = position
+                    if send_btn:
+                        if len(send_queue) == queue_max:
+                            g_dropped_packets += 1
+                        enqueue(btn_msgs[button_pressed])
+                        last_btn = button_pressed
+                    if len(send_queue) >= flush_at:
+                        send_ready()
+                elif send_pos and send_btn:
+                    pack_int_into(pos_buf, pos_off, position)
+                    sent = send(pos_buf_mv, btn_msgs[button_pressed])  # two OSC packets in one call
+                    packet_count += sent
+                    if sent >= 1: # sendmmsg() sends in order: a partial send delivered the position only
+                        last_pos = position
+                    if sent == 2:
+                        last_btn = button_pressed
+                elif send_pos:
+                    pack_int_into(pos_buf, pos_off, position)
+                    sent = send(pos_buf_mv)
+                    packet_count += sent
+                    if sent:
+                        last_pos = position
+                elif send_btn:
+                    sent = send(btn_msgs[button_pressed])
+                    packet_count += sent
+                    if sent:
+                        last_btn = button_pressed
             except Exception as e:
                 logging.error(f"MAIN_LOOP: Error sending OSC: {e}")
-
-            loop_time_taken = time.monotonic() - loop_start_time
-
-            if desired_delay_s > 0:
-                sleep_duration = desired_delay_s - loop_time_taken
-                if sleep_duration > 0:
-                    time.sleep(sleep_duration)
-
-            # Logging roughly every 5s
-            if current_target_freq > 0:
-                log_every = int(current_target_freq * 5) * 2  # *2 because we send 2 packets/loop
-            else:
-                log_every = 400
-
-            if packet_count > 0 and (packet_count % max(log_every, 1) == 0):
-                current_run_time = time.monotonic() - start_time
+            unsent = position != last_pos or button_pressed != last_btn
+
+            now_ns = monotonic_ns()
+            loop_time_ns = now_ns - loop_start_ns
+
+            tick_ns = period_ns
+            if idle_period_ns and loop_start_time - last_change_time > idle_after_s:
+                tick_ns = idle_period_ns # Idle: poll slowly; the first change switches back to full rate
+            if tick_ns:
+                next_deadline_ns += tick_ns
+                if next_deadline_ns < now_ns - tick_ns:
+                    next_deadline_ns = now_ns # More than a full period late: skip the missed ticks instead of bursting
+                sleep_until(next_deadline_ns)
+
+            sent_total = packet_count + g_sent_packets # Inline sends + sender thread
+            if sent_total >= next_log_count:
+                next_log_count = sent_total + log_every
+                current_run_time = now_ns * 1e-9 - start_time
                 if current_run_time > 0:
-                    actual_pkt_rate = packet_count / current_run_time
+                    actual_pkt_rate = sent_total / current_run_time
                     freq_target_str = f"{current_target_freq:.1f} Hz" if current_target_freq > 0 else "Max"
                     logging.info(
-                        f"Sent {packet_count} OSC packets. Avg pkt rate: {actual_pkt_rate:.2f} pkt/s "
-                        f"(Target loop: {freq_target_str}). Last loop: {loop_time_taken*1000:.3f} ms"
+                        f"Sent {sent_total} OSC packets. Avg pkt rate: {actual_pkt_rate:.2f} pkt/s "
+                        f"(Target loop: {freq_target_str}). Last loop: {loop_time_ns / 1e6:.3f} ms. "
+                        f"Dropped: {osc_sender.dropped + batch_sender.dropped + g_dropped_packets}"
                     )
 
     except KeyboardInterrupt:
@@ -362,17 +1114,27 @@ def main():
         logging.error("MAIN_LOOP: Unhandled exception occurred:", exc_info=True)
     finally:
         logging.info("MAIN_LOOP: Stopping command listener thread...")
-        g_stop_command_listener.set()
+        request_stop()
 
         if command_thread.is_alive():
             command_thread.join(timeout=2.0)
 
+        g_send_ready.set() # Wake the sender for its final drain
+        sender_thread.join(timeout=2.0)
+        if sender_thread.is_alive():
+            logging.warning("MAIN_LOOP: Sender thread did not terminate gracefully.")
+
+        if irq is not None:
+            irq.close()
+
         logging.info("MAIN_LOOP: Closing OSC UDP socket.")
         osc_socket.close()
 
         current_run_time = time.monotonic() - start_time
+        packet_count += g_sent_packets
         if current_run_time > 0 and packet_count > 0:
-            logging.info(f"Total OSC packets sent: {packet_count}")
+            logging.info(f"Total OSC packets sent: {packet_count} (dropped: {osc_sender.dropped + batch_sender.dropped + g_dropped_packets})")
+            logging.info(f"Total I2C errors: {g_i2c_errors}")
             logging.info(f"Total runtime: {current_run_time:.2f} seconds")
             logging.info(f"Average packet rate: {packet_count/current_run_time:.2f} pkt/s")
         logging.info("Application finished.")